@@ -0,0 +1,196 @@
+# adif/exporters
+#
+# ADIF (.adi, ADX) and Cabrillo writers.
+# They read QSOs through QuerySet.iterator() (a server-side cursor on Postgres)
+# and yield text in blocks of records, so a log is never held in memory as a whole.
+#
+import datetime
+import re
+from typing import Iterator
+from xml.sax.saxutils import escape, quoteattr
+
+from django.db.models import QuerySet
+
+CHUNK_SIZE = 2000
+PROGRAM_ID = 'LFLog'
+ADIF_VERSION = '3.1.4'
+
+# QSO columns read for the export, and the ADIF field each one becomes
+EXPORT_COLUMNS = (
+    'call', 'qso_datetime', 'qso_datetime_off', 'band', 'mode', 'submode', 'freq', 'rst_sent', 'rst_rcvd',
+    'gridsquare', 'name', 'qth', 'comment', 'contest_id', 'stx_string', 'srx_string',
+    'dxcc', 'country', 'cqz', 'cont', 'extra', 'station__callsign', 'station__locator',
+)
+# ADIF fields written from QSO columns (or read into them on import): extra values under these names are not repeated
+COLUMN_FIELDS = frozenset((
+    'CALL', 'QSO_DATE', 'TIME_ON', 'QSO_DATE_OFF', 'TIME_OFF', 'BAND', 'MODE', 'SUBMODE', 'FREQ', 'RST_SENT',
+    'RST_RCVD', 'GRIDSQUARE', 'NAME', 'QTH', 'COMMENT', 'CONTEST_ID', 'STX', 'STX_STRING', 'SRX', 'SRX_STRING',
+    'DXCC', 'COUNTRY', 'CQZ', 'CONT', 'STATION_CALLSIGN', 'MY_GRIDSQUARE',
+))
+# Field names usable as ADX element names (ASCII XML names, not starting with "xml")
+ADX_NAME = re.compile(r'(?!XML)[A-Z_][A-Z0-9_.-]*')
+
+# Cabrillo mode categories
+CABRILLO_MODES = {'CW': 'CW', 'SSB': 'PH', 'USB': 'PH', 'LSB': 'PH', 'AM': 'PH', 'FM': 'FM', 'RTTY': 'RY'}
+# Above 30 MHz Cabrillo uses a band designator instead of the frequency
+CABRILLO_VHF_BANDS = {
+    '6m': '50', '4m': '70', '2m': '144', '1.25m': '222', '70cm': '432', '33cm': '902', '23cm': '1.2G',
+    '13cm': '2.3G', '9cm': '3.4G', '6cm': '5.7G', '3cm': '10G', '1.25cm': '24G', '6mm': '47G', '4mm': '75G',
+    '2.5mm': '122G', '2mm': '134G', '1mm': '241G',
+}
+
+
+def _adif_fields(row: tuple) -> list:
+    """
+    (ADIF name, value) pairs of one values_list() row, skipping empty values
+    and extra values of fields that have a column
+
+    :param row: tuple in EXPORT_COLUMNS order
+    :return: list of tuples
+    """
+    (call, qso_datetime, qso_datetime_off, band, mode, submode, freq, rst_sent, rst_rcvd, gridsquare, name, qth,
+     comment, contest_id, stx_string, srx_string, dxcc, country, cqz, cont, extra, station_callsign,
+     my_gridsquare) = row
+    fields = [
+        ('CALL', call),
+        ('QSO_DATE', f'{qso_datetime:%Y%m%d}'),
+        ('TIME_ON', f'{qso_datetime:%H%M%S}'),
+    ]
+    if qso_datetime_off:
+        fields += [('QSO_DATE_OFF', f'{qso_datetime_off:%Y%m%d}'), ('TIME_OFF', f'{qso_datetime_off:%H%M%S}')]
+    fields += [
+        ('BAND', band), ('MODE', mode), ('SUBMODE', submode), ('FREQ', f'{freq:.6f}' if freq else ''),
+        ('RST_SENT', rst_sent), ('RST_RCVD', rst_rcvd), ('GRIDSQUARE', gridsquare), ('NAME', name), ('QTH', qth),
+        ('COMMENT', comment), ('CONTEST_ID', contest_id), ('STX_STRING', stx_string), ('SRX_STRING', srx_string),
+        ('DXCC', '' if dxcc is None else str(dxcc)), ('COUNTRY', country), ('CQZ', '' if cqz is None else str(cqz)),
+        ('CONT', cont), ('STATION_CALLSIGN', station_callsign), ('MY_GRIDSQUARE', my_gridsquare),
+    ]
+    for key, value in extra.items():
+        key = key.upper()
+        if key not in COLUMN_FIELDS:
+            fields.append((key, str(value)))
+    return [(key, value) for key, value in fields if value]
+
+
+def _rows(queryset: QuerySet, chunk_size: int) -> Iterator[tuple]:
+    """
+    Plain tuples straight from the cursor: no model instances are built
+
+    :param queryset: QSOs
+    :param chunk_size: rows fetched per round trip
+    :return: iterator of tuples in EXPORT_COLUMNS order
+    """
+    return queryset.values_list(*EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+
+
+def _blocks(lines: Iterator[str], size: int) -> Iterator[str]:
+    """
+    Joins lines in blocks, so the response is written in a few large pieces
+
+    :param lines: text pieces
+    :param size: pieces per block
+    :return: iterator of str
+    """
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= size:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+def _adi_field(name: str, value: str) -> str:
+    """
+    <NAME:LENGTH>value, the length counted in bytes like the parser expects
+
+    :param name: ADIF field name
+    :param value: data
+    :return: str
+    """
+    length = len(value) if value.isascii() else len(value.encode('utf8'))
+    return f'<{name}:{length}>{value}'
+
+
+def iter_adi(queryset: QuerySet, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    ADI export, one block of records at a time
+
+    :param queryset: QSOs to export
+    :param chunk_size: rows per cursor fetch and records per yielded block
+    :return: iterator of str
+    """
+    created = datetime.datetime.now(datetime.timezone.utc)
+    yield (f'{PROGRAM_ID} ADIF export\n{_adi_field("ADIF_VER", ADIF_VERSION)} {_adi_field("PROGRAMID", PROGRAM_ID)} '
+           f'{_adi_field("CREATED_TIMESTAMP", f"{created:%Y%m%d %H%M%S}")}\n<EOH>\n')
+    records = (' '.join(_adi_field(name, value) for name, value in _adif_fields(row)) + ' <EOR>\n'
+               for row in _rows(queryset, chunk_size))
+    yield from _blocks(records, chunk_size)
+
+
+def _adx_element(name: str, value: str) -> str:
+    """
+    One ADX field; APP_<PROGRAMID>_<FIELD> fields become APP elements
+
+    :param name: ADIF field name
+    :param value: data
+    :return: XML
+    """
+    if name.startswith('APP_'):
+        program_id, _, field_name = name[4:].partition('_')
+        return (f'<APP PROGRAMID={quoteattr(program_id)} FIELDNAME={quoteattr(field_name)} TYPE="S">'
+                f'{escape(value)}</APP>')
+    return f'<{name}>{escape(value)}</{name}>'
+
+
+def iter_adx(queryset: QuerySet, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    ADX (XML) export, one block of records at a time.
+    Extra fields whose name is not a valid XML element name are left out
+
+    :param queryset: QSOs to export
+    :param chunk_size: rows per cursor fetch and records per yielded block
+    :return: iterator of str
+    """
+    created = datetime.datetime.now(datetime.timezone.utc)
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n<ADX>\n<HEADER>'
+           f'<ADIF_VER>{ADIF_VERSION}</ADIF_VER><PROGRAMID>{PROGRAM_ID}</PROGRAMID>'
+           f'<CREATED_TIMESTAMP>{created:%Y%m%d %H%M%S}</CREATED_TIMESTAMP></HEADER>\n<RECORDS>\n')
+    records = ('<RECORD>' + ''.join(_adx_element(name, value) for name, value in _adif_fields(row)
+                                    if ADX_NAME.fullmatch(name)) + '</RECORD>\n'
+               for row in _rows(queryset, chunk_size))
+    yield from _blocks(records, chunk_size)
+    yield '</RECORDS>\n</ADX>\n'
+
+
+def _cabrillo_qso(row: tuple) -> str:
+    """
+    QSO: line of a Cabrillo 3.0 log
+
+    :param row: tuple in EXPORT_COLUMNS order
+    :return: str
+    """
+    (call, qso_datetime, _off, band, mode, _submode, freq, rst_sent, rst_rcvd, _grid, _name, _qth, _comment,
+     _contest, stx_string, srx_string, *_rest, station_callsign, _locator) = row
+    frequency = CABRILLO_VHF_BANDS.get(band) or (f'{freq * 1000:.0f}' if freq else band)
+    sent = ' '.join(part for part in (rst_sent, stx_string) if part)
+    received = ' '.join(part for part in (rst_rcvd, srx_string) if part)
+    return (f'QSO: {frequency:>5} {CABRILLO_MODES.get(mode, "DG")} {qso_datetime:%Y-%m-%d %H%M} '
+            f'{station_callsign:<13} {sent:<10} {call:<13} {received}\n')
+
+
+def iter_cabrillo(queryset: QuerySet, station, contest: str = '', chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Cabrillo 3.0 export, one block of QSO: lines at a time
+
+    :param queryset: QSOs to export
+    :param station: MyStation the log belongs to
+    :param contest: CONTEST: header value
+    :param chunk_size: rows per cursor fetch and lines per yielded block
+    :return: iterator of str
+    """
+    yield (f'START-OF-LOG: 3.0\nCREATED-BY: {PROGRAM_ID}\nCALLSIGN: {station.callsign}\nCONTEST: {contest}\n'
+           f'GRID-LOCATOR: {station.locator}\nNAME: {station.name}\n')
+    yield from _blocks((_cabrillo_qso(row) for row in _rows(queryset, chunk_size)), chunk_size)
+    yield 'END-OF-LOG:\n'
@@ -0,0 +1,297 @@
+# adif/importer
+#
+# Bulk ADIF import: parse, normalise, resolve DXCC, write in chunks
+#
+import contextlib
+import datetime
+import os
+import time
+from typing import BinaryIO, Iterable, NamedTuple
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from clublog.resolver import get_resolver
+from tools.bulk import BATCH_SIZE, can_copy, copy_rows, insert_ignoring_conflicts
+
+from .bands import band_for_frequency
+from .models import QSO
+from .parser import ADIFReader
+
+# ADIF fields with a column of their own; the rest goes to QSO.extra
+KNOWN_FIELDS = frozenset((
+    'call', 'qso_date', 'time_on', 'qso_date_off', 'time_off', 'band', 'mode', 'submode', 'freq',
+    'rst_sent', 'rst_rcvd', 'gridsquare', 'name', 'qth', 'comment', 'contest_id',
+    'stx', 'stx_string', 'srx', 'srx_string', 'dxcc', 'country', 'cqz', 'cont',
+))
+# Columns written on import, in COPY order
+COLUMNS = (
+    'station', 'call', 'qso_datetime', 'qso_datetime_off', 'band', 'mode', 'submode', 'freq',
+    'rst_sent', 'rst_rcvd', 'gridsquare', 'name', 'qth', 'comment', 'contest_id', 'stx_string', 'srx_string',
+    'dxcc', 'country', 'cqz', 'cont', 'extra', 'created_on', 'updated_on',
+)
+# Longest value each text column takes. Longer calls, bands and modes make the record invalid
+# (they identify the QSO); the other values are cut, so one odd field cannot abort a whole import
+MAX_LENGTHS = {field.name: field.max_length for field in QSO._meta.concrete_fields if field.max_length}
+IDENTIFYING_FIELDS = ('call', 'band', 'mode')
+
+
+class ImportResult(NamedTuple):
+    """
+    What an import did
+    """
+    records: int
+    imported: int
+    duplicates: int
+    invalid: int
+    seconds: float
+
+
+def adif_datetime(date: str, time_on: str) -> datetime.datetime | None:
+    """
+    ADIF date (YYYYMMDD) and time (HHMM or HHMMSS) to an aware UTC datetime
+
+    :param date: QSO_DATE
+    :param time_on: TIME_ON
+    :return: datetime or None if missing or malformed
+    """
+    if not date or not time_on:
+        return None
+    date = date.strip()
+    time_on = time_on.strip().ljust(6, '0')
+    try:
+        return datetime.datetime(int(date[:4]), int(date[4:6]), int(date[6:8]),
+                                 int(time_on[:2]), int(time_on[2:4]), int(time_on[4:6]), tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+
+def _number(value: str, kind: type = float):
+    """
+    Lenient number conversion
+
+    :param value: text or None
+    :param kind: int or float
+    :return: number or None
+    """
+    if not value:
+        return None
+    try:
+        return kind(value.strip())
+    except ValueError:
+        return None
+
+
+def normalise_record(record: dict) -> dict | None:
+    """
+    Turns a parsed ADIF record into QSO field values (without station and DXCC resolution).
+    Plain values only, so the result can cross process boundaries
+
+    :param record: dict from the parser, lowercase field names
+    :return: dict of QSO fields, or None when call, date/time, band or mode are missing or too long
+    """
+    get = record.get
+    call = get('call', '').strip().upper()
+    qso_datetime = adif_datetime(get('qso_date'), get('time_on'))
+    if not call or qso_datetime is None:
+        return None
+    freq = _number(get('freq'))
+    band = get('band', '').strip().lower() or (band_for_frequency(freq) if freq else '')
+    mode = get('mode', '').strip().upper()
+    if not band or not mode:
+        return None
+    qso = {
+        'call': call,
+        'qso_datetime': qso_datetime,
+        'qso_datetime_off': adif_datetime(get('qso_date_off') or get('qso_date'), get('time_off')),
+        'band': band,
+        'mode': mode,
+        'submode': get('submode', '').strip().upper(),
+        'freq': freq,
+        'rst_sent': get('rst_sent', '').strip(),
+        'rst_rcvd': get('rst_rcvd', '').strip(),
+        'gridsquare': get('gridsquare', '').strip(),
+        'name': get('name', '').strip(),
+        'qth': get('qth', '').strip(),
+        'comment': get('comment', '').strip(),
+        'contest_id': get('contest_id', '').strip().upper(),
+        'stx_string': (get('stx_string') or get('stx') or '').strip(),
+        'srx_string': (get('srx_string') or get('srx') or '').strip(),
+        'dxcc': _number(get('dxcc'), int),
+        'country': get('country', '').strip(),
+        'cqz': _number(get('cqz'), int),
+        'cont': get('cont', '').strip().upper(),
+        'extra': {name: value for name, value in record.items() if name not in KNOWN_FIELDS},
+    }
+    for name in IDENTIFYING_FIELDS:
+        if len(qso[name]) > MAX_LENGTHS[name]:
+            return None
+    for name, max_length in MAX_LENGTHS.items():
+        value = qso.get(name)
+        if isinstance(value, str) and len(value) > max_length:
+            qso[name] = value[:max_length]
+    return qso
+
+
+class QSOWriter:
+    """
+    Resolves DXCC / zone / continent from the ClubLog data and writes QSOs
+    in batch_size chunks. Duplicates (station, call, band, mode, date), inside the input
+    or already stored, are left to the unique constraint: nothing is remembered between batches
+    """
+
+    def __init__(self, station, batch_size: int = BATCH_SIZE, use_copy: bool = False) -> None:
+        """
+        :param station: MyStation the QSOs belong to
+        :param batch_size: rows per bulk_create / COPY
+        :param use_copy: use COPY through a staging table on Postgres
+        """
+        self.station = station
+        self.batch_size = batch_size
+        self.use_copy = use_copy and can_copy()
+        self.resolver = get_resolver()
+        self.batch = []
+        self.records = 0
+        # Rows the database took, as reported by the INSERTs
+        self.imported = 0
+        self.staging = None
+
+    @property
+    def duplicates(self) -> int:
+        """
+        Written QSOs the unique constraint turned away
+
+        :return: count, pending ones excluded
+        """
+        return self.records - len(self.batch) - self.imported
+
+    def add(self, qso: dict) -> None:
+        """
+        Queues one normalised QSO
+
+        :param qso: dict from normalise_record()
+        :return:
+        """
+        self.records += 1
+        dxcc = self.resolver.resolve(qso['call'], qso['qso_datetime'])
+        if dxcc is not None:
+            qso['dxcc'] = dxcc.adif
+            qso['country'] = dxcc.entity
+            qso['cqz'] = dxcc.cqz
+            qso['cont'] = dxcc.cont
+        self.batch.append(qso)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, qsos: Iterable[dict]) -> None:
+        """
+        Queues several normalised QSOs
+
+        :param qsos: dicts from normalise_record()
+        :return:
+        """
+        for qso in qsos:
+            self.add(qso)
+
+    @contextlib.contextmanager
+    def savepoint(self):
+        """
+        QSOs added inside are written in a savepoint of their own before it exits.
+        On a database error only they are rolled back, and the writer forgets them, so the caller can report
+        the error (re-raised) and go on with the next file
+
+        :return: context manager
+        """
+        self.flush()
+        records, imported, staging = self.records, self.imported, self.staging
+        try:
+            with transaction.atomic():
+                yield
+                self.flush()
+        except DatabaseError:
+            self.batch = []
+            # A staging table created in the savepoint is gone with it
+            self.records, self.imported, self.staging = records, imported, staging
+            raise
+
+    def flush(self) -> None:
+        """
+        Writes the pending batch; rows clashing with stored QSOs are silently skipped
+
+        :return:
+        """
+        if not self.batch:
+            return
+        if self.use_copy:
+            self.imported += self._copy_batch()
+        else:
+            self.imported += insert_ignoring_conflicts([QSO(station=self.station, **qso) for qso in self.batch],
+                                                       self.batch_size)
+        self.batch = []
+
+    def _copy_batch(self) -> int:
+        """
+        COPY into a staging table, then INSERT ... ON CONFLICT DO NOTHING into the real one.
+        Must run inside a transaction: the staging table is dropped on commit
+
+        :return: number of rows inserted
+        """
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(QSO._meta.get_field(name).column) for name in COLUMNS)
+        table = quote(QSO._meta.db_table)
+        if self.staging is None:
+            self.staging = 'adif_qso_import'
+            with connection.cursor() as cursor:
+                cursor.execute(f'CREATE TEMPORARY TABLE {quote(self.staging)} ON COMMIT DROP AS '
+                               f'SELECT {columns} FROM {table} WITH NO DATA')
+        now = timezone.now()
+        rows = ((self.station.pk, *(qso[name] for name in COLUMNS[1:-2]), now, now) for qso in self.batch)
+        copy_rows(QSO, list(COLUMNS), rows, table=self.staging)
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {quote(self.staging)} '
+                           f'ON CONFLICT DO NOTHING')
+            inserted = cursor.rowcount
+            cursor.execute(f'TRUNCATE {quote(self.staging)}')
+        return inserted
+
+
+def iter_source(source: str | os.PathLike | BinaryIO, use_mmap: bool = True) -> Iterable[dict]:
+    """
+    Parsed records of a path or a binary stream
+
+    :param source: path or binary file-like object
+    :param use_mmap: memory-map local files
+    :return: iterator of records
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return ADIFReader().read_file(source, use_mmap)
+    return ADIFReader().read_stream(source)
+
+
+def import_adif(source: str | os.PathLike | BinaryIO, station, batch_size: int = BATCH_SIZE,
+                use_copy: bool = False, use_mmap: bool = True) -> ImportResult:
+    """
+    Imports an ADI file into the station's log in one transaction.
+    Memory stays bounded: records are parsed, normalised and written batch_size at a time,
+    duplicates are left to the unique constraint
+
+    :param source: path or binary file-like object
+    :param station: MyStation the QSOs belong to
+    :param batch_size: rows per bulk write
+    :param use_copy: use COPY on Postgres
+    :param use_mmap: memory-map local files
+    :return: ImportResult
+    """
+    start = time.perf_counter()
+    invalid = 0
+    with transaction.atomic():
+        writer = QSOWriter(station, batch_size, use_copy)
+        for record in iter_source(source, use_mmap):
+            qso = normalise_record(record)
+            if qso is None:
+                invalid += 1
+            else:
+                writer.add(qso)
+        writer.flush()
+    return ImportResult(writer.records + invalid, writer.imported, writer.duplicates, invalid,
+                        time.perf_counter() - start)
@@ -0,0 +1,48 @@
+# adif/management/commands/import_adif
+#
+# Imports ADIF files, directories or zip archives into a station's log
+#
+from django.core.management.base import BaseCommand, CommandError
+
+from my_station.models import MyStation
+from tools.bulk import BATCH_SIZE
+
+from ...parallel import FileReport, import_files
+
+
+class Command(BaseCommand):
+    help = 'Imports ADIF files (or directories / zip archives of them) into a station log, parsing in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('station', help='station id or callsign')
+        parser.add_argument('paths', nargs='+', help='.adi files, directories or .zip archives')
+        parser.add_argument('--workers', type=int, default=None, help='parsing processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows per bulk write')
+        parser.add_argument('--copy', action='store_true', help='write with COPY (Postgres only)')
+
+    def handle(self, *args, **options):
+        station = self.get_station(options['station'])
+
+        def progress(done: int, total: int, report: FileReport) -> None:
+            if report.error:
+                self.stderr.write(f'[{done}/{total}] {report.label}: {report.error}')
+            else:
+                self.stdout.write(f'[{done}/{total}] {report.label}: {report.records} records, {report.invalid} invalid')
+
+        result = import_files(options['paths'], station, options['workers'], options['batch_size'], options['copy'],
+                              progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.imported} QSOs imported from {len(result.files)} files in {result.seconds:.1f}s '
+            f'({result.duplicates} duplicates, {result.invalid} invalid, {result.failed} files failed)'))
+
+    @staticmethod
+    def get_station(value: str) -> MyStation:
+        """
+        :param value: station id or callsign
+        :return: MyStation
+        """
+        stations = MyStation.objects.filter(pk=int(value)) if value.isdigit() else MyStation.objects.filter(callsign__iexact=value)
+        station = stations.first()
+        if station is None:
+            raise CommandError(f'Unknown station {value}')
+        return station
@@ -0,0 +1,137 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("my_station", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QSO",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                ("updated_on", models.DateTimeField(auto_now=True)),
+                ("call", models.CharField(db_index=True, max_length=50)),
+                (
+                    "qso_datetime",
+                    models.DateTimeField(db_index=True, verbose_name="QSO date"),
+                ),
+                (
+                    "qso_datetime_off",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="QSO end date"
+                    ),
+                ),
+                ("band", models.CharField(db_index=True, max_length=10)),
+                ("mode", models.CharField(db_index=True, max_length=20)),
+                ("submode", models.CharField(blank=True, default="", max_length=20)),
+                (
+                    "freq",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Frequency (MHz)"
+                    ),
+                ),
+                (
+                    "rst_sent",
+                    models.CharField(
+                        blank=True, default="", max_length=10, verbose_name="RST sent"
+                    ),
+                ),
+                (
+                    "rst_rcvd",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=10,
+                        verbose_name="RST received",
+                    ),
+                ),
+                ("gridsquare", models.CharField(blank=True, default="", max_length=10)),
+                ("name", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "qth",
+                    models.CharField(
+                        blank=True, default="", max_length=255, verbose_name="QTH"
+                    ),
+                ),
+                ("comment", models.TextField(blank=True, default="")),
+                (
+                    "contest_id",
+                    models.CharField(
+                        blank=True, default="", max_length=50, verbose_name="Contest"
+                    ),
+                ),
+                (
+                    "stx_string",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=50,
+                        verbose_name="Exchange sent",
+                    ),
+                ),
+                (
+                    "srx_string",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=50,
+                        verbose_name="Exchange received",
+                    ),
+                ),
+                (
+                    "dxcc",
+                    models.IntegerField(
+                        blank=True, db_index=True, null=True, verbose_name="DXCC"
+                    ),
+                ),
+                ("country", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "cqz",
+                    models.IntegerField(blank=True, null=True, verbose_name="CQ Zone"),
+                ),
+                (
+                    "cont",
+                    models.CharField(
+                        blank=True, default="", max_length=2, verbose_name="Continent"
+                    ),
+                ),
+                ("extra", models.JSONField(blank=True, default=dict)),
+                (
+                    "station",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="qsos",
+                        to="my_station.mystation",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "QSO",
+                "verbose_name_plural": "QSOs",
+                "ordering": ("qso_datetime",),
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("station", "call", "band", "mode", "qso_datetime"),
+                        name="unique_qso",
+                    )
+                ],
+            },
+        ),
+    ]
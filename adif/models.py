@@ -1,3 +1,59 @@
-# from django.db import models
+# adif/models
+#
+# Holds the QSOs of the user's stations
+#
+from django.db import models
 
-# Create your models here.
+from my_station.models import MyStation
+
+
+class QSO(models.Model):
+    """
+    One contact, as imported from / exported to ADIF.
+    Fields without a column of their own are kept in extra, so nothing is lost on a round trip
+    """
+    # Good to have:
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    # Model fields
+    station = models.ForeignKey(MyStation, on_delete=models.CASCADE, related_name='qsos')
+    call = models.CharField(max_length=50, blank=False, null=False, db_index=True)
+    qso_datetime = models.DateTimeField(blank=False, null=False, db_index=True, verbose_name='QSO date')
+    qso_datetime_off = models.DateTimeField(blank=True, null=True, verbose_name='QSO end date')
+    band = models.CharField(max_length=10, blank=False, null=False, db_index=True)
+    mode = models.CharField(max_length=20, blank=False, null=False, db_index=True)
+    submode = models.CharField(max_length=20, blank=True, null=False, default='')
+    freq = models.FloatField(blank=True, null=True, verbose_name='Frequency (MHz)')
+    rst_sent = models.CharField(max_length=10, blank=True, null=False, default='', verbose_name='RST sent')
+    rst_rcvd = models.CharField(max_length=10, blank=True, null=False, default='', verbose_name='RST received')
+    gridsquare = models.CharField(max_length=10, blank=True, null=False, default='')
+    name = models.CharField(max_length=255, blank=True, null=False, default='')
+    qth = models.CharField(max_length=255, blank=True, null=False, default='', verbose_name='QTH')
+    comment = models.TextField(blank=True, null=False, default='')
+    contest_id = models.CharField(max_length=50, blank=True, null=False, default='', verbose_name='Contest')
+    stx_string = models.CharField(max_length=50, blank=True, null=False, default='', verbose_name='Exchange sent')
+    srx_string = models.CharField(max_length=50, blank=True, null=False, default='', verbose_name='Exchange received')
+    # Resolved from the ClubLog data on import
+    dxcc = models.IntegerField(blank=True, null=True, db_index=True, verbose_name='DXCC')
+    country = models.CharField(max_length=255, blank=True, null=False, default='')
+    cqz = models.IntegerField(blank=True, null=True, verbose_name='CQ Zone')
+    cont = models.CharField(max_length=2, blank=True, null=False, default='', verbose_name='Continent')
+    extra = models.JSONField(blank=True, null=False, default=dict)
+
+    def __str__(self) -> str:
+        """
+        Call, band, mode and date
+
+        :return:
+        """
+        return f'{self.call} {self.band} {self.mode} {self.qso_datetime:%Y-%m-%d %H:%M}'
+
+    class Meta:
+        verbose_name = 'QSO'
+        verbose_name_plural = 'QSOs'
+        ordering = ('qso_datetime',)
+        constraints = [
+            # Duplicate detection on import
+            models.UniqueConstraint(fields=('station', 'call', 'band', 'mode', 'qso_datetime'), name='unique_qso'),
+        ]
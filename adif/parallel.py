@@ -0,0 +1,297 @@
+# adif/parallel
+#
+# Multi-file ADIF import: files are parsed and normalised in a process pool,
+# each file's QSOs are written by a single QSOWriter in the calling process as soon as it is parsed
+#
+import collections
+import contextlib
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import django
+from django.db import DatabaseError, connections, transaction
+
+from tools.bulk import BATCH_SIZE
+
+from .importer import QSOWriter, normalise_record
+from .parser import ADIFReader
+
+ADIF_SUFFIXES = ('.adi', '.adif')
+
+
+class Source(NamedTuple):
+    """
+    One ADIF file: a plain file, or a member of a zip archive
+    """
+    path: str
+    member: str = ''
+
+    @property
+    def label(self) -> str:
+        """
+        Name shown in reports
+
+        :return: path, or archive:member
+        """
+        return f'{self.path}:{self.member}' if self.member else self.path
+
+    @property
+    def name(self) -> str:
+        """
+        File name without its directory
+
+        :return: file name, or archive:member
+        """
+        name = os.path.basename(self.path)
+        return f'{name}:{self.member}' if self.member else name
+
+
+class ParsedFile(NamedTuple):
+    """
+    What a worker sends back for one file
+    """
+    source: Source
+    qsos: list
+    invalid: int
+    error: str
+    seconds: float
+
+
+class FileReport(NamedTuple):
+    """
+    Outcome of one file
+    """
+    label: str
+    name: str
+    records: int
+    invalid: int
+    error: str
+
+
+class ParallelImportResult(NamedTuple):
+    """
+    What a multi-file import did
+    """
+    files: list
+    records: int
+    imported: int
+    duplicates: int
+    invalid: int
+    failed: int
+    seconds: float
+
+
+def collect_sources(paths: Iterable[str | os.PathLike]) -> list:
+    """
+    Expands directories (recursively) and zip archives into the ADIF files they hold
+
+    :param paths: files, directories or .zip archives
+    :return: list of Source
+    """
+    sources = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            sources += collect_sources(sorted(child for child in path.rglob('*')
+                                              if child.suffix.lower() in ADIF_SUFFIXES + ('.zip',)))
+        elif path.suffix.lower() == '.zip':
+            with zipfile.ZipFile(path) as archive:
+                sources += [Source(str(path), info.filename) for info in archive.infolist()
+                            if not info.is_dir() and info.filename.lower().endswith(ADIF_SUFFIXES)]
+        else:
+            sources.append(Source(str(path)))
+    return sources
+
+
+def parse_source(source: Source) -> ParsedFile:
+    """
+    Parses and normalises one file. Runs in a worker process: it never touches the database,
+    and any error is reported back instead of raised, so one bad file does not stop the rest
+
+    :param source: file to read
+    :return: ParsedFile
+    """
+    start = time.perf_counter()
+    qsos = []
+    invalid = 0
+    try:
+        if source.member:
+            with zipfile.ZipFile(source.path) as archive, archive.open(source.member) as stream:
+                records = ADIFReader().read_stream(stream)
+                # Consumed inside the with block: the member is read lazily
+                qsos, invalid = _normalise(records)
+        else:
+            qsos, invalid = _normalise(ADIFReader().read_file(source.path))
+    except Exception as error:  # whatever goes wrong stays with this file
+        return ParsedFile(source, [], 0, f'{type(error).__name__}: {error}', time.perf_counter() - start)
+    return ParsedFile(source, qsos, invalid, '', time.perf_counter() - start)
+
+
+def _normalise(records: Iterable[dict]) -> tuple:
+    """
+    :param records: parsed records
+    :return: (list of normalised QSOs, number of invalid records)
+    """
+    qsos = []
+    invalid = 0
+    for record in records:
+        qso = normalise_record(record)
+        if qso is None:
+            invalid += 1
+        else:
+            qsos.append(qso)
+    return qsos, invalid
+
+
+class ParsingPool:
+    """
+    Parses files in worker processes, with at most workers * 2 of them submitted at a time:
+    parsed files are held until the writer gets to them, so a slow database cannot make them pile up.
+    A worker dying (killed for its memory, crashed in C code...) breaks the whole pool: the files
+    it held are reported as failed, and a new pool parses the rest
+    """
+
+    def __init__(self, sources: list, workers: int) -> None:
+        """
+        Starts the workers with the first submissions
+
+        :param sources: files to parse
+        :param workers: number of processes
+        """
+        self.pending = collections.deque(sources)
+        self.workers = workers
+        # future: (source, pool generation)
+        self.in_flight = {}
+        self.generation = 0
+        # Spawned / forkserver workers set Django up before unpickling any work, which imports the models.
+        # Unpickling an initializer of this module would import them too early
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+        self._submit()
+
+    def _replace(self) -> None:
+        """
+        Swaps a broken pool for a new one. The caller's transaction is open by then:
+        the new workers are spawned, not forked, so they do not inherit its connection
+
+        :return:
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.generation += 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup,
+                                            mp_context=multiprocessing.get_context('spawn'))
+
+    def _submit(self) -> None:
+        """
+        Tops the submitted files up to workers * 2
+
+        :return:
+        """
+        while self.pending and len(self.in_flight) < self.workers * 2:
+            try:
+                future = self.executor.submit(parse_source, self.pending[0])
+            except BrokenProcessPool:
+                # Broke before any of its futures told
+                self._replace()
+                continue
+            self.in_flight[future] = (self.pending.popleft(), self.generation)
+
+    def results(self) -> Iterator[ParsedFile]:
+        """
+        ParsedFile results in completion order
+
+        :return: iterator of ParsedFile
+        """
+        while self.in_flight:
+            done, _pending = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, generation = self.in_flight.pop(future)
+                try:
+                    parsed = future.result()
+                except BrokenProcessPool as error:
+                    parsed = ParsedFile(source, [], 0, f'{type(error).__name__}: {error}', 0.0)
+                    if generation == self.generation:
+                        self._replace()
+                yield parsed
+            self._submit()
+
+    def shutdown(self) -> None:
+        """
+        Stops the workers, dropping the files not parsed yet
+
+        :return:
+        """
+        self.pending.clear()
+        self.executor.shutdown(cancel_futures=True)
+
+
+@contextlib.contextmanager
+def parsing(sources: list, workers: int = None) -> Iterator[Iterator[ParsedFile]]:
+    """
+    Starts parsing the files, yields the ParsedFile results in completion order.
+    Worker processes are forked on entry, with the database connections closed,
+    before the caller opens a transaction. workers=1 parses in this process,
+    one file at a time as the results are consumed, without forking or closing connections.
+    Results are not kept here once handed out, and no more than workers * 2 files are parsed ahead
+
+    :param sources: files to parse
+    :param workers: number of processes, defaults to the number of CPUs
+    :return: context manager giving an iterator of ParsedFile
+    """
+    workers = min(workers or os.cpu_count() or 1, len(sources) or 1)
+    if workers == 1:
+        yield map(parse_source, sources)
+        return
+    # Forked children must not share the parent's database sockets
+    connections.close_all()
+    pool = ParsingPool(sources, workers)
+    try:
+        yield pool.results()
+    finally:
+        pool.shutdown()
+
+
+def import_files(paths: Iterable[str | os.PathLike], station, workers: int = None, batch_size: int = BATCH_SIZE,
+                 use_copy: bool = False, progress: Callable[[int, int, FileReport], None] = None) -> ParallelImportResult:
+    """
+    Imports many ADIF files (or zip archives of them) into the station's log.
+    Parsing is spread over a process pool; writing goes through one QSOWriter, in one transaction,
+    so duplicates are detected across files too. Each file is written as soon as it is parsed,
+    in a savepoint: a file that cannot be read or written is reported and skipped
+
+    :param paths: files, directories or .zip archives
+    :param station: MyStation the QSOs belong to
+    :param workers: number of parsing processes, defaults to the number of CPUs
+    :param batch_size: rows per bulk write
+    :param use_copy: use COPY on Postgres
+    :param progress: called as progress(done, total, report) after each file
+    :return: ParallelImportResult
+    """
+    start = time.perf_counter()
+    sources = collect_sources(paths)
+    reports = []
+    invalid = 0
+    with parsing(sources, workers) as parsed_files, transaction.atomic():
+        writer = QSOWriter(station, batch_size, use_copy)
+        for parsed in parsed_files:
+            source, error = parsed.source, parsed.error
+            if not error:
+                try:
+                    with writer.savepoint():
+                        writer.add_many(parsed.qsos)
+                except DatabaseError as db_error:
+                    error = f'{type(db_error).__name__}: {db_error}'
+            if error:
+                report = FileReport(source.label, source.name, 0, 0, error)
+            else:
+                invalid += parsed.invalid
+                report = FileReport(source.label, source.name, len(parsed.qsos) + parsed.invalid, parsed.invalid, '')
+            reports.append(report)
+            if progress is not None:
+                progress(len(reports), len(sources), report)
+    return ParallelImportResult(reports, writer.records + invalid, writer.imported, writer.duplicates, invalid,
+                                sum(1 for report in reports if report.error), time.perf_counter() - start)
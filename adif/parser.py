@@ -0,0 +1,191 @@
+# adif/parser
+#
+# Streaming ADIF (.adi) tokenizer
+#
+# An ADI file is an optional free-text header closed by <EOH>, then records made of
+#     <CALL:6>EA3IEG <BAND:3>20m <MODE:2>CW <EOR>
+# Field data is taken by its length prefix, never by looking for the next '<',
+# so values may contain any character and there is nothing to backtrack over.
+#
+import mmap
+import os
+from typing import BinaryIO, Iterator
+
+CHUNK_SIZE = 1024 * 1024
+# A tag longer than this is garbage, not a field specifier
+MAX_TAG_LENGTH = 1024
+
+
+class ADIFError(ValueError):
+    """
+    Malformed ADIF data
+    """
+
+
+class ADIFReader:
+    """
+    Incremental ADI tokenizer.
+    scan() walks a buffer and yields complete records; whatever is left of an
+    incomplete record (fields parsed so far) stays in the reader, so the next
+    buffer only needs to start at self.consumed.
+    Header fields (ADIF_VER, PROGRAMID...) end up in self.header
+    """
+
+    def __init__(self, encoding: str = 'utf8') -> None:
+        """
+        :param encoding: how to decode field names and values
+        """
+        self.encoding = encoding
+        self.header = {}
+        # None until the first bytes tell whether there is a header
+        self.in_header = None
+        self.record = {}
+        self.consumed = 0
+        self.offset = 0
+        # (name, length) by raw tag
+        self.tags = {}
+
+    def _parse_tag(self, tag: bytes, start: int) -> tuple:
+        """
+        Splits a tag into field name and data length; control tags (EOR, EOH) get no length
+
+        :param tag: bytes between < and >
+        :param start: offset of the tag, for error messages
+        :return: (name, length) or (CONTROL TAG, None)
+        """
+        raw_name, colon, spec = tag.partition(b':')
+        if not colon:
+            return raw_name.strip().upper().decode(self.encoding, 'replace'), None
+        # <NAME:LENGTH> or <NAME:LENGTH:TYPE>
+        try:
+            length = int(spec.partition(b':')[0])
+        except ValueError:
+            raise ADIFError(f'bad length in tag at byte {self.offset + start}') from None
+        return raw_name.decode(self.encoding, 'replace').strip().lower(), length
+
+    def scan(self, buffer, final: bool = False) -> Iterator[dict]:
+        """
+        Yields every complete record in buffer.
+        Afterwards self.consumed tells how many bytes of buffer were used
+
+        :param buffer: bytes or mmap
+        :param final: True when no more data will follow
+        :return: iterator of dicts, lowercase field name -> str
+        """
+        end = len(buffer)
+        position = 0
+        self.consumed = 0
+        if self.in_header is None:
+            first = buffer.find(b'<')
+            if first < 0:
+                return
+            # Files starting with '<' have no header; anything else is header text until <EOH>
+            self.in_header = bool(buffer[:first].strip())
+
+        encoding = self.encoding
+        # Logs repeat the same few tags (<CALL:5>, <BAND:3>...) over and over:
+        # each distinct one is split and decoded once
+        tags = self.tags
+        record = self.header if self.in_header else self.record
+        find = buffer.find
+        while True:
+            start = find(b'<', position)
+            if start < 0:
+                self.consumed = end
+                break
+            close = find(b'>', start + 1, start + MAX_TAG_LENGTH)
+            if close < 0:
+                if end - start < MAX_TAG_LENGTH and not final:
+                    self.consumed = start
+                    break
+                raise ADIFError(f'unterminated tag at byte {self.offset + start}')
+
+            tag = buffer[start + 1:close]
+            parsed = tags.get(tag)
+            if parsed is None:
+                parsed = tags[tag] = self._parse_tag(tag, start)
+            name, length = parsed
+
+            if length is None:
+                position = close + 1
+                if name == 'EOR':
+                    if not self.in_header and record:
+                        self.consumed = position
+                        yield record
+                    record = self.record = {}
+                elif name == 'EOH':
+                    self.in_header = False
+                    record = self.record = {}
+                continue
+
+            data_end = close + 1 + length
+            if data_end > end:
+                if final:
+                    raise ADIFError(f'truncated field at byte {self.offset + start}')
+                self.consumed = start
+                break
+            record[name] = buffer[close + 1:data_end].decode(encoding, 'replace')
+            position = data_end
+
+        self.offset += self.consumed
+
+    def read_stream(self, stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+        """
+        Reads a binary stream chunk by chunk.
+        Only one chunk plus the unparsed tail of the previous one are held in memory
+
+        :param stream: binary file-like object
+        :param chunk_size: bytes per read
+        :return: iterator of records
+        """
+        pending = bytearray()
+        while True:
+            chunk = stream.read(chunk_size)
+            final = not chunk
+            pending += chunk
+            # Scanning an immutable copy lets tags be sliced out as hashable bytes
+            yield from self.scan(bytes(pending), final)
+            if final:
+                return
+            del pending[:self.consumed]
+
+    def read_file(self, path: str | os.PathLike, use_mmap: bool = True, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+        """
+        Reads a local file, memory-mapped when possible: the OS pages it in
+        and no copy of the file is ever built in Python
+
+        :param path: file path
+        :param use_mmap: False to read in chunks instead
+        :param chunk_size: bytes per read when not memory-mapping
+        :return: iterator of records
+        """
+        with open(path, 'rb') as stream:
+            if not use_mmap or os.fstat(stream.fileno()).st_size == 0:
+                yield from self.read_stream(stream, chunk_size)
+                return
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from self.scan(mapped, final=True)
+
+
+def iter_records(stream: BinaryIO, chunk_size: int = CHUNK_SIZE, encoding: str = 'utf8') -> Iterator[dict]:
+    """
+    Records of an ADI stream, one at a time
+
+    :param stream: binary file-like object
+    :param chunk_size: bytes per read
+    :param encoding: file encoding
+    :return: iterator of dicts, lowercase field name -> str
+    """
+    return ADIFReader(encoding).read_stream(stream, chunk_size)
+
+
+def iter_file(path: str | os.PathLike, use_mmap: bool = True, encoding: str = 'utf8') -> Iterator[dict]:
+    """
+    Records of a local ADI file, one at a time
+
+    :param path: file path
+    :param use_mmap: memory-map the file instead of reading it in chunks
+    :param encoding: file encoding
+    :return: iterator of dicts, lowercase field name -> str
+    """
+    return ADIFReader(encoding).read_file(path, use_mmap)
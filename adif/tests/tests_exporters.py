@@ -0,0 +1,85 @@
+# adif/tests/tests_exporters
+#
+# ADI, ADX and Cabrillo writers: what comes out of a small log
+#
+import datetime
+import io
+import xml.etree.ElementTree as ElementTree
+
+from django.test import TestCase
+
+from adif.exporters import iter_adi, iter_adx, iter_cabrillo
+from adif.importer import normalise_record
+from adif.models import QSO
+from adif.parser import ADIFReader
+from my_station.models import MyStation
+
+UTC = datetime.timezone.utc
+
+
+class ExporterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = MyStation.objects.create(description='Home', callsign='EA3IEG', name='Station',
+                                               locator='JN11ck', country='Spain')
+        QSO.objects.create(station=cls.station, call='K1ABC', band='20m', mode='CW', freq=14.025,
+                           qso_datetime=datetime.datetime(2024, 5, 1, 12, 5, 30, tzinfo=UTC),
+                           qso_datetime_off=datetime.datetime(2024, 5, 1, 12, 10, tzinfo=UTC),
+                           rst_sent='599', rst_rcvd='579', name='José <Pepe> & Co', contest_id='CQ-WW-CW',
+                           stx_string='14', srx_string='5', dxcc=291, cqz=5, cont='NA',
+                           extra={'my_rig': 'IC-7300', 'app_lflog_note': 'first', 'call': 'ignored', '2bad': 'x'})
+        QSO.objects.create(station=cls.station, call='DL1A', band='2m', mode='FM', freq=144.5,
+                           qso_datetime=datetime.datetime(2024, 5, 2, 7, 0, tzinfo=UTC), rst_sent='59', rst_rcvd='59')
+        QSO.objects.create(station=cls.station, call='F4XYZ', band='40m', mode='FT8',
+                           qso_datetime=datetime.datetime(2024, 5, 3, 21, 15, tzinfo=UTC))
+
+    def setUp(self):
+        self.queryset = QSO.objects.filter(station=self.station).order_by('qso_datetime')
+
+    def test_adi_round_trip(self):
+        reader = ADIFReader()
+        exported = ''.join(iter_adi(self.queryset, chunk_size=2)).encode('utf8')
+        records = list(reader.read_stream(io.BytesIO(exported), chunk_size=64))
+        self.assertEqual((reader.header['adif_ver'], reader.header['programid']), ('3.1.4', 'LFLog'))
+        self.assertEqual([record['call'] for record in records], ['K1ABC', 'DL1A', 'F4XYZ'])
+        first = records[0]
+        self.assertEqual((first['station_callsign'], first['my_gridsquare']), ('EA3IEG', 'JN11ck'))
+        # Extra values under a column's name are not repeated
+        self.assertEqual(exported.count(b'<CALL:'), 3)
+        for record, qso in zip(records, self.queryset):
+            imported = normalise_record(record)
+            with self.subTest(call=qso.call):
+                for name in ('call', 'qso_datetime', 'qso_datetime_off', 'band', 'mode', 'freq', 'rst_sent',
+                             'rst_rcvd', 'name', 'contest_id', 'stx_string', 'srx_string', 'dxcc', 'cqz', 'cont'):
+                    self.assertEqual(imported[name], getattr(qso, name), name)
+        self.assertEqual({name: value for name, value in normalise_record(first)['extra'].items()
+                          if name not in ('station_callsign', 'my_gridsquare')},
+                         {'my_rig': 'IC-7300', 'app_lflog_note': 'first', '2bad': 'x'})
+
+    def test_adx_is_well_formed(self):
+        root = ElementTree.fromstring(''.join(iter_adx(self.queryset, chunk_size=2)))
+        self.assertEqual(root.tag, 'ADX')
+        self.assertEqual(root.find('HEADER/PROGRAMID').text, 'LFLog')
+        records = root.findall('RECORDS/RECORD')
+        self.assertEqual([record.find('CALL').text for record in records], ['K1ABC', 'DL1A', 'F4XYZ'])
+        first = records[0]
+        self.assertEqual(first.find('NAME').text, 'José <Pepe> & Co')
+        self.assertEqual((first.find('QSO_DATE').text, first.find('TIME_ON').text), ('20240501', '120530'))
+        self.assertEqual(first.find('MY_RIG').text, 'IC-7300')
+        app = first.find('APP')
+        self.assertEqual((app.get('PROGRAMID'), app.get('FIELDNAME'), app.text), ('LFLOG', 'NOTE', 'first'))
+        # Not a valid element name
+        self.assertIsNone(first.find('2BAD'))
+
+    def test_cabrillo_qso_lines(self):
+        lines = ''.join(iter_cabrillo(self.queryset, self.station, 'CQ-WW-CW', chunk_size=2)).splitlines()
+        self.assertEqual(lines[:4], ['START-OF-LOG: 3.0', 'CREATED-BY: LFLog', 'CALLSIGN: EA3IEG',
+                                     'CONTEST: CQ-WW-CW'])
+        self.assertEqual(lines[-1], 'END-OF-LOG:')
+        qsos = [line for line in lines if line.startswith('QSO:')]
+        self.assertEqual(qsos, [
+            'QSO: 14025 CW 2024-05-01 1205 EA3IEG        599 14     K1ABC         579 5',
+            'QSO:   144 FM 2024-05-02 0700 EA3IEG        59         DL1A          59',
+            'QSO:   40m DG 2024-05-03 2115 EA3IEG                   F4XYZ         ',
+        ])
@@ -0,0 +1,147 @@
+# adif/tests/tests_importer
+#
+# ADIF import: record normalisation, duplicate detection and what import_adif() reports
+#
+import datetime
+import io
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+
+from adif.importer import QSOWriter, import_adif, normalise_record
+from adif.models import QSO
+from clublog.models import ClubLogPrefix
+from clublog.resolver import rebuild_resolver
+from my_station.models import MyStation
+
+UTC = datetime.timezone.utc
+
+
+def adi(*records: dict) -> io.BytesIO:
+    """
+    :param records: dicts of ADIF fields
+    :return: ADI stream with one record per dict
+    """
+    text = ''.join(''.join(f'<{name}:{len(value)}>{value} ' for name, value in record.items()) + '<EOR>\n'
+                   for record in records)
+    return io.BytesIO(text.encode('utf8'))
+
+
+def record(call: str = 'EA3IEG', time_on: str = '1200', **fields) -> dict:
+    """
+    :return: parsed ADIF record, lowercase names as the parser gives them
+    """
+    return {'call': call, 'qso_date': '20240501', 'time_on': time_on, 'band': '20M', 'mode': 'cw', **fields}
+
+
+class NormaliseRecordTests(SimpleTestCase):
+
+    def test_normalise(self):
+        qso = normalise_record(record(' ea3ieg ', time_on='120530', submode='usb', gridsquare=' JN11ck ',
+                                      stx='001', srx_string='5NN 14', cqz='14', my_rig='IC-7300'))
+        self.assertEqual(qso['call'], 'EA3IEG')
+        self.assertEqual(qso['qso_datetime'], datetime.datetime(2024, 5, 1, 12, 5, 30, tzinfo=UTC))
+        self.assertEqual((qso['band'], qso['mode'], qso['submode']), ('20m', 'CW', 'USB'))
+        self.assertEqual(qso['gridsquare'], 'JN11ck')
+        self.assertEqual((qso['stx_string'], qso['srx_string']), ('001', '5NN 14'))
+        self.assertEqual(qso['cqz'], 14)
+        self.assertEqual(qso['extra'], {'my_rig': 'IC-7300'})
+
+    def test_band_from_frequency(self):
+        qso = normalise_record(record(band='', freq='14.025'))
+        self.assertEqual((qso['band'], qso['freq']), ('20m', 14.025))
+
+    def test_end_date_defaults_to_start_date(self):
+        qso = normalise_record(record(time_off='1210'))
+        self.assertEqual(qso['qso_datetime_off'], datetime.datetime(2024, 5, 1, 12, 10, tzinfo=UTC))
+
+    def test_lenient_numbers(self):
+        qso = normalise_record(record(freq='fourteen', dxcc='', cqz='x'))
+        self.assertEqual((qso['freq'], qso['dxcc'], qso['cqz']), (None, None, None))
+
+    def test_invalid_records(self):
+        for invalid in (record(call=''), record(qso_date='2024'), record(time_on=''), record(band='', freq=''),
+                        record(mode=''), {'call': 'EA3IEG'}):
+            with self.subTest(record=invalid):
+                self.assertIsNone(normalise_record(invalid))
+
+    def test_long_identifying_fields_are_invalid(self):
+        self.assertIsNone(normalise_record(record(call='EA3IEG/' + 'X' * 50)))
+        self.assertIsNone(normalise_record(record(mode='M' * 21)))
+
+    def test_long_fields_are_cut(self):
+        qso = normalise_record(record(name='N' * 300, cont='Europe', comment='C' * 1000))
+        self.assertEqual(qso['name'], 'N' * 255)
+        self.assertEqual(qso['cont'], 'EU')
+        self.assertEqual(qso['comment'], 'C' * 1000)
+
+
+class ImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = MyStation.objects.create(description='Home', callsign='EA3IEG', name='Station',
+                                               locator='JN11ck', country='Spain')
+        ClubLogPrefix.objects.create(record=1, call='EA', entity='SPAIN', adif=281, cqz=14, cont='EU', lat=40, long=-4)
+
+    def setUp(self):
+        rebuild_resolver()
+
+    def test_import(self):
+        result = import_adif(adi(record(), record('K1ABC', band='40m'), record(call='')), self.station)
+        self.assertEqual((result.records, result.imported, result.duplicates, result.invalid), (3, 2, 0, 1))
+        qso = QSO.objects.get(call='EA3IEG')
+        self.assertEqual((qso.dxcc, qso.country, qso.cqz, qso.cont), (281, 'SPAIN', 14, 'EU'))
+        self.assertIsNone(QSO.objects.get(call='K1ABC').dxcc)
+
+    def test_duplicates_in_the_file(self):
+        result = import_adif(adi(record(), record(call='ea3ieg', band='20m', mode='CW'), record(time_on='1201')),
+                             self.station)
+        self.assertEqual((result.records, result.imported, result.duplicates), (3, 2, 1))
+        self.assertEqual(QSO.objects.count(), 2)
+
+    def test_duplicates_already_stored(self):
+        import_adif(adi(record(), record('K1ABC')), self.station)
+        result = import_adif(adi(record(), record('K1ABC'), record('DL1A')), self.station)
+        self.assertEqual((result.records, result.imported, result.duplicates), (3, 1, 2))
+        self.assertEqual(QSO.objects.count(), 3)
+
+    def test_batches(self):
+        result = import_adif(adi(*(record(time_on=f'12{minute:02}') for minute in range(7)), record()), self.station,
+                             batch_size=2)
+        self.assertEqual((result.records, result.imported, result.duplicates), (8, 7, 1))
+
+    def test_inserts_above_the_database_parameter_limit(self):
+        records = [record(time_on=f'{hour:02}{minute:02}') for hour in range(10) for minute in range(60)]
+        result = import_adif(adi(*records, record(time_on='0959')), self.station)
+        self.assertEqual((result.records, result.imported, result.duplicates), (601, 600, 1))
+
+    def test_only_own_inserts_are_counted(self):
+        writer = QSOWriter(self.station)
+        writer.add(normalise_record(record()))
+        writer.add(normalise_record(record('K1ABC')))
+        # Someone else logs a contact meanwhile, and one of ours
+        QSO.objects.create(station=self.station, call='DL1A', band='20m', mode='CW',
+                           qso_datetime=datetime.datetime(2024, 5, 1, 12, tzinfo=UTC))
+        QSO.objects.create(station=self.station, call='K1ABC', band='20m', mode='CW',
+                           qso_datetime=datetime.datetime(2024, 5, 1, 12, tzinfo=UTC))
+        self.assertEqual((writer.imported, writer.duplicates), (0, 0))
+        writer.flush()
+        self.assertEqual((writer.records, writer.imported, writer.duplicates), (2, 1, 1))
+        self.assertEqual(QSO.objects.count(), 3)
+
+    def test_savepoint_rolls_back_and_forgets(self):
+        writer = QSOWriter(self.station)
+        writer.add(normalise_record(record('K1ABC')))
+        with self.assertRaises(DatabaseError):
+            with writer.savepoint():
+                writer.add(normalise_record(record()))
+                writer.add(normalise_record(record()))
+                raise DatabaseError('disk full')
+        self.assertEqual((writer.records, writer.duplicates), (1, 0))
+        self.assertEqual(list(QSO.objects.values_list('call', flat=True)), ['K1ABC'])
+
+        with writer.savepoint():
+            writer.add(normalise_record(record()))
+        self.assertEqual((writer.records, writer.duplicates), (2, 0))
+        self.assertEqual(QSO.objects.count(), 2)
@@ -0,0 +1,206 @@
+# adif/tests/tests_parallel
+#
+# Multi-file import: collecting the files, parsing them apart, and isolating the ones that fail
+#
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+
+from adif import parallel
+from adif.importer import QSOWriter
+from adif.models import QSO
+from adif.parallel import ParsingPool, Source, collect_sources, import_files, parse_source
+from my_station.models import MyStation
+
+
+def adi(*calls: str, time_on: str = '1200') -> str:
+    """
+    :param calls: one record per call
+    :return: ADI text
+    """
+    return ''.join(f'<CALL:{len(call)}>{call} <QSO_DATE:8>20240501 <TIME_ON:4>{time_on} <BAND:3>20m <MODE:2>CW <EOR>\n'
+                   for call in calls)
+
+
+class FilesMixin:
+    """
+    A temporary directory to write logs into
+    """
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name: str, text: str) -> Path:
+        """
+        :return: path of the new file
+        """
+        path = self.directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf8')
+        return path
+
+    def zip(self, name: str, members: dict) -> Path:
+        """
+        :param members: member name: text, directories end with /
+        :return: path of the new archive
+        """
+        path = self.directory / name
+        with zipfile.ZipFile(path, 'w') as archive:
+            for member, text in members.items():
+                archive.writestr(member, text)
+        return path
+
+
+class CollectSourcesTests(FilesMixin, SimpleTestCase):
+
+    def test_directory(self):
+        self.write('b.adi', adi('K1ABC'))
+        self.write('2023/a.ADIF', adi('DL1A'))
+        self.write('notes.txt', 'not a log')
+        self.zip('old.zip', {'old.adi': adi('F4XYZ')})
+        self.assertEqual(collect_sources([self.directory]), [
+            Source(str(self.directory / '2023/a.ADIF')),
+            Source(str(self.directory / 'b.adi')),
+            Source(str(self.directory / 'old.zip'), 'old.adi'),
+        ])
+
+    def test_zip(self):
+        archive = self.zip('logs.zip', {'2023/': '', '2023/a.adi': adi('DL1A'), 'b.ADI': adi('K1ABC'),
+                                        'readme.txt': 'hi'})
+        plain = self.write('c.log', adi('F4XYZ'))
+        sources = collect_sources([archive, plain])
+        self.assertEqual(sources, [Source(str(archive), '2023/a.adi'), Source(str(archive), 'b.ADI'),
+                                   Source(str(plain))])
+        self.assertEqual((sources[0].label, sources[0].name), (f'{archive}:2023/a.adi', 'logs.zip:2023/a.adi'))
+
+
+class ParseSourceTests(FilesMixin, SimpleTestCase):
+
+    def test_file_and_member(self):
+        parsed = parse_source(Source(str(self.write('a.adi', adi('K1ABC', 'DL1A', '')))))
+        self.assertEqual(([qso['call'] for qso in parsed.qsos], parsed.invalid, parsed.error), (['K1ABC', 'DL1A'], 1, ''))
+        archive = self.zip('logs.zip', {'b.adi': adi('F4XYZ')})
+        parsed = parse_source(Source(str(archive), 'b.adi'))
+        self.assertEqual([qso['call'] for qso in parsed.qsos], ['F4XYZ'])
+
+    def test_errors_are_captured(self):
+        truncated = parse_source(Source(str(self.write('a.adi', '<CALL:10>K1'))))
+        self.assertEqual((truncated.qsos, truncated.invalid), ([], 0))
+        self.assertTrue(truncated.error.startswith('ADIFError: truncated field'))
+        self.assertTrue(parse_source(Source(str(self.directory / 'gone.adi'))).error.startswith('FileNotFoundError'))
+        archive = self.zip('logs.zip', {'b.adi': adi('F4XYZ')})
+        self.assertTrue(parse_source(Source(str(archive), 'c.adi')).error.startswith('KeyError'))
+
+
+class FakeExecutor:
+    """
+    Runs each submission at once, in this process. Once a file named crash.adi is submitted
+    the pool is broken: its futures and the later ones fail, as a real pool's would
+    """
+
+    def __init__(self, max_workers: int, initializer=None, mp_context=None) -> None:
+        self.submitted = []
+        self.broken = False
+        self.shut_down = False
+
+    def submit(self, function, source: Source) -> Future:
+        self.submitted.append(Path(source.path).name)
+        self.broken = self.broken or source.path.endswith('crash.adi')
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool('A child process terminated abruptly'))
+        else:
+            future.set_result(function(source))
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self.shut_down = True
+
+
+class ParsingPoolTests(FilesMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executors = []
+
+        def executor(*args, **kwargs):
+            self.executors.append(FakeExecutor(*args, **kwargs))
+            return self.executors[-1]
+
+        patcher = mock.patch.object(parallel, 'ProcessPoolExecutor', executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sources(self, *names: str) -> list:
+        """
+        :return: a Source for each new file
+        """
+        return [Source(str(self.write(name, adi('K1ABC')))) for name in names]
+
+    def test_submissions_are_bounded(self):
+        pool = ParsingPool(self.sources(*(f'{number}.adi' for number in range(7))), workers=2)
+        self.assertEqual(len(self.executors[0].submitted), 4)
+        results = pool.results()
+        next(results)
+        self.assertEqual(len(self.executors[0].submitted), 4)
+        self.assertEqual(len(list(results)), 6)
+        self.assertEqual(len(self.executors[0].submitted), 7)
+
+    def test_broken_pool_is_replaced(self):
+        pool = ParsingPool(self.sources('1.adi', 'crash.adi', '3.adi', '4.adi', '5.adi', '6.adi'), workers=1)
+        results = {Path(parsed.source.path).name: parsed.error for parsed in pool.results()}
+        pool.shutdown()
+        self.assertEqual(results, {'1.adi': '', 'crash.adi': 'BrokenProcessPool: A child process terminated abruptly',
+                                   '3.adi': '', '4.adi': '', '5.adi': '', '6.adi': ''})
+        self.assertEqual(len(self.executors), 2)
+        self.assertEqual(self.executors[0].submitted, ['1.adi', 'crash.adi'])
+        self.assertEqual(self.executors[1].submitted, ['3.adi', '4.adi', '5.adi', '6.adi'])
+        self.assertTrue(all(executor.shut_down for executor in self.executors))
+
+    def test_files_in_flight_fail_with_the_pool(self):
+        pool = ParsingPool(self.sources('crash.adi', '2.adi', '3.adi', '4.adi', '5.adi'), workers=2)
+        errors = [bool(parsed.error) for parsed in pool.results()]
+        self.assertEqual(errors, [True, True, True, True, False])
+        self.assertEqual(self.executors[0].submitted, ['crash.adi', '2.adi', '3.adi', '4.adi'])
+        self.assertEqual(self.executors[1].submitted, ['5.adi'])
+
+
+class ImportFilesTests(FilesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = MyStation.objects.create(description='Home', callsign='EA3IEG', name='Station',
+                                               locator='JN11ck', country='Spain')
+
+    def test_failing_file_is_rolled_back(self):
+        add_many = QSOWriter.add_many
+
+        def failing_add_many(writer, qsos):
+            add_many(writer, qsos)
+            if any(qso['call'] == 'N0CALL' for qso in qsos):
+                raise DatabaseError('value too long')
+
+        self.write('a.adi', adi('K1ABC', 'DL1A'))
+        self.write('b.adi', adi('F4XYZ', 'N0CALL'))
+        self.write('c.adi', adi('K1ABC', 'W1AW', ''))
+        self.write('d.adi', '<CALL:10>K1')
+        reports = []
+        with mock.patch.object(QSOWriter, 'add_many', failing_add_many):
+            result = import_files([self.directory], self.station, workers=1, batch_size=1,
+                                  progress=lambda done, total, report: reports.append((done, total, report.name)))
+        self.assertEqual([(report.name, report.records, report.invalid, report.error) for report in result.files], [
+            ('a.adi', 2, 0, ''), ('b.adi', 0, 0, 'DatabaseError: value too long'), ('c.adi', 3, 1, ''),
+            ('d.adi', 0, 0, 'ADIFError: truncated field at byte 0'),
+        ])
+        self.assertEqual(reports, [(1, 4, 'a.adi'), (2, 4, 'b.adi'), (3, 4, 'c.adi'), (4, 4, 'd.adi')])
+        self.assertEqual((result.records, result.imported, result.duplicates, result.invalid, result.failed),
+                         (5, 3, 1, 1, 2))
+        self.assertEqual(sorted(QSO.objects.values_list('call', flat=True)), ['DL1A', 'K1ABC', 'W1AW'])
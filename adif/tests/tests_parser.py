@@ -0,0 +1,81 @@
+# adif/tests/tests_parser
+#
+# ADIFReader: fields taken by length, header handling, and records split across read chunks
+#
+import io
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from adif.parser import ADIFError, ADIFReader, iter_records
+
+ADI = ('LFLog test export\n<ADIF_VER:5>3.1.4 <PROGRAMID:5>LFLog\n<EOH>\n'
+       '<CALL:6>EA3IEG <QSO_DATE:8>20240501 <TIME_ON:4>1200 <BAND:3>20m <MODE:2>CW <EOR>\n'
+       '<call:5>K1ABC <qso_date:8>20240501 <time_on:6>120530 <band:3>40m <mode:3>SSB '
+       '<comment:11>a <b> c:d e <EOR>\n'
+       '<CALL:6>OE1XYZ <NAME:7:S>Jürgen <BAND:3>20m <MODE:3>FT8 <EOR>\n').encode('utf8')
+
+
+class ADIFReaderTests(SimpleTestCase):
+
+    def read(self, data: bytes, chunk_size: int = 1024) -> tuple:
+        """
+        :param data: ADI bytes
+        :param chunk_size: bytes per read
+        :return: (records, header)
+        """
+        reader = ADIFReader()
+        return list(reader.read_stream(io.BytesIO(data), chunk_size)), reader.header
+
+    def test_header_and_records(self):
+        records, header = self.read(ADI)
+        self.assertEqual(header, {'adif_ver': '3.1.4', 'programid': 'LFLog'})
+        self.assertEqual([record['call'] for record in records], ['EA3IEG', 'K1ABC', 'OE1XYZ'])
+        self.assertEqual(records[0], {'call': 'EA3IEG', 'qso_date': '20240501', 'time_on': '1200', 'band': '20m',
+                                      'mode': 'CW'})
+
+    def test_data_is_taken_by_length(self):
+        records, _header = self.read(ADI)
+        self.assertEqual(records[1]['comment'], 'a <b> c:d e')
+
+    def test_lengths_count_bytes_and_types_are_ignored(self):
+        records, _header = self.read(ADI)
+        self.assertEqual(records[2]['name'], 'Jürgen')
+        self.assertEqual(records[2]['mode'], 'FT8')
+
+    def test_file_without_header(self):
+        records, header = self.read(b'<CALL:4>DL1A <BAND:3>20m <EOR><CALL:4>DL1B <EOR>')
+        self.assertEqual(header, {})
+        self.assertEqual([record['call'] for record in records], ['DL1A', 'DL1B'])
+
+    def test_empty_records_are_skipped(self):
+        records, _header = self.read(b'<EOH><EOR><CALL:4>DL1A <EOR> <EOR>')
+        self.assertEqual(records, [{'call': 'DL1A'}])
+
+    def test_every_chunk_boundary(self):
+        # Tags, lengths and data cut at every possible byte give the same records
+        expected, expected_header = self.read(ADI)
+        for chunk_size in range(1, len(ADI) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.read(ADI, chunk_size), (expected, expected_header))
+
+    def test_truncated_field(self):
+        with self.assertRaises(ADIFError):
+            self.read(b'<CALL:6>EA3IEG <BAND:3>20')
+
+    def test_bad_length(self):
+        with self.assertRaises(ADIFError):
+            self.read(b'<CALL:x>EA3IEG <EOR>')
+
+    def test_unterminated_tag(self):
+        with self.assertRaises(ADIFError):
+            self.read(b'<CALL:6>EA3IEG <EOR><BAND:3')
+
+    def test_read_file_mapped_and_chunked(self):
+        with tempfile.NamedTemporaryFile(suffix='.adi', delete=False) as file:
+            file.write(ADI)
+        self.addCleanup(os.unlink, file.name)
+        expected = list(iter_records(io.BytesIO(ADI)))
+        self.assertEqual(list(ADIFReader().read_file(file.name)), expected)
+        self.assertEqual(list(ADIFReader().read_file(file.name, use_mmap=False, chunk_size=7)), expected)
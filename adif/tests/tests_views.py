@@ -0,0 +1,73 @@
+# adif/tests/tests_views
+#
+# QSOExportView: streamed downloads, content type and file name per format
+#
+import datetime
+
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+from django.urls import reverse
+
+from adif.models import QSO
+from cust_user.models import CustomUser
+from my_station.models import MyStation
+
+UTC = datetime.timezone.utc
+
+
+class QSOExportViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('op@example.com', 'secret')
+        cls.station = MyStation.objects.create(description='Portable', callsign='EA3IEG/P', name='Station',
+                                               locator='JN11ck', country='Spain')
+        for minute, contest in ((0, 'CQ-WW-CW'), (1, ''), (2, 'CQ-WW-CW')):
+            QSO.objects.create(station=cls.station, call=f'K{minute}ABC', band='20m', mode='CW', contest_id=contest,
+                               qso_datetime=datetime.datetime(2024, 5, 1, 12, minute, tzinfo=UTC))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def url(self, kind: str) -> str:
+        """
+        :return: export URL of the station's log
+        """
+        return reverse('qso-export', args=(self.station.pk, kind))
+
+    def test_formats(self):
+        for kind, content_type, extension, first in (('adi', 'text/plain', 'adi', b'LFLog ADIF export'),
+                                                     ('adx', 'application/xml', 'adx', b'<?xml'),
+                                                     ('cabrillo', 'text/plain', 'log', b'START-OF-LOG')):
+            with self.subTest(kind=kind):
+                response = self.client.get(self.url(kind))
+                self.assertEqual(response.status_code, 200)
+                self.assertIsInstance(response, StreamingHttpResponse)
+                self.assertEqual(response['Content-Type'], f'{content_type}; charset=utf-8')
+                self.assertEqual(response['Content-Disposition'], f'attachment; filename="EA3IEG_P.{extension}"')
+                content = b''.join(response.streaming_content)
+                self.assertTrue(content.startswith(first))
+                self.assertEqual(content.count(b'ABC'), 3)
+
+    def test_contest_filter(self):
+        response = self.client.get(self.url('cabrillo'), {'contest': 'cq-ww-cw'})
+        content = b''.join(response.streaming_content).decode('utf8')
+        self.assertIn('CONTEST: CQ-WW-CW\n', content)
+        self.assertEqual(content.count('QSO:'), 2)
+        self.assertNotIn('K1ABC', content)
+
+    async def test_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url('adi'))
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertTrue(response.is_async)
+        content = b''.join([block async for block in response.streaming_content])
+        self.assertEqual(content.count(b'<EOR>'), 3)
+
+    def test_unknown_format_and_station(self):
+        self.assertEqual(self.client.get(self.url('csv')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('qso-export', args=(self.station.pk + 1, 'adi'))).status_code, 404)
+
+    def test_needs_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url('adi')).status_code, 403)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views as adif_views
+
+urlpatterns = [
+    path('stations/<int:station_id>/import/', adif_views.QSOImportView.as_view(), name='qso-import'),
+    path('stations/<int:station_id>/export/<str:kind>/', adif_views.QSOExportView.as_view(), name='qso-export'),
+]
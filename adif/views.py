@@ -1,3 +1,111 @@
-# from django.shortcuts import render
+# adif/views
+#
+# Log imports, and exports streamed to the client
+#
+import os
+import tempfile
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from my_station.models import MyStation
+
+from .exporters import iter_adi, iter_adx, iter_cabrillo
+from .models import QSO
+from .parallel import import_files
+
+# kind: (content type, file extension)
+EXPORT_FORMATS = {
+    'adi': ('text/plain', 'adi'),
+    'adx': ('application/xml', 'adx'),
+    'cabrillo': ('text/plain', 'log'),
+}
+
+
+async def _async_blocks(blocks):
+    """
+    Hands a synchronous export to an ASGI server one block at a time.
+    Django would otherwise consume a synchronous iterator completely before sending anything.
+    The calls are thread sensitive, so the cursor is always used from the same thread
+
+    :param blocks: iterator of str
+    :return: async iterator of str
+    """
+    blocks = iter(blocks)
+    next_block = sync_to_async(next)
+    while (block := await next_block(blocks, None)) is not None:
+        yield block
+
+
+class QSOExportView(APIView):
+    """
+    API endpoint that downloads a station's log as ADI, ADX or Cabrillo.
+    Rows are read with a server-side cursor and written as they come, so memory stays flat
+    whatever the size of the log.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, station_id: int, kind: str):
+        if kind not in EXPORT_FORMATS:
+            raise Http404
+        station = get_object_or_404(MyStation, pk=station_id)
+        queryset = QSO.objects.filter(station=station).order_by('qso_datetime')
+        if contest := request.query_params.get('contest', ''):
+            queryset = queryset.filter(contest_id=contest.upper())
+        if kind == 'adi':
+            blocks = iter_adi(queryset)
+        elif kind == 'adx':
+            blocks = iter_adx(queryset)
+        else:
+            blocks = iter_cabrillo(queryset, station, contest.upper())
+        if isinstance(request._request, ASGIRequest):
+            blocks = _async_blocks(blocks)
+        content_type, extension = EXPORT_FORMATS[kind]
+        response = StreamingHttpResponse(blocks, content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{station.callsign.replace("/", "_")}.{extension}"'
+        return response
+
+
+class QSOImportView(APIView):
+    """
+    API endpoint that imports uploaded ADIF files or zip archives (field "files") into a station's log.
+    Files are parsed one after the other in this worker, each written as soon as it is parsed;
+    large multi-file imports belong to manage.py import_adif, which parses in parallel.
+    The response lists what happened to each file.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, station_id: int):
+        station = get_object_or_404(MyStation, pk=station_id)
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            return Response({'files': ['No files uploaded.']}, status=status.HTTP_400_BAD_REQUEST)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for number, upload in enumerate(uploads):
+                # A directory each, so two uploads with the same name do not overwrite each other
+                os.mkdir(os.path.join(directory, str(number)))
+                path = os.path.join(directory, str(number), os.path.basename(upload.name))
+                with open(path, 'wb') as target:
+                    for chunk in upload.chunks():
+                        target.write(chunk)
+                paths.append(path)
+            # No process pool inside a request worker
+            result = import_files(paths, station, workers=1)
+        return Response({
+            'records': result.records,
+            'imported': result.imported,
+            'duplicates': result.duplicates,
+            'invalid': result.invalid,
+            'failed': result.failed,
+            'seconds': round(result.seconds, 3),
+            'files': [{'name': report.name, 'records': report.records, 'invalid': report.invalid,
+                       'error': report.error} for report in result.files],
+        })
@@ -0,0 +1,110 @@
+# benchmarks/bench_adif
+#
+# Throughput of the streaming ADIF parser on a synthetic log
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_adif [--qsos 2000000] [--file /tmp/synthetic.adi]
+#
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from adif.parser import ADIFReader
+from tools.stats import peak_rss_mb
+
+BANDS = ('160m', '80m', '40m', '30m', '20m', '17m', '15m', '12m', '10m', '6m')
+MODES = ('CW', 'SSB', 'FT8', 'RTTY')
+
+
+def field(name: str, value: str) -> str:
+    """
+    One ADI field
+
+    :param name: field name
+    :param value: field data
+    :return: <NAME:LEN>value
+    """
+    return f'<{name}:{len(value)}>{value}'
+
+
+def write_synthetic(path: str, qsos: int, seed: int = 42) -> None:
+    """
+    Writes a log shaped like a contest export: a header and qsos records of ~170 bytes
+
+    :param path: where to write
+    :param qsos: number of records
+    :param seed: random seed
+    :return:
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf8', newline='\n') as adi:
+        adi.write('Synthetic log for benchmarks\n')
+        adi.write(field('ADIF_VER', '3.1.4') + ' ' + field('PROGRAMID', 'LFLog') + '\n<EOH>\n')
+        lines = []
+        for number in range(qsos):
+            call = f'{rng.choice("KWNEAGDFIO")}{rng.randint(0, 9)}{rng.choice("ABCDEFXYZ")}{rng.choice("ABCDEFXYZ")}{rng.choice("ABCDEFXYZ")}'
+            lines.append(' '.join((
+                field('CALL', call),
+                field('QSO_DATE', f'2025{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}'),
+                field('TIME_ON', f'{rng.randint(0, 23):02d}{rng.randint(0, 59):02d}{rng.randint(0, 59):02d}'),
+                field('BAND', rng.choice(BANDS)),
+                field('MODE', rng.choice(MODES)),
+                field('RST_SENT', '599'),
+                field('RST_RCVD', '599'),
+                field('GRIDSQUARE', 'JN11ck'),
+                field('STX', str(number)),
+            )) + ' <EOR>\n')
+            if len(lines) >= 10000:
+                adi.writelines(lines)
+                lines = []
+        adi.writelines(lines)
+
+
+def run(label: str, records, size: int) -> None:
+    """
+    Consumes the records and prints the throughput
+
+    :param label: what is being measured
+    :param records: iterator of records
+    :param size: file size in bytes
+    :return:
+    """
+    start = time.perf_counter()
+    count = sum(1 for _record in records)
+    elapsed = time.perf_counter() - start
+    print(f'{label:8} {count} records in {elapsed:.2f}s: {count / elapsed:,.0f} records/s, '
+          f'{size / elapsed / 1e6:.1f} MB/s, peak RSS {peak_rss_mb():.1f} MB')
+
+
+def main() -> None:
+    """
+    Generates the file (unless given) and parses it chunked and memory-mapped
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Throughput of the streaming ADIF parser')
+    parser.add_argument('--qsos', type=int, default=2000000)
+    parser.add_argument('--file', help='existing .adi file to parse instead of a synthetic one')
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.adi')
+        os.close(handle)
+        start = time.perf_counter()
+        write_synthetic(path, args.qsos)
+        print(f'wrote {args.qsos} QSOs to {path} in {time.perf_counter() - start:.1f}s')
+    size = os.path.getsize(path)
+    try:
+        with open(path, 'rb') as stream:
+            run('chunked', ADIFReader().read_stream(stream), size)
+        run('mmap', ADIFReader().read_file(path, use_mmap=True), size)
+    finally:
+        if args.file is None:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# benchmarks/bench_channel_layers
+#
+# Messages per second and delivery latency through ChatConsumer, for each channel layer:
+# chat.layers.LocalChannelLayer, channels' InMemoryChannelLayer and channels_redis (if Redis answers).
+# Consumers are driven in process, so the figures are the layer's and the consumer's, without sockets
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_channel_layers [--rooms 10] [--clients 20] [--messages 200] [--batch-ms 0]
+#
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import django
+from django.conf import settings
+
+LAYERS = {
+    'local': {'BACKEND': 'chat.layers.LocalChannelLayer', 'CONFIG': {'capacity': 1000}},
+    'inmemory': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 1000}},
+    'redis': {'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'capacity': 1000}},
+}
+
+
+class Client:
+    """
+    A websocket client talking straight to a consumer application
+    """
+
+    def __init__(self, application, room: str) -> None:
+        """
+        :param application: consumer ASGI application
+        :param room: chat room
+        """
+        self.input = asyncio.Queue()
+        self.output = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': f'/ws/chat/{room}/', 'query_string': b'', 'headers': [],
+                 'url_route': {'args': (), 'kwargs': {'room_name': room}}}
+        self.task = asyncio.ensure_future(application(scope, self.input.get, self.output.put))
+
+    async def connect(self) -> None:
+        await self.input.put({'type': 'websocket.connect'})
+        message = await self.output.get()
+        assert message['type'] == 'websocket.accept', message
+
+    def send(self, text: str) -> None:
+        self.input.put_nowait({'type': 'websocket.receive', 'text': text})
+
+    async def receive(self, timeout: float) -> list:
+        """
+        :param timeout: seconds to wait
+        :return: chat messages of the next frame (several if batched)
+        """
+        message = await asyncio.wait_for(self.output.get(), timeout)
+        data = json.loads(message['text'])
+        return data if isinstance(data, list) else [data]
+
+    async def close(self) -> None:
+        await self.input.put({'type': 'websocket.disconnect', 'code': 1000})
+        await self.task
+
+
+async def collect(client: Client, expected: int, latencies: list) -> int:
+    """
+    Receives until expected messages arrived, or nothing came for 2 seconds
+
+    :param client: receiving client
+    :param expected: messages sent to its room
+    :param latencies: list the latencies (seconds) are appended to
+    :return: messages received
+    """
+    received = 0
+    while received < expected:
+        try:
+            items = await client.receive(2)
+        except asyncio.TimeoutError:
+            break
+        now = time.perf_counter()
+        for item in items:
+            if 'message' in item:
+                latencies.append(now - float(item['message']))
+                received += 1
+    return received
+
+
+async def run(alias: str, rooms: int, clients: int, messages: int, rate: float) -> dict:
+    """
+    In each room one client sends messages, every client (the sender too) receives them
+
+    :param alias: CHANNEL_LAYERS alias
+    :param rooms: chat rooms
+    :param clients: clients per room
+    :param messages: messages sent per room
+    :param rate: messages per second per room, 0 for as fast as possible
+    :return: figures
+    """
+    from channels.layers import channel_layers
+
+    from chat.consumers import ChatConsumer
+
+    application = type('BenchConsumer', (ChatConsumer,), {'channel_layer_alias': alias}).as_asgi()
+    room_clients = [[Client(application, f'room{room}') for _ in range(clients)] for room in range(rooms)]
+    for members in room_clients:
+        for client in members:
+            await client.connect()
+    latencies = []
+    start = time.perf_counter()
+    receivers = [asyncio.ensure_future(collect(client, messages, latencies))
+                 for members in room_clients for client in members]
+    for sequence in range(messages):
+        for members in room_clients:
+            members[0].send(json.dumps({'message': repr(time.perf_counter())}))
+        await asyncio.sleep(1 / rate if rate else 0)
+    received = sum(await asyncio.gather(*receivers))
+    elapsed = time.perf_counter() - start
+    for members in room_clients:
+        for client in members:
+            await client.close()
+    await channel_layers[alias].flush()
+    latencies.sort()
+    return {
+        'delivered': received,
+        'expected': rooms * clients * messages,
+        'rate': received / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000 if latencies else float('nan'),
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan'),
+        'mean': statistics.fmean(latencies) * 1000 if latencies else float('nan'),
+    }
+
+
+async def redis_answers(url: str) -> bool:
+    """
+    :param url: Redis URL
+    :return: True if Redis answers a PING
+    """
+    import redis.asyncio
+
+    client = redis.asyncio.from_url(url)
+    try:
+        return await asyncio.wait_for(client.ping(), 1)
+    except (OSError, asyncio.TimeoutError, redis.exceptions.RedisError):
+        return False
+    finally:
+        await client.aclose()
+
+
+async def bench(args) -> None:
+    for alias in args.layers.split(','):
+        if alias == 'redis' and not await redis_answers(args.redis_url):
+            print(f'{alias:<9} skipped: no Redis at {args.redis_url}')
+            continue
+        result = await run(alias, args.rooms, args.clients, args.messages, args.rate)
+        print(f'{alias:<9} {result["rate"]:10.0f} msg/s  p50 {result["p50"]:8.2f} ms  p99 {result["p99"]:8.2f} ms  '
+              f'mean {result["mean"]:8.2f} ms  delivered {result["delivered"]}/{result["expected"]}')
+
+
+def main() -> None:
+    """
+    Prints delivered messages per second and latency percentiles per layer
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='ChatConsumer throughput and latency per channel layer')
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=20, help='clients per room')
+    parser.add_argument('--messages', type=int, default=200, help='messages sent per room')
+    parser.add_argument('--rate', type=float, default=0, help='messages per second per room, 0 for no limit')
+    parser.add_argument('--batch-ms', type=int, default=0, help='WEBSOCKET_BATCH_WINDOW_MS')
+    parser.add_argument('--layers', default='local,inmemory,redis')
+    parser.add_argument('--redis-url', default='redis://127.0.0.1:6379')
+    args = parser.parse_args()
+
+    LAYERS['redis']['CONFIG']['hosts'] = [args.redis_url]
+    settings.configure(
+        INSTALLED_APPS=['channels', 'chat', 'clublog', 'qsling'],
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        CHANNEL_LAYERS=LAYERS,
+        WEBSOCKET_BATCH_WINDOW_MS=args.batch_ms,
+        USE_TZ=True,
+    )
+    django.setup()
+    print(f'{args.rooms} rooms x {args.clients} clients, {args.messages} messages per room, '
+          f'batching {args.batch_ms or "off"}{" ms" if args.batch_ms else ""}')
+    asyncio.run(bench(args))
+
+
+if __name__ == '__main__':
+    main()
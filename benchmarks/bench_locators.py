@@ -0,0 +1,77 @@
+# benchmarks/bench_locators
+#
+# Per-call cost of the Maidenhead decoders
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_locators [--calls 200000]
+#
+import argparse
+import random
+import string
+import timeit
+
+from tools.locators import (cached_maidenhead_to_coordinates, maidenhead_to_coordinates,
+                            maidenhead_to_coordinates_batch)
+
+
+def random_locator(rng: random.Random, length: int) -> str:
+    """
+    A random valid locator
+
+    :param rng: random generator
+    :param length: 4, 6, 8 or 10
+    :return: locator
+    """
+    chars = [rng.choice('ABCDEFGHIJKLMNOPQR'), rng.choice('ABCDEFGHIJKLMNOPQR'),
+             rng.choice(string.digits), rng.choice(string.digits)]
+    if length >= 6:
+        chars += [rng.choice(string.ascii_uppercase[:24]), rng.choice(string.ascii_uppercase[:24])]
+    if length >= 8:
+        chars += [rng.choice(string.digits), rng.choice(string.digits)]
+    if length >= 10:
+        chars += [rng.choice(string.ascii_uppercase[:24]), rng.choice(string.ascii_uppercase[:24])]
+    return ''.join(chars)
+
+
+def per_call(function, locators: list, repeat: int = 3) -> float:
+    """
+    Best of repeat runs over the whole list
+
+    :param function: decoder taking one locator
+    :param locators: input
+    :param repeat: runs
+    :return: nanoseconds per call
+    """
+    timer = timeit.Timer(lambda: [function(locator) for locator in locators])
+    return min(timer.repeat(repeat, 1)) / len(locators) * 1e9
+
+
+def main() -> None:
+    """
+    Prints the cost per locator of each decoder, on a log-like input:
+    many calls spread over a small set of distinct grids
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Per-call cost of the Maidenhead decoders')
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--distinct', type=int, default=500, help='distinct locators in the input')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    grids = [random_locator(rng, rng.choice((4, 6, 8, 10))) for _ in range(args.distinct)]
+    locators = [rng.choice(grids) for _ in range(args.calls)]
+
+    uncached = per_call(maidenhead_to_coordinates, locators)
+    cached_maidenhead_to_coordinates.cache_clear()
+    cached = per_call(cached_maidenhead_to_coordinates, locators)
+    batch = min(timeit.Timer(lambda: maidenhead_to_coordinates_batch(locators)).repeat(3, 1)) / len(locators) * 1e9
+
+    print(f'{args.calls} calls over {args.distinct} distinct locators')
+    print(f'uncached  {uncached:10.1f} ns/call')
+    print(f'cached    {cached:10.1f} ns/call  {cached_maidenhead_to_coordinates.cache_info()}')
+    print(f'batch     {batch:10.1f} ns/locator')
+
+
+if __name__ == '__main__':
+    main()
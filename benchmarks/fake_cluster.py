@@ -0,0 +1,126 @@
+# benchmarks/fake_cluster
+#
+# Local stand-in for a telnet DX cluster: asks for a callsign, then sends random spots to every client,
+# to drive manage.py feed_spots (and the ws/spots/ subscribers behind it) at contest rates
+#
+# Run from the repository root:
+#     python -m benchmarks.fake_cluster [--port 7300] [--rate 50]
+#
+import argparse
+import asyncio
+import random
+import time
+
+PREFIXES = ('K', 'W', 'N', 'VE', 'EA', 'EA8', 'F', 'G', 'DL', 'I', 'OH', 'SM', 'UA', 'UA9', 'JA', 'VK', 'ZL', 'PY',
+            'LU', 'ZS', 'CN', '5B', '4X', 'VU', 'BY', 'HS', 'KH6', 'KL7', 'CE', 'HK', 'YB', 'A6', 'SV', 'OK', 'SP')
+# (low, high) kHz of the busy part of each band
+SEGMENTS = ((1810, 1900), (3500, 3800), (7000, 7200), (10100, 10140), (14000, 14300), (18068, 18160),
+            (21000, 21400), (24890, 24990), (28000, 28600), (50080, 50320))
+COMMENTS = ('CW 599', 'SSB 59', 'FT8 -12dB', 'FT4', 'RTTY', 'up 2', 'tnx QSO', '', 'CQ WW', 'big signal')
+
+
+def random_call(rng: random.Random) -> str:
+    """
+    :param rng: random generator
+    :return: plausible callsign
+    """
+    suffix = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(1, 3)))
+    return f'{rng.choice(PREFIXES)}{rng.randint(0, 9)}{suffix}'
+
+
+def random_spot(rng: random.Random) -> str:
+    """
+    :param rng: random generator
+    :return: DX cluster spot line
+    """
+    low, high = rng.choice(SEGMENTS)
+    spotter = f'{random_call(rng)}-#:'
+    return (f'DX de {spotter:<10}{rng.uniform(low, high):>8.1f}  {random_call(rng):<13}{rng.choice(COMMENTS):<30}'
+            f' {time.strftime("%H%MZ", time.gmtime())}')
+
+
+class FakeCluster:
+    """
+    Sends the same random spots, rate per second, to every logged in client
+    """
+
+    def __init__(self, rate: float, seed: int = None) -> None:
+        """
+        :param rate: spots per second
+        :param seed: random seed
+        """
+        self.rate = rate
+        self.rng = random.Random(seed)
+        self.clients = set()
+        self.sent = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        One client: login prompt, then spots until it goes away
+
+        :param reader: client stream
+        :param writer: client stream
+        :return:
+        """
+        writer.write(b'Please enter your call: ')
+        login = (await reader.readline()).decode('latin1').strip()
+        writer.write(f'Hello {login}, this is a fake cluster\r\n'.encode('latin1'))
+        self.clients.add(writer)
+        try:
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def broadcast(self) -> None:
+        """
+        Emits the spots, catching up in bursts if the loop falls behind
+
+        :return:
+        """
+        start = time.perf_counter()
+        while True:
+            due = int((time.perf_counter() - start) * self.rate) - self.sent
+            for _ in range(due):
+                line = f'{random_spot(self.rng)}\r\n'.encode('latin1')
+                for writer in list(self.clients):
+                    writer.write(line)
+                self.sent += 1
+            await asyncio.sleep(min(0.1, 1 / self.rate))
+
+
+async def serve(port: int, rate: float, seed: int = None) -> None:
+    """
+    :param port: TCP port on 127.0.0.1
+    :param rate: spots per second
+    :param seed: random seed
+    :return:
+    """
+    cluster = FakeCluster(rate, seed)
+    server = await asyncio.start_server(cluster.handle, '127.0.0.1', port)
+    print(f'Fake cluster on 127.0.0.1:{port}, {rate:g} spots/s')
+    async with server:
+        await asyncio.gather(server.serve_forever(), cluster.broadcast())
+
+
+def main() -> None:
+    """
+    Serves until interrupted
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Local stand-in for a telnet DX cluster')
+    parser.add_argument('--port', type=int, default=7300)
+    parser.add_argument('--rate', type=float, default=50, help='spots per second')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.port, args.rate, args.seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# chat/batching
+#
+# Opt-in coalescing for websocket consumers (settings.WEBSOCKET_BATCH_WINDOW_MS): events arriving within
+# the window go out as one websocket frame (a JSON array) and one channel layer call per group
+#
+import asyncio
+import itertools
+import logging
+
+from channels.consumer import get_handler_name
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Channel layer event carrying several events: {"type": "batch.events", "events": [...]}
+BATCH_EVENT = 'batch.events'
+# Frames collected for a client within one window; beyond this, older ones are dropped
+DEFAULT_MAX_EVENTS = 500
+
+
+def batch_window() -> float:
+    """
+    :return: coalescing window in seconds, 0 when batching is off
+    """
+    return max(0, getattr(settings, 'WEBSOCKET_BATCH_WINDOW_MS', 0)) / 1000
+
+
+def batch_max_events() -> int:
+    """
+    :return: events buffered per client (and per group) before dropping or flushing early
+    """
+    return getattr(settings, 'WEBSOCKET_BATCH_MAX_EVENTS', DEFAULT_MAX_EVENTS)
+
+
+class GroupBatcher:
+    """
+    Collects group_send events for window seconds and sends each group's events in a single call,
+    wrapped in a batch.events event when there is more than one. A window of 0 sends straight away
+    """
+
+    def __init__(self, channel_layer, window: float = None, max_events: int = None) -> None:
+        """
+        :param channel_layer: channel layer to send through
+        :param window: seconds, defaults to batch_window()
+        :param max_events: events per group that trigger an early flush, defaults to batch_max_events()
+        """
+        self.channel_layer = channel_layer
+        self.window = batch_window() if window is None else window
+        self.max_events = batch_max_events() if max_events is None else max_events
+        self.pending = {}
+        self.task = None
+
+    async def group_send(self, group: str, event: dict) -> None:
+        """
+        Queues an event for a group
+
+        :param group: group name
+        :param event: channel layer event
+        :return:
+        """
+        if not self.window:
+            await self.channel_layer.group_send(group, event)
+            return
+        events = self.pending.setdefault(group, [])
+        events.append(event)
+        if len(events) >= self.max_events:
+            await self.flush()
+        elif self.task is None:
+            self.task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        """
+        Flushes at the end of the window. Nobody awaits this task: errors are logged here
+
+        :return:
+        """
+        await asyncio.sleep(self.window)
+        self.task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception('Cannot send batched channel layer events')
+
+    async def flush(self) -> None:
+        """
+        Sends what is pending
+
+        :return:
+        """
+        pending, self.pending = self.pending, {}
+        for group, events in pending.items():
+            await self.channel_layer.group_send(group, events[0] if len(events) == 1 else
+                                                {'type': BATCH_EVENT, 'events': events})
+
+    async def close(self) -> None:
+        """
+        Sends what is pending, then stops the timer
+
+        :return:
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+
+
+class BatchingMixin:
+    """
+    For AsyncWebsocketConsumer subclasses. Handlers call send_frame() with serialized text instead of send(),
+    and group_send() instead of channel_layer.group_send(). With batching on, frames are sent every window
+    as one JSON array, and outgoing events go through a GroupBatcher.
+    Within a window at most max_events frames are collected: frames with the same merge_key() replace each other,
+    otherwise the oldest are dropped and the client is told how many ({"dropped": n}).
+    That bounds a burst, not a slow client: send() returns once the server has buffered the frame
+    (ASGI has no backpressure), so what waits on the client's socket is up to the server.
+    batch.events events are unpacked whether batching is on or not
+    """
+    # Override per class; None takes the settings
+    window = None
+    max_events = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if self.window is None:
+            self.window = batch_window()
+        if self.max_events is None:
+            self.max_events = batch_max_events()
+        self.outbox = {}
+        self.dropped = 0
+        self.sequence = itertools.count()
+        self.drain_task = None
+        self.batcher = None
+
+    def merge_key(self, event: dict):
+        """
+        Frames of events with the same key replace each other while waiting
+
+        :param event: channel layer event the frame comes from
+        :return: hashable key, or None to never merge
+        """
+        return None
+
+    async def group_send(self, group: str, event: dict) -> None:
+        """
+        :param group: group name
+        :param event: channel layer event
+        :return:
+        """
+        if self.batcher is None:
+            self.batcher = GroupBatcher(self.channel_layer, self.window, self.max_events)
+        await self.batcher.group_send(group, event)
+
+    async def send_frame(self, text: str, event: dict = None) -> None:
+        """
+        Sends serialized text to the client, now or at the end of the window
+
+        :param text: JSON text
+        :param event: event the text comes from, for merge_key()
+        :return:
+        """
+        if not self.window:
+            await self.send(text_data=text)
+            return
+        key = self.merge_key(event) if event is not None else None
+        if key is None:
+            key = next(self.sequence)
+        if key not in self.outbox and len(self.outbox) >= self.max_events:
+            del self.outbox[next(iter(self.outbox))]
+            self.dropped += 1
+        self.outbox[key] = text
+        if self.drain_task is None:
+            self.drain_task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self) -> None:
+        """
+        Sends the waiting frames every window, until there are none. Nobody awaits this task: errors are logged here
+
+        :return:
+        """
+        try:
+            while self.outbox:
+                await asyncio.sleep(self.window)
+                frames = list(self.outbox.values())
+                if self.dropped:
+                    frames.append(f'{{"dropped": {self.dropped}}}')
+                self.outbox, self.dropped = {}, 0
+                await self.send(text_data=f'[{",".join(frames)}]')
+        except Exception:
+            logger.exception('Cannot send batched frames to %s', self.channel_name)
+        finally:
+            self.drain_task = None
+
+    async def batch_events(self, event: dict) -> None:
+        """
+        Hands each event of a batch to its handler
+
+        :param event: batch.events event
+        :return:
+        """
+        for inner in event['events']:
+            await getattr(self, get_handler_name(inner))(inner)
+
+    async def websocket_disconnect(self, message):
+        # Messages the client sent are delivered; frames for it are not
+        if self.batcher is not None:
+            await self.batcher.close()
+        if self.drain_task is not None:
+            self.drain_task.cancel()
+        await super().websocket_disconnect(message)
@@ -1,19 +1,46 @@
 # chat/consumers.py
 import json
 
+from channels.consumer import get_handler_name
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from .batching import BatchingMixin
+from .history import get_history
+from .spots import SpotFilter
 
-class ChatConsumer(AsyncWebsocketConsumer):
+
+class NoDatabaseMixin:
+    """
+    For consumers that never use the database. Channels closes stale database connections
+    before every handler call, which costs a hop to the sync thread per message: skip it
+    """
+
+    async def dispatch(self, message):
+        handler = getattr(self, get_handler_name(message), None)
+        if handler is None:
+            raise ValueError(f"No handler for message type {message['type']}")
+        await handler(message)
+
+
+class ChatConsumer(NoDatabaseMixin, BatchingMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"chat_{self.room_name}"
 
+        # The last messages of the room, read before joining: a message arriving meanwhile
+        # comes through the group only, never twice
+        history = get_history()
+        recent = await history.recent(self.room_name) if history is not None else []
+
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
         await self.accept()
 
+        # Catch up, in one frame
+        if recent:
+            await self.send(text_data=f"[{','.join(recent)}]")
+
     async def disconnect(self, close_code):
         # Leave room group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
@@ -21,13 +48,70 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
         message = text_data_json["message"]
+        # Serialized once, here, for the history and every receiver
+        text = json.dumps({"message": message})
+
+        history = get_history()
+        if history is not None:
+            await history.append(self.room_name, text)
 
         # Send message to room group
-        await self.channel_layer.group_send(self.room_group_name, {"type": "chat.message", "message": message})
+        await self.group_send(self.room_group_name, {"type": "chat.message", "message": message, "text": text})
 
     # Receive message from room group
     async def chat_message(self, event):
-        message = event["message"]
+        text = event.get("text") or json.dumps({"message": event["message"]})
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({"message": message}))
+        await self.send_frame(text)
+
+
+class SpotConsumer(NoDatabaseMixin, BatchingMixin, AsyncWebsocketConsumer):
+    """
+    Streams DX cluster spots, filtered server side by band, mode and continent:
+        ws/spots/?band=20m,40m&mode=CW&cont=EU
+    The filter may be changed later by sending {"bands": [...], "modes": [...], "conts": [...]}.
+    Spots arrive already serialized (see chat.spots.SpotFeeder) and are forwarded as they are,
+    coalesced when batching is on (see chat.batching)
+    """
+
+    async def connect(self):
+        try:
+            self.filter = SpotFilter.from_query_string(self.scope.get("query_string", b""))
+        except ValueError:
+            await self.close(code=4400)
+            return
+        await self.join(self.filter.groups())
+        await self.accept()
+
+    async def join(self, groups):
+        """
+        Moves the consumer to the given groups; self.groups is what Channels leaves on disconnect
+
+        :param groups: channel layer groups
+        :return:
+        """
+        for group in set(self.groups) - set(groups):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in set(groups) - set(self.groups):
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.groups = list(groups)
+
+    async def receive(self, text_data):
+        try:
+            request = json.loads(text_data)
+            self.filter = SpotFilter.build(request.get("bands", ()), request.get("modes", ()), request.get("conts", ()))
+        except (ValueError, AttributeError) as error:
+            await self.send(text_data=json.dumps({"error": str(error)}))
+            return
+        await self.join(self.filter.groups())
+        await self.send(text_data=json.dumps({"subscribed": self.filter._asdict()}, default=sorted))
+
+    # A newer spot of the same call on the same band replaces one still waiting to be sent
+    def merge_key(self, event):
+        return event["call"], event["band"]
+
+    # Spot from the feeder
+    async def spot_message(self, event):
+        if self.filter.matches(event):
+            await self.send_frame(event["text"], event)
@@ -0,0 +1,177 @@
+# chat/history
+#
+# Last messages of each chat room, sent to clients as they join (settings.CHAT_HISTORY).
+# Kept in process, or in Redis streams when several processes serve the rooms
+#
+import collections
+import time
+
+import redis.asyncio
+from django.conf import settings
+
+# Defaults of the CHAT_HISTORY_* settings
+MESSAGES = 50
+BYTES = 64 * 1024
+IDLE_SECONDS = 60 * 60
+ROOMS = 10000
+# Seconds between sweeps of idle rooms
+SWEEP_INTERVAL = 60
+
+
+class Room:
+    """
+    Ring buffer of one room: serialized messages, oldest first
+    """
+    __slots__ = ('messages', 'size', 'used')
+
+    def __init__(self) -> None:
+        self.messages = collections.deque()
+        self.size = 0
+        self.used = time.monotonic()
+
+
+class LocalHistory:
+    """
+    In process history: each room keeps its last max_messages messages, within max_bytes.
+    Rooms without activity for idle_seconds are forgotten, and beyond max_rooms the least recently used go first
+    """
+
+    def __init__(self, max_messages: int = MESSAGES, max_bytes: int = BYTES, idle_seconds: float = IDLE_SECONDS,
+                 max_rooms: int = ROOMS) -> None:
+        """
+        :param max_messages: messages kept per room
+        :param max_bytes: UTF-8 bytes kept per room
+        :param idle_seconds: rooms unused for this long are dropped
+        :param max_rooms: rooms kept
+        """
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.max_rooms = max_rooms
+        self.rooms = collections.OrderedDict()
+        self.next_sweep = 0.0
+
+    def _sweep(self, now: float) -> None:
+        """
+        Drops idle rooms, at most every SWEEP_INTERVAL; rooms are in least recently used order
+
+        :param now: time.monotonic()
+        :return:
+        """
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + SWEEP_INTERVAL
+        while self.rooms:
+            room = next(iter(self.rooms.values()))
+            if now - room.used < self.idle_seconds:
+                break
+            self.rooms.popitem(last=False)
+
+    async def append(self, room_name: str, text: str) -> None:
+        """
+        :param room_name: room
+        :param text: serialized message, as sent to clients; not kept if larger than max_bytes on its own
+        :return:
+        """
+        size = len(text.encode('utf8'))
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        self._sweep(now)
+        room = self.rooms.get(room_name)
+        if room is None:
+            room = self.rooms[room_name] = Room()
+            if len(self.rooms) > self.max_rooms:
+                self.rooms.popitem(last=False)
+        else:
+            self.rooms.move_to_end(room_name)
+        room.used = now
+        room.messages.append((text, size))
+        room.size += size
+        while len(room.messages) > self.max_messages or room.size > self.max_bytes:
+            room.size -= room.messages.popleft()[1]
+
+    async def recent(self, room_name: str) -> list:
+        """
+        :param room_name: room
+        :return: serialized messages, oldest first
+        """
+        room = self.rooms.get(room_name)
+        if room is None:
+            return []
+        room.used = time.monotonic()
+        self.rooms.move_to_end(room_name)
+        return [text for text, _size in room.messages]
+
+
+class RedisHistory:
+    """
+    History in one Redis stream per room, shared by every process. Streams are trimmed to about
+    max_messages entries when written and expire after idle_seconds without messages.
+    Messages larger than max_bytes are not written; the room's bytes limit is applied when reading
+    """
+    KEY = 'lflog:chat:history:{}'
+
+    def __init__(self, url: str, max_messages: int = MESSAGES, max_bytes: int = BYTES,
+                 idle_seconds: float = IDLE_SECONDS) -> None:
+        """
+        :param url: Redis URL
+        :param max_messages: messages kept per room
+        :param max_bytes: UTF-8 bytes returned per room
+        :param idle_seconds: streams unused for this long expire
+        """
+        self.redis = redis.asyncio.from_url(url)
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.idle_seconds = int(idle_seconds)
+
+    async def append(self, room_name: str, text: str) -> None:
+        """
+        :param room_name: room
+        :param text: serialized message, as sent to clients; not kept if larger than max_bytes on its own
+        :return:
+        """
+        if len(text.encode('utf8')) > self.max_bytes:
+            return
+        key = self.KEY.format(room_name)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(key, {'text': text}, maxlen=self.max_messages, approximate=True)
+            pipe.expire(key, self.idle_seconds)
+            await pipe.execute()
+
+    async def recent(self, room_name: str) -> list:
+        entries = await self.redis.xrevrange(self.KEY.format(room_name), count=self.max_messages)
+        messages = []
+        size = 0
+        for _id, fields in entries:
+            size += len(fields[b'text'])
+            if size > self.max_bytes:
+                break
+            messages.append(fields[b'text'].decode('utf8'))
+        messages.reverse()
+        return messages
+
+
+_history = None
+
+
+def get_history() -> LocalHistory | RedisHistory | None:
+    """
+    Process-wide history, built on first use from CHAT_HISTORY ('memory', 'redis' or 'off')
+    and CHAT_HISTORY_MESSAGES, _BYTES, _IDLE_SECONDS, _ROOMS
+
+    :return: LocalHistory, RedisHistory, or None when history is off
+    """
+    global _history
+    if _history is None:
+        backend = getattr(settings, 'CHAT_HISTORY', 'memory')
+        limits = {'max_messages': getattr(settings, 'CHAT_HISTORY_MESSAGES', MESSAGES),
+                  'max_bytes': getattr(settings, 'CHAT_HISTORY_BYTES', BYTES),
+                  'idle_seconds': getattr(settings, 'CHAT_HISTORY_IDLE_SECONDS', IDLE_SECONDS)}
+        if backend == 'memory':
+            _history = LocalHistory(max_rooms=getattr(settings, 'CHAT_HISTORY_ROOMS', ROOMS), **limits)
+        elif backend == 'redis':
+            _history = RedisHistory(getattr(settings, 'CHAT_HISTORY_REDIS_URL', 'redis://127.0.0.1:6379'), **limits)
+        elif backend != 'off':
+            raise ValueError(f"CHAT_HISTORY must be 'memory', 'redis' or 'off', not {backend!r}")
+    return _history
@@ -0,0 +1,212 @@
+# chat/layers
+#
+# In-process channel layer for single process deployments: no Redis round trip per message.
+# Several Daphne processes or hosts need channels_redis instead (settings.CHANNEL_LAYER)
+#
+import asyncio
+import collections
+import time
+import uuid
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer, get_channel_layer
+
+# Seconds between sweeps of expired messages and group memberships
+SWEEP_INTERVAL = 1.0
+
+
+class Channel:
+    """
+    Messages waiting on one channel, as (expiry time, message), oldest first,
+    and the receivers waiting for one (futures, woken in turn)
+    """
+    __slots__ = ('capacity', 'messages', 'waiters')
+
+    def __init__(self, capacity: int) -> None:
+        """
+        :param capacity: messages waiting, beyond which sends fail
+        """
+        self.capacity = capacity
+        self.messages = collections.deque()
+        self.waiters = collections.deque()
+
+    def wake(self) -> None:
+        """
+        Wakes the first receiver still waiting
+
+        :return:
+        """
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+
+def is_local(channel_layer=None) -> bool:
+    """
+    :param channel_layer: layer to check, defaults to the default layer
+    :return: True if the layer only reaches consumers of this process
+    """
+    return isinstance(channel_layer or get_channel_layer(), LocalChannelLayer)
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    """
+    Like channels.layers.InMemoryChannelLayer, without its per message costs:
+        group_send puts the message straight on each member's queue (no task per member, no copy),
+        expired messages and memberships are swept once a second instead of on every call.
+    Messages are shared between the receivers of a group_send: consumers must not modify them.
+    CONFIG takes the usual expiry, group_expiry, capacity and channel_capacity
+    """
+    extensions = ['groups', 'flush']
+
+    def __init__(self, expiry: int = 60, group_expiry: int = 86400, capacity: int = 100, channel_capacity=None,
+                 **kwargs) -> None:
+        """
+        :param expiry: seconds a message waits to be received before it is dropped
+        :param group_expiry: seconds after which a group membership ends
+        :param capacity: messages waiting per channel, beyond which sends fail (ChannelFull)
+        :param channel_capacity: {channel glob or regex: capacity} exceptions
+        """
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.group_expiry = group_expiry
+        self.channels = {}
+        self.groups = {}
+        self.next_sweep = 0.0
+        # group_send messages that found a full channel
+        self.dropped = 0
+
+    def _channel(self, name: str) -> Channel:
+        """
+        :param name: channel name
+        :return: its Channel, created when missing
+        """
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = Channel(self.get_capacity(name))
+        return channel
+
+    def _put(self, name: str, item: tuple) -> bool:
+        """
+        :param name: channel name
+        :param item: (expiry time, message)
+        :return: False if the channel is full
+        """
+        channel = self._channel(name)
+        if len(channel.messages) >= channel.capacity:
+            return False
+        channel.messages.append(item)
+        channel.wake()
+        return True
+
+    def _sweep(self, now: float) -> None:
+        """
+        Drops expired messages, and the group memberships of channels that let a message expire
+        (their consumer is gone) or joined more than group_expiry ago. Runs at most every SWEEP_INTERVAL
+
+        :param now: time.time()
+        :return:
+        """
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + SWEEP_INTERVAL
+        abandoned = set()
+        for name, channel in list(self.channels.items()):
+            messages = channel.messages
+            while messages and messages[0][0] < now:
+                messages.popleft()
+                abandoned.add(name)
+            if not messages and not channel.waiters:
+                del self.channels[name]
+        joined_before = now - self.group_expiry
+        for group, members in list(self.groups.items()):
+            for channel in [channel for channel, joined in members.items()
+                            if channel in abandoned or joined < joined_before]:
+                del members[channel]
+            if not members:
+                del self.groups[group]
+
+    async def send(self, channel: str, message: dict) -> None:
+        """
+        :param channel: channel name
+        :param message: message dict
+        :return:
+        :raises ChannelFull: when the channel has capacity messages waiting
+        """
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        now = time.time()
+        self._sweep(now)
+        if not self._put(channel, (now + self.expiry, message)):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel: str) -> dict:
+        """
+        :param channel: channel name
+        :return: next message that has not expired
+        """
+        self.require_valid_channel_name(channel)
+        waiting = self._channel(channel)
+        while True:
+            while waiting.messages:
+                expires, message = waiting.messages.popleft()
+                if expires >= time.time():
+                    return message
+            waiter = asyncio.get_running_loop().create_future()
+            waiting.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in waiting.waiters:
+                    waiting.waiters.remove(waiter)
+                elif waiting.messages:
+                    # Woken for a message it will not take: pass it on
+                    waiting.wake()
+                raise
+
+    async def new_channel(self, prefix: str = 'specific.') -> str:
+        """
+        :param prefix: channel name prefix
+        :return: new process local channel name
+        """
+        return f'{prefix}.local!{uuid.uuid4().hex[:12]}'
+
+    async def group_add(self, group: str, channel: str) -> None:
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self.groups.setdefault(group, {})[channel] = time.time()
+
+    async def group_discard(self, group: str, channel: str) -> None:
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        members = self.groups.get(group)
+        if members:
+            members.pop(channel, None)
+            if not members:
+                del self.groups[group]
+
+    async def group_send(self, group: str, message: dict) -> None:
+        """
+        Puts the message on every member's queue; full channels miss it, as with channels_redis
+
+        :param group: group name
+        :param message: message dict, shared by every receiver
+        :return:
+        """
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        now = time.time()
+        self._sweep(now)
+        item = (now + self.expiry, message)
+        for channel in self.groups.get(group, ()):
+            if not self._put(channel, item):
+                self.dropped += 1
+
+    async def flush(self) -> None:
+        self.channels = {}
+        self.groups = {}
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,65 @@
+# chat/management/commands/feed_spots
+#
+# Reads a telnet DX cluster and fans the spots out to the ws/spots/ subscribers
+#
+import asyncio
+import signal
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+from clublog.resolver import get_resolver
+from my_station.models import MyStation
+from qsling.membership import get_membership_index
+
+from ...layers import is_local
+from ...spots import SpotEnricher, SpotFeeder
+
+
+class Command(BaseCommand):
+    help = 'Publishes the spots of a telnet DX cluster to the websocket spot stream, until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('login', help='callsign to log in to the cluster with')
+        parser.add_argument('--host', default='127.0.0.1', help='cluster host')
+        parser.add_argument('--port', type=int, default=7300, help='cluster port')
+        parser.add_argument('--station', help='station id or callsign distances are measured from')
+
+    def handle(self, *args, **options):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            raise CommandError('CHANNEL_LAYERS is not configured')
+        if is_local(channel_layer):
+            raise CommandError('The in-memory channel layer only reaches this process: use Redis to feed spots')
+        if options['station']:
+            value = options['station']
+            stations = MyStation.objects.filter(pk=int(value)) if value.isdigit() else MyStation.objects.filter(callsign__iexact=value)
+            station = stations.first()
+            if station is None:
+                raise CommandError(f'Unknown station {value}')
+            enricher = SpotEnricher(station.latitude, station.longitude)
+        else:
+            enricher = SpotEnricher()
+        feeder = SpotFeeder(options['host'], options['port'], options['login'], enricher, channel_layer)
+        asyncio.run(self.serve(feeder))
+
+    async def serve(self, feeder: SpotFeeder) -> None:
+        """
+        Loads the lookup tables, then feeds until SIGINT / SIGTERM
+
+        :param feeder: what to run
+        :return:
+        """
+        # Built here, so the first spots do not wait for the database
+        await sync_to_async(get_resolver)()
+        await sync_to_async(get_membership_index)()
+        task = asyncio.get_running_loop().create_task(feeder.run())
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, task.cancel)
+        self.stdout.write(f'Reading {feeder.host}:{feeder.port} as {feeder.login}')
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self.stdout.write(f'{feeder.published} spots published')
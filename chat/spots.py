@@ -0,0 +1,326 @@
+# chat/spots
+#
+# DX cluster spots: parsed, enriched (DXCC, distance, LoTW) and serialized once by the feeder,
+# then fanned out through the channel layer to SpotConsumer, which only filters and forwards the text
+#
+import asyncio
+import datetime
+import logging
+import re
+from typing import Iterable, NamedTuple
+from urllib.parse import parse_qs
+
+import orjson
+from asgiref.sync import sync_to_async
+
+from adif.bands import BAND_NAMES, band_for_frequency
+from clublog.resolver import get_resolver
+from qsling.membership import get_membership_index
+from tools.distance import distance_azimuth
+
+from .batching import GroupBatcher
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for refreshed reference data
+TABLES_CHECK_INTERVAL = 10
+# Every spot goes to this group, and to the group of its band, see band_group()
+ALL_GROUP = 'spots_all'
+CONTINENTS = frozenset(('AF', 'AN', 'AS', 'EU', 'NA', 'OC', 'SA'))
+
+# DX de EA3IEG:     14025.0  K1ABC        CW 599 up 2                    1234Z JN11
+SPOT_LINE = re.compile(r'^DX de (?P<spotter>[A-Z0-9/#-]+)[:\s]\s*(?P<khz>\d+(?:\.\d+)?)\s+(?P<call>[A-Z0-9/]+)'
+                       r'\s*(?P<comment>.*?)\s*(?P<time>[0-2]\d[0-5]\d)Z(?:\s+(?P<grid>[A-R]{2}\d{2}))?\s*$',
+                       re.IGNORECASE)
+
+# Words of a spot comment naming the mode, and the mode they stand for
+MODE_WORDS = {
+    'CW': 'CW', 'SSB': 'SSB', 'USB': 'SSB', 'LSB': 'SSB', 'FM': 'FM', 'AM': 'AM',
+    'FT8': 'FT8', 'FT4': 'FT4', 'RTTY': 'RTTY', 'PSK': 'PSK', 'PSK31': 'PSK', 'PSK63': 'PSK',
+    'JT65': 'JT65', 'JT9': 'JT9', 'MSK144': 'MSK144', 'Q65': 'Q65', 'SSTV': 'SSTV', 'JS8': 'JS8',
+}
+# Usual FT8 and FT4 dial frequencies (kHz); signals sit up to 3 kHz above
+FT8_DIALS = (1840, 3573, 5357, 7074, 10136, 14074, 18100, 21074, 24915, 28074, 50313, 144174)
+FT4_DIALS = (3575, 7047.5, 10140, 14080, 18104, 21140, 24919, 28180, 50318, 144170)
+# Top of the CW segment of each band (kHz); above it, phone
+CW_TOPS = {'160m': 1838, '80m': 3570, '60m': 5366, '40m': 7040, '30m': 10150, '20m': 14070, '17m': 18095,
+           '15m': 21070, '12m': 24915, '10m': 28070, '6m': 50100, '2m': 144150, '70cm': 432100}
+
+# Calls whose enrichment is remembered; the same station gets spotted over and over
+ENRICH_CACHE_SIZE = 20000
+
+
+class Spot(NamedTuple):
+    """
+    One line of a DX cluster, as received
+    """
+    spotter: str
+    khz: float
+    call: str
+    comment: str
+    time: str
+    grid: str
+
+
+def parse_spot(line: str) -> Spot | None:
+    """
+    :param line: line from the cluster, without the line ending
+    :return: Spot, or None for anything else (announcements, prompts, WWV...)
+    """
+    match = SPOT_LINE.match(line.strip())
+    if match is None:
+        return None
+    return Spot(match['spotter'].upper(), float(match['khz']), match['call'].upper(), match['comment'],
+                f'{match["time"][:2]}:{match["time"][2:]}', (match['grid'] or '').upper())
+
+
+def guess_mode(khz: float, band: str, comment: str) -> str:
+    """
+    Mode named in the comment, otherwise the one the band plan suggests
+
+    :param khz: frequency in kHz
+    :param band: ADIF band of the frequency
+    :param comment: spot comment
+    :return: mode (CW, SSB, FT8...), empty string if there is no telling
+    """
+    for word in comment.upper().split():
+        mode = MODE_WORDS.get(word)
+        if mode:
+            return mode
+    for dials, mode in ((FT8_DIALS, 'FT8'), (FT4_DIALS, 'FT4')):
+        if any(dial <= khz <= dial + 3 for dial in dials):
+            return mode
+    top = CW_TOPS.get(band)
+    if top is None:
+        return ''
+    return 'CW' if khz <= top else 'SSB'
+
+
+def band_group(band: str) -> str:
+    """
+    :param band: ADIF band, or empty string
+    :return: channel layer group of the spots on that band
+    """
+    return f'spots_{band or "other"}'
+
+
+class SpotEnricher:
+    """
+    Turns Spots into the JSON text sent to every client, adding what the resolver,
+    the LoTW index and the distance from the home station tell about the DX call
+    """
+
+    def __init__(self, latitude: float = None, longitude: float = None) -> None:
+        """
+        :param latitude: home station latitude, no distances without it
+        :param longitude: home station longitude
+        """
+        self.home = (latitude, longitude) if latitude is not None and longitude is not None else None
+        self.cache = {}
+        self.resolver = None
+        self.index = None
+
+    def _tables(self) -> None:
+        """
+        Follows reference data refreshes: a new resolver or index empties the cache.
+        Runs in the event loop, so it never reloads them itself (see SpotFeeder.follow_tables)
+
+        :return:
+        """
+        resolver, index = get_resolver(reload=False), get_membership_index(reload=False)
+        if resolver is not self.resolver or index is not self.index:
+            self.resolver, self.index = resolver, index
+            self.cache.clear()
+
+    def about(self, call: str) -> dict:
+        """
+        What the DX call resolves to, cached
+
+        :param call: DX callsign
+        :return: dict with dxcc, entity, cont, cqz, lotw, distance and bearing
+        """
+        about = self.cache.get(call)
+        if about is None:
+            info = self.resolver.resolve(call)
+            about = {'dxcc': None, 'entity': None, 'cont': None, 'cqz': None,
+                     'lotw': call in self.index.lotw, 'distance': None, 'bearing': None}
+            if info is not None:
+                about.update(dxcc=info.adif, entity=info.entity, cont=info.cont, cqz=info.cqz)
+                if self.home is not None:
+                    distance, bearing = distance_azimuth(*self.home, info.lat, info.long)
+                    about.update(distance=round(distance), bearing=round(bearing))
+            if len(self.cache) >= ENRICH_CACHE_SIZE:
+                self.cache.clear()
+            self.cache[call] = about
+        return about
+
+    def enrich(self, spot: Spot, received: datetime.datetime = None) -> dict:
+        """
+        Channel layer event carrying the serialized spot, plus the keys SpotConsumer filters on
+
+        :param spot: parsed spot
+        :param received: when the spot arrived, defaults to now
+        :return: event dict (type spot.message)
+        """
+        self._tables()
+        band = band_for_frequency(spot.khz / 1000)
+        mode = guess_mode(spot.khz, band, spot.comment)
+        about = self.about(spot.call)
+        received = received or datetime.datetime.now(datetime.timezone.utc)
+        text = orjson.dumps({
+            'spotter': spot.spotter, 'freq': spot.khz, 'band': band, 'mode': mode, 'call': spot.call,
+            'comment': spot.comment, 'time': spot.time, 'grid': spot.grid, 'received': received, **about,
+        }).decode('utf8')
+        return {'type': 'spot.message', 'call': spot.call, 'band': band, 'mode': mode, 'cont': about['cont'], 'text': text}
+
+
+class SpotFilter(NamedTuple):
+    """
+    What a client wants to see; an empty set lets everything through
+    """
+    bands: frozenset = frozenset()
+    modes: frozenset = frozenset()
+    conts: frozenset = frozenset()
+
+    @classmethod
+    def build(cls, bands: Iterable[str] = (), modes: Iterable[str] = (), conts: Iterable[str] = ()) -> 'SpotFilter':
+        """
+        :param bands: ADIF bands (20m)
+        :param modes: modes (CW, SSB, FT8...)
+        :param conts: continents (EU, NA...)
+        :return: SpotFilter
+        :raises ValueError: for unknown bands or continents
+        """
+        bands = frozenset(band.strip().lower() for band in bands if band.strip())
+        modes = frozenset(mode.strip().upper() for mode in modes if mode.strip())
+        conts = frozenset(cont.strip().upper() for cont in conts if cont.strip())
+        unknown = sorted(bands - BAND_NAMES) + sorted(conts - CONTINENTS)
+        if unknown:
+            raise ValueError(f'Unknown bands or continents: {", ".join(unknown)}')
+        return cls(bands, modes, conts)
+
+    @classmethod
+    def from_query_string(cls, query_string: bytes) -> 'SpotFilter':
+        """
+        :param query_string: ?band=20m,40m&mode=CW&cont=EU, as found in the ASGI scope
+        :return: SpotFilter
+        """
+        query = parse_qs(query_string.decode('latin1'))
+
+        def values(name):
+            return [value for item in query.get(name, ()) for value in item.split(',')]
+
+        return cls.build(values('band'), values('mode'), values('cont'))
+
+    def groups(self) -> list:
+        """
+        :return: channel layer groups to join: one per band, or every spot
+        """
+        return [band_group(band) for band in sorted(self.bands)] if self.bands else [ALL_GROUP]
+
+    def matches(self, event: dict) -> bool:
+        """
+        :param event: spot.message event
+        :return: True if the client wants the spot
+        """
+        if self.modes and event['mode'] not in self.modes:
+            return False
+        if self.conts and event['cont'] not in self.conts:
+            return False
+        return not self.bands or event['band'] in self.bands
+
+
+class SpotFeeder:
+    """
+    Reads a telnet DX cluster and publishes every spot to the channel layer.
+    Reconnects (backing off up to a minute) when the cluster goes away.
+    With batching on, the spots of each window go to each group in a single channel layer call
+    """
+
+    def __init__(self, host: str, port: int, login: str, enricher: SpotEnricher, channel_layer) -> None:
+        """
+        :param host: cluster host
+        :param port: cluster port
+        :param login: callsign to log in with
+        :param enricher: SpotEnricher
+        :param channel_layer: channel layer to publish to
+        """
+        self.host = host
+        self.port = port
+        self.login = login
+        self.enricher = enricher
+        self.channel_layer = channel_layer
+        self.batcher = GroupBatcher(channel_layer)
+        self.published = 0
+
+    async def publish(self, spot: Spot) -> dict:
+        """
+        Enriches a spot and sends it to the groups of its subscribers
+
+        :param spot: parsed spot
+        :return: the event sent
+        """
+        event = self.enricher.enrich(spot)
+        await self.batcher.group_send(ALL_GROUP, event)
+        await self.batcher.group_send(band_group(event['band']), event)
+        self.published += 1
+        return event
+
+    async def read(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Logs in and publishes spots until the cluster closes the connection
+
+        :param reader: cluster stream
+        :param writer: cluster stream
+        :return:
+        """
+        writer.write(f'{self.login}\r\n'.encode('ascii'))
+        await writer.drain()
+        while line := await reader.readline():
+            spot = parse_spot(line.decode('latin1'))
+            if spot is not None:
+                await self.publish(spot)
+
+    async def follow_tables(self) -> None:
+        """
+        Reloads the resolver and the membership index in a thread once a refresh (of any process) changed them,
+        for the enricher to pick up. Until cancelled
+
+        :return:
+        """
+        while True:
+            await asyncio.sleep(TABLES_CHECK_INTERVAL)
+            try:
+                await sync_to_async(get_resolver)()
+                await sync_to_async(get_membership_index)()
+            except Exception:
+                logger.exception('Cannot reload the reference data')
+
+    async def run(self) -> None:
+        """
+        Main loop, until cancelled
+
+        :return:
+        """
+        follower = asyncio.ensure_future(self.follow_tables())
+        delay = 1
+        try:
+            while True:
+                try:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                except OSError as error:
+                    logger.warning('Cannot connect to %s:%s (%s), retrying in %ds', self.host, self.port, error, delay)
+                else:
+                    logger.info('Connected to %s:%s', self.host, self.port)
+                    delay = 1
+                    try:
+                        await self.read(reader, writer)
+                    except (OSError, ValueError) as error:
+                        logger.warning('Lost %s:%s (%s)', self.host, self.port, error)
+                    finally:
+                        writer.close()
+                        await self.batcher.flush()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+        finally:
+            follower.cancel()
@@ -0,0 +1,158 @@
+# chat/tests/tests_batching
+#
+# GroupBatcher and BatchingMixin: coalescing within the window, merging and dropping frames
+#
+import asyncio
+import json
+
+from django.test import SimpleTestCase
+
+from chat.batching import BATCH_EVENT, BatchingMixin, GroupBatcher
+
+
+class RecordingLayer:
+    """
+    Keeps the group_send calls
+    """
+
+    def __init__(self, fail: bool = False) -> None:
+        self.sent = []
+        self.fail = fail
+
+    async def group_send(self, group: str, event: dict) -> None:
+        if self.fail:
+            raise ConnectionError('layer is down')
+        self.sent.append((group, event))
+
+
+class RecordingConsumer:
+    """
+    The parts of AsyncWebsocketConsumer BatchingMixin uses
+    """
+    channel_name = 'specific.test'
+
+    def __init__(self) -> None:
+        self.channel_layer = RecordingLayer()
+        self.frames = []
+        self.handled = []
+
+    async def send(self, text_data: str = None) -> None:
+        self.frames.append(text_data)
+
+    async def chat_message(self, event: dict) -> None:
+        self.handled.append(event)
+
+
+class Consumer(BatchingMixin, RecordingConsumer):
+    window = 0.01
+    max_events = 3
+
+    def merge_key(self, event: dict):
+        return event.get('key')
+
+
+class GroupBatcherTests(SimpleTestCase):
+
+    async def test_no_window_sends_at_once(self):
+        layer = RecordingLayer()
+        await GroupBatcher(layer, window=0).group_send('room', {'type': 'chat.message'})
+        self.assertEqual(layer.sent, [('room', {'type': 'chat.message'})])
+
+    async def test_one_call_per_group(self):
+        layer = RecordingLayer()
+        batcher = GroupBatcher(layer, window=0.01, max_events=10)
+        for number in range(3):
+            await batcher.group_send('room', {'type': 'chat.message', 'number': number})
+        await batcher.group_send('other', {'type': 'chat.message', 'number': 3})
+        self.assertEqual(layer.sent, [])
+        await batcher.task
+        self.assertEqual(layer.sent, [
+            ('room', {'type': BATCH_EVENT, 'events': [{'type': 'chat.message', 'number': number}
+                                                      for number in range(3)]}),
+            ('other', {'type': 'chat.message', 'number': 3}),
+        ])
+        self.assertIsNone(batcher.task)
+
+    async def test_full_group_flushes_early(self):
+        layer = RecordingLayer()
+        batcher = GroupBatcher(layer, window=60, max_events=2)
+        await batcher.group_send('room', {'type': 'chat.message', 'number': 0})
+        await batcher.group_send('room', {'type': 'chat.message', 'number': 1})
+        self.assertEqual(len(layer.sent), 1)
+        await batcher.close()
+
+    async def test_close_sends_pending(self):
+        layer = RecordingLayer()
+        batcher = GroupBatcher(layer, window=60)
+        await batcher.group_send('room', {'type': 'chat.message'})
+        task = batcher.task
+        await batcher.close()
+        self.assertEqual(layer.sent, [('room', {'type': 'chat.message'})])
+        await asyncio.sleep(0)
+        self.assertTrue(task.cancelled())
+
+    async def test_errors_are_logged(self):
+        batcher = GroupBatcher(RecordingLayer(fail=True), window=0.01)
+        await batcher.group_send('room', {'type': 'chat.message'})
+        with self.assertLogs('chat.batching', 'ERROR'):
+            await batcher.task
+
+
+class BatchingMixinTests(SimpleTestCase):
+
+    async def test_no_window_sends_at_once(self):
+        consumer = Consumer()
+        consumer.window = 0
+        await consumer.send_frame('{"n": 0}')
+        self.assertEqual(consumer.frames, ['{"n": 0}'])
+
+    async def test_frames_share_one_send(self):
+        consumer = Consumer()
+        await consumer.send_frame('{"n": 0}')
+        await consumer.send_frame('{"n": 1}')
+        self.assertEqual(consumer.frames, [])
+        await consumer.drain_task
+        self.assertEqual([json.loads(frame) for frame in consumer.frames], [[{'n': 0}, {'n': 1}]])
+        self.assertIsNone(consumer.drain_task)
+
+    async def test_same_merge_key_replaces(self):
+        consumer = Consumer()
+        await consumer.send_frame('{"spot": 1}', {'key': 'EA3IEG'})
+        await consumer.send_frame('{"n": 0}', {})
+        await consumer.send_frame('{"spot": 2}', {'key': 'EA3IEG'})
+        await consumer.drain_task
+        self.assertEqual(json.loads(consumer.frames[0]), [{'spot': 2}, {'n': 0}])
+
+    async def test_oldest_frames_are_dropped(self):
+        consumer = Consumer()
+        for number in range(5):
+            await consumer.send_frame(json.dumps({'n': number}))
+        await consumer.drain_task
+        self.assertEqual(json.loads(consumer.frames[0]), [{'n': 2}, {'n': 3}, {'n': 4}, {'dropped': 2}])
+
+    async def test_group_send_goes_through_the_batcher(self):
+        consumer = Consumer()
+        await consumer.group_send('room', {'type': 'chat.message', 'n': 0})
+        await consumer.group_send('room', {'type': 'chat.message', 'n': 1})
+        await consumer.batcher.task
+        self.assertEqual(consumer.channel_layer.sent, [
+            ('room', {'type': BATCH_EVENT, 'events': [{'type': 'chat.message', 'n': 0},
+                                                      {'type': 'chat.message', 'n': 1}]}),
+        ])
+
+    async def test_batch_events_are_unpacked(self):
+        consumer = Consumer()
+        events = [{'type': 'chat.message', 'n': 0}, {'type': 'chat.message', 'n': 1}]
+        await consumer.batch_events({'type': BATCH_EVENT, 'events': events})
+        self.assertEqual(consumer.handled, events)
+
+    async def test_send_errors_are_logged(self):
+        consumer = Consumer()
+
+        async def send(text_data=None):
+            raise ConnectionError('client is gone')
+        consumer.send = send
+        await consumer.send_frame('{"n": 0}')
+        with self.assertLogs('chat.batching', 'ERROR'):
+            await consumer.drain_task
+        self.assertIsNone(consumer.drain_task)
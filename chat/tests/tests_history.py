@@ -0,0 +1,159 @@
+# chat/tests/tests_history
+#
+# Chat room history: LocalHistory's limits (messages, bytes, idle time, rooms), RedisHistory's bytes limit,
+# the CHAT_HISTORY setting, and ChatConsumer replaying it to joining clients
+#
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from chat import consumers, history
+from chat.history import SWEEP_INTERVAL, LocalHistory, RedisHistory, get_history
+from chat.routing import websocket_urlpatterns
+
+
+class Clock:
+    """
+    Stands for time.monotonic()
+    """
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class LocalHistoryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(history.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_last_messages(self):
+        local = LocalHistory(max_messages=3)
+        for number in range(5):
+            await local.append('dx', f'"{number}"')
+        self.assertEqual(await local.recent('dx'), ['"2"', '"3"', '"4"'])
+        self.assertEqual(await local.recent('contest'), [])
+
+    async def test_bytes(self):
+        local = LocalHistory(max_bytes=12)
+        await local.append('dx', '"abc"')
+        await local.append('dx', '"73"')
+        self.assertEqual(await local.recent('dx'), ['"abc"', '"73"'])
+        # UTF-8 bytes, not characters: 8 bytes push the oldest out
+        await local.append('dx', '"ñññ"')
+        self.assertEqual(await local.recent('dx'), ['"73"', '"ñññ"'])
+        self.assertEqual(local.rooms['dx'].size, 12)
+        # Too large on its own: not kept, the rest stays
+        await local.append('dx', '"' + 'x' * 11 + '"')
+        self.assertEqual(await local.recent('dx'), ['"73"', '"ñññ"'])
+
+    async def test_idle_rooms_are_dropped(self):
+        local = LocalHistory(idle_seconds=600)
+        await local.append('quiet', '"cq"')
+        self.clock.now += 300
+        await local.append('busy', '"cq"')
+        self.clock.now += 301
+        await local.append('busy', '"qrz"')
+        self.assertEqual(list(local.rooms), ['busy'])
+        self.assertEqual(await local.recent('quiet'), [])
+        # Reading keeps a room alive too; sweeps wait SWEEP_INTERVAL
+        self.clock.now += 599
+        self.assertEqual(await local.recent('busy'), ['"cq"', '"qrz"'])
+        self.clock.now += 599
+        await local.append('other', '"cq"')
+        self.assertEqual(list(local.rooms), ['busy', 'other'])
+        self.clock.now += SWEEP_INTERVAL
+        await local.append('other', '"qrz"')
+        self.assertEqual(list(local.rooms), ['other'])
+
+    async def test_least_recently_used_rooms_go_first(self):
+        local = LocalHistory(max_rooms=2)
+        await local.append('a', '"1"')
+        await local.append('b', '"2"')
+        await local.recent('a')
+        await local.append('c', '"3"')
+        self.assertEqual(list(local.rooms), ['a', 'c'])
+
+
+class RedisHistoryTests(SimpleTestCase):
+
+    async def test_bytes_limit_when_reading(self):
+        redis_history = RedisHistory('redis://127.0.0.1:6379', max_messages=10, max_bytes=12)
+        # Newest first, as XREVRANGE returns them
+        entries = [(b'3-0', {b'text': '"ñññ"'.encode('utf8')}), (b'2-0', {b'text': b'"73"'}), (b'1-0', {b'text': b'"abc"'})]
+        redis_history.redis = mock.Mock(xrevrange=mock.AsyncMock(return_value=entries))
+        self.assertEqual(await redis_history.recent('dx'), ['"73"', '"ñññ"'])
+        redis_history.redis.xrevrange.assert_awaited_once_with('lflog:chat:history:dx', count=10)
+
+
+class GetHistoryTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(history, '_history', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(CHAT_HISTORY='memory', CHAT_HISTORY_MESSAGES=5, CHAT_HISTORY_BYTES=100, CHAT_HISTORY_ROOMS=7)
+    def test_memory(self):
+        local = get_history()
+        self.assertIsInstance(local, LocalHistory)
+        self.assertEqual((local.max_messages, local.max_bytes, local.max_rooms), (5, 100, 7))
+        self.assertIs(get_history(), local)
+
+    @override_settings(CHAT_HISTORY='off')
+    def test_off(self):
+        self.assertIsNone(get_history())
+
+    @override_settings(CHAT_HISTORY='disk')
+    def test_unknown(self):
+        with self.assertRaisesMessage(ValueError, "not 'disk'"):
+            get_history()
+
+
+class ChatConsumerHistoryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.history = LocalHistory()
+        patcher = mock.patch.object(consumers, 'get_history', lambda: self.history)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def join(self, room: str) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{room}/')
+        connected, _subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_history_comes_first_in_one_frame(self):
+        first = await self.join('history')
+        # Nothing to catch up on
+        self.assertTrue(await first.receive_nothing())
+        for message in ('cq', 'qrz?', '73'):
+            await first.send_json_to({'message': message})
+            self.assertEqual(await first.receive_json_from(), {'message': message})
+
+        second = await self.join('history')
+        await first.send_json_to({'message': 'new'})
+        self.assertEqual(await second.receive_json_from(), [{'message': 'cq'}, {'message': 'qrz?'}, {'message': '73'}])
+        self.assertEqual(await second.receive_json_from(), {'message': 'new'})
+        self.assertTrue(await second.receive_nothing())
+        self.assertEqual((await self.history.recent('history'))[-1], '{"message": "new"}')
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_off(self):
+        self.history = None
+        communicator = await self.join('nohistory')
+        await communicator.send_json_to({'message': 'cq'})
+        self.assertEqual(await communicator.receive_json_from(), {'message': 'cq'})
+        await communicator.disconnect()
+        communicator = await self.join('nohistory')
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
@@ -0,0 +1,138 @@
+# chat/tests/tests_layers
+#
+# LocalChannelLayer: sends and receives, capacities, groups, expiry sweeps and cancelled receivers
+#
+import asyncio
+import time
+
+from channels.exceptions import ChannelFull
+from django.test import SimpleTestCase
+
+from chat.layers import SWEEP_INTERVAL, LocalChannelLayer, is_local
+
+
+class LocalChannelLayerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.layer = LocalChannelLayer(capacity=2)
+
+    async def test_send_and_receive_in_order(self):
+        await self.layer.send('test', {'n': 0})
+        await self.layer.send('test', {'n': 1})
+        self.assertEqual(await self.layer.receive('test'), {'n': 0})
+        self.assertEqual(await self.layer.receive('test'), {'n': 1})
+
+    async def test_receive_waits_for_a_message(self):
+        receiver = asyncio.ensure_future(self.layer.receive('test'))
+        await asyncio.sleep(0)
+        self.assertFalse(receiver.done())
+        await self.layer.send('test', {'n': 0})
+        self.assertEqual(await asyncio.wait_for(receiver, 1), {'n': 0})
+
+    async def test_capacity(self):
+        await self.layer.send('test', {'n': 0})
+        await self.layer.send('test', {'n': 1})
+        with self.assertRaises(ChannelFull):
+            await self.layer.send('test', {'n': 2})
+        await self.layer.receive('test')
+        await self.layer.send('test', {'n': 2})
+
+    async def test_channel_capacity(self):
+        layer = LocalChannelLayer(capacity=2, channel_capacity={'busy.*': 3})
+        for number in range(3):
+            await layer.send('busy.test', {'n': number})
+        with self.assertRaises(ChannelFull):
+            await layer.send('busy.test', {'n': 3})
+
+    async def test_expired_messages_are_skipped(self):
+        layer = LocalChannelLayer(expiry=-1)
+        await layer.send('test', {'n': 0})
+        receiver = asyncio.ensure_future(layer.receive('test'))
+        await asyncio.sleep(0)
+        self.assertFalse(receiver.done())
+        receiver.cancel()
+
+    async def test_group_send(self):
+        await self.layer.group_add('room', 'first')
+        await self.layer.group_add('room', 'second')
+        await self.layer.group_add('other', 'third')
+        message = {'type': 'chat.message'}
+        await self.layer.group_send('room', message)
+        self.assertIs(await self.layer.receive('first'), message)
+        self.assertIs(await self.layer.receive('second'), message)
+        self.assertNotIn('third', self.layer.channels)
+
+    async def test_group_send_skips_full_channels(self):
+        await self.layer.group_add('room', 'first')
+        await self.layer.group_add('room', 'second')
+        await self.layer.send('first', {'n': 0})
+        await self.layer.send('first', {'n': 1})
+        await self.layer.group_send('room', {'n': 2})
+        self.assertEqual(self.layer.dropped, 1)
+        self.assertEqual(await self.layer.receive('second'), {'n': 2})
+
+    async def test_group_discard(self):
+        await self.layer.group_add('room', 'first')
+        await self.layer.group_discard('room', 'first')
+        self.assertEqual(self.layer.groups, {})
+        await self.layer.group_send('room', {'n': 0})
+        self.assertNotIn('first', self.layer.channels)
+
+    async def test_sweep(self):
+        await self.layer.group_add('room', 'gone')
+        await self.layer.group_add('room', 'idle')
+        await self.layer.group_add('room', 'listening')
+        await self.layer.send('gone', {'n': 0})
+        receiver = asyncio.ensure_future(self.layer.receive('listening'))
+        await asyncio.sleep(0)
+        # Past the expiry of the message, within the group expiry
+        self.layer._sweep(time.time() + self.layer.expiry + 1)
+        self.assertEqual(set(self.layer.groups['room']), {'idle', 'listening'})
+        self.assertEqual(set(self.layer.channels), {'listening'})
+        # Past the group expiry
+        self.layer.next_sweep = 0
+        self.layer._sweep(time.time() + self.layer.group_expiry + 1)
+        self.assertEqual(self.layer.groups, {})
+        receiver.cancel()
+
+    async def test_sweeps_are_spaced(self):
+        layer = LocalChannelLayer(expiry=0)
+        now = time.time()
+        layer._sweep(now)
+        await layer.send('gone', {'n': 0})
+        layer._sweep(now + SWEEP_INTERVAL / 2)
+        self.assertIn('gone', layer.channels)
+        layer._sweep(now + SWEEP_INTERVAL * 2)
+        self.assertNotIn('gone', layer.channels)
+
+    async def test_cancelled_receiver_passes_the_message_on(self):
+        first = asyncio.ensure_future(self.layer.receive('test'))
+        second = asyncio.ensure_future(self.layer.receive('test'))
+        await asyncio.sleep(0)
+        # Wakes the first receiver, which is cancelled before it runs
+        await self.layer.send('test', {'n': 0})
+        first.cancel()
+        self.assertEqual(await asyncio.wait_for(second, 1), {'n': 0})
+        self.assertTrue(first.cancelled())
+
+    async def test_cancelled_receiver_stops_waiting(self):
+        receiver = asyncio.ensure_future(self.layer.receive('test'))
+        await asyncio.sleep(0)
+        receiver.cancel()
+        await asyncio.sleep(0)
+        self.assertFalse(self.layer.channels['test'].waiters)
+
+    async def test_new_channel(self):
+        first = await self.layer.new_channel()
+        self.assertNotEqual(first, await self.layer.new_channel())
+        self.assertIn('.local!', first)
+        self.assertTrue(self.layer.valid_channel_name(first))
+
+    async def test_flush(self):
+        await self.layer.group_add('room', 'first')
+        await self.layer.send('first', {'n': 0})
+        await self.layer.flush()
+        self.assertEqual((self.layer.channels, self.layer.groups), ({}, {}))
+
+    def test_is_local(self):
+        self.assertTrue(is_local(self.layer))
@@ -0,0 +1,228 @@
+# chat/tests/tests_spots
+#
+# DX cluster spots: parsing cluster lines, guessing the mode, enrichment, filters and SpotConsumer
+#
+import datetime
+import json
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase
+
+from chat import spots
+from chat.routing import websocket_urlpatterns
+from chat.spots import Spot, SpotEnricher, SpotFeeder, SpotFilter, band_group, guess_mode, parse_spot
+from clublog.resolver import DXCCInfo
+
+UTC = datetime.timezone.utc
+RECEIVED = datetime.datetime(2024, 5, 1, 12, 34, 56, tzinfo=UTC)
+
+
+class StubResolver:
+    """
+    Knows a few calls, counts the lookups
+    """
+    infos = {
+        'K1ABC': DXCCInfo('K1ABC', 291, 'United States', 5, 'NA', 42.0, -71.0),
+        'JA1XYZ': DXCCInfo('JA1XYZ', 339, 'Japan', 25, 'AS', 35.7, 139.7),
+        'DL1A': DXCCInfo('DL1A', 230, 'Fed. Rep. of Germany', 14, 'EU', 51.0, 10.0),
+    }
+
+    def __init__(self) -> None:
+        self.lookups = []
+
+    def resolve(self, call: str, when: datetime.datetime = None) -> DXCCInfo | None:
+        self.lookups.append(call)
+        return self.infos.get(call)
+
+
+class StubIndex:
+    """
+    LoTW users
+    """
+    lotw = {'K1ABC': RECEIVED}
+    eqsl = frozenset()
+
+
+class ReferenceDataMixin:
+    """
+    Stub resolver and membership index in place of the reference data tables
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.resolver, self.index = StubResolver(), StubIndex()
+        for patcher in (mock.patch.object(spots, 'get_resolver', lambda reload=True: self.resolver),
+                        mock.patch.object(spots, 'get_membership_index', lambda reload=True: self.index)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class ParseSpotTests(SimpleTestCase):
+
+    def test_spot_lines(self):
+        self.assertEqual(parse_spot('DX de EA3IEG:     14025.0  K1ABC        CW 599 up 2                    1234Z JN11\r\n'),
+                         Spot('EA3IEG', 14025.0, 'K1ABC', 'CW 599 up 2', '12:34', 'JN11'))
+        self.assertEqual(parse_spot('DX de OH8X-#:     7018.5  JA1XYZ       CW 23 dB 28 WPM CQ             0712Z'),
+                         Spot('OH8X-#', 7018.5, 'JA1XYZ', 'CW 23 dB 28 WPM CQ', '07:12', ''))
+        self.assertEqual(parse_spot('DX de W3LPL:     21074.0  ZS6/DL1A                                     2359Z fn20'),
+                         Spot('W3LPL', 21074.0, 'ZS6/DL1A', '', '23:59', 'FN20'))
+        # Some clusters send lower case
+        self.assertEqual(parse_spot('dx de ea3ieg: 144300 k1abc tnx qso 0000z'),
+                         Spot('EA3IEG', 144300.0, 'K1ABC', 'tnx qso', '00:00', ''))
+
+    def test_other_lines(self):
+        for line in ('', 'EA3IEG de EA4URE-2 >', 'WWV de W0MU <18>:   SFI=70, A=4, K=1, No Storms -> No Storms',
+                     'To ALL de EA3IEG: hello', 'DX de EA3IEG:     abc  K1ABC  CW  1234Z',
+                     'DX de EA3IEG:     14025.0  K1ABC        CW 599                         1299Z',
+                     'DX de EA3IEG:     14025.0  K1ABC        CW 599                         3034Z',
+                     'DX de EA3IEG:     14025.0  K1ABC        CW 599'):
+            with self.subTest(line=line):
+                self.assertIsNone(parse_spot(line))
+
+
+class GuessModeTests(SimpleTestCase):
+
+    def test_comment_names_the_mode(self):
+        self.assertEqual(guess_mode(14025.0, '20m', 'tnx ft8 -10'), 'FT8')
+        self.assertEqual(guess_mode(14025.0, '20m', 'usb pse'), 'SSB')
+        self.assertEqual(guess_mode(14200.0, '20m', 'up 5 CW'), 'CW')
+        # Only whole words
+        self.assertEqual(guess_mode(14200.0, '20m', 'CWOPS member'), 'SSB')
+
+    def test_band_plan_edges(self):
+        for khz, band, mode in ((14070.0, '20m', 'CW'), (14070.1, '20m', 'SSB'), (14073.9, '20m', 'SSB'),
+                                (14074.0, '20m', 'FT8'), (14077.0, '20m', 'FT8'), (14077.1, '20m', 'SSB'),
+                                (7040.0, '40m', 'CW'), (7040.1, '40m', 'SSB'), (7047.5, '40m', 'FT4'),
+                                (7050.5, '40m', 'FT4'), (7050.6, '40m', 'SSB'), (1838.0, '160m', 'CW'),
+                                (1840.0, '160m', 'FT8'), (1843.1, '160m', 'SSB'), (50100.0, '6m', 'CW'),
+                                (50313.0, '6m', 'FT8'), (144150.0, '2m', 'CW'), (144170.0, '2m', 'FT4'),
+                                (144174.0, '2m', 'FT8'), (144300.0, '2m', 'SSB')):
+            with self.subTest(khz=khz):
+                self.assertEqual(guess_mode(khz, band, ''), mode)
+
+    def test_no_plan(self):
+        self.assertEqual(guess_mode(1296200.0, '23cm', ''), '')
+        self.assertEqual(guess_mode(14400.0, '', 'qrv'), '')
+
+
+class SpotEnricherTests(ReferenceDataMixin, SimpleTestCase):
+
+    def test_enrich(self):
+        event = SpotEnricher(41.4, 2.2).enrich(Spot('EA3IEG', 14025.0, 'K1ABC', 'CW 599', '12:34', 'JN11'), RECEIVED)
+        self.assertEqual({key: value for key, value in event.items() if key != 'text'},
+                         {'type': 'spot.message', 'call': 'K1ABC', 'band': '20m', 'mode': 'CW', 'cont': 'NA'})
+        spot = json.loads(event['text'])
+        self.assertEqual(spot['received'], '2024-05-01T12:34:56+00:00')
+        self.assertEqual({key: spot[key] for key in ('freq', 'dxcc', 'entity', 'cont', 'cqz', 'lotw', 'grid')},
+                         {'freq': 14025.0, 'dxcc': 291, 'entity': 'United States', 'cont': 'NA', 'cqz': 5,
+                          'lotw': True, 'grid': 'JN11'})
+        self.assertTrue(5800 < spot['distance'] < 6000, spot['distance'])
+        self.assertTrue(290 < spot['bearing'] < 310, spot['bearing'])
+
+    def test_unknown_call_without_home(self):
+        spot = json.loads(SpotEnricher().enrich(Spot('EA3IEG', 7010.0, 'XX9XX', '', '00:00', ''), RECEIVED)['text'])
+        self.assertEqual([spot[key] for key in ('dxcc', 'entity', 'cont', 'cqz', 'lotw', 'distance', 'bearing')],
+                         [None, None, None, None, False, None, None])
+        spot = json.loads(SpotEnricher().enrich(Spot('EA3IEG', 7010.0, 'DL1A', '', '00:00', ''), RECEIVED)['text'])
+        self.assertEqual((spot['cont'], spot['lotw'], spot['distance']), ('EU', False, None))
+
+    def test_lookups_are_cached_until_the_tables_change(self):
+        enricher = SpotEnricher()
+        for _spot in range(3):
+            enricher.enrich(Spot('EA3IEG', 14025.0, 'K1ABC', '', '00:00', ''))
+        self.assertEqual(self.resolver.lookups, ['K1ABC'])
+        old, self.resolver = self.resolver, StubResolver()
+        enricher.enrich(Spot('EA3IEG', 14025.0, 'K1ABC', '', '00:00', ''))
+        self.assertEqual((old.lookups, self.resolver.lookups), (['K1ABC'], ['K1ABC']))
+
+
+def event(band: str = '20m', mode: str = 'CW', cont: str = 'NA') -> dict:
+    """
+    :return: spot.message event with those filter keys
+    """
+    return {'type': 'spot.message', 'call': 'K1ABC', 'band': band, 'mode': mode, 'cont': cont, 'text': '{}'}
+
+
+class SpotFilterTests(SimpleTestCase):
+
+    def test_empty_lets_everything_through(self):
+        spot_filter = SpotFilter.build()
+        self.assertTrue(spot_filter.matches(event()))
+        self.assertTrue(spot_filter.matches(event('', '', None)))
+        self.assertEqual(spot_filter.groups(), ['spots_all'])
+
+    def test_band_mode_and_continent(self):
+        spot_filter = SpotFilter.from_query_string(b'band=20M,40m&mode=cw&mode=ft8&cont=eu,%20na')
+        self.assertEqual(spot_filter, SpotFilter(frozenset({'20m', '40m'}), frozenset({'CW', 'FT8'}),
+                                                 frozenset({'EU', 'NA'})))
+        self.assertEqual(spot_filter.groups(), ['spots_20m', 'spots_40m'])
+        self.assertTrue(spot_filter.matches(event('40m', 'FT8', 'EU')))
+        self.assertFalse(spot_filter.matches(event('15m', 'CW', 'EU')))
+        self.assertFalse(spot_filter.matches(event('20m', 'SSB', 'EU')))
+        self.assertFalse(spot_filter.matches(event('20m', 'CW', 'AS')))
+        self.assertFalse(spot_filter.matches(event('20m', 'CW', None)))
+
+    def test_unknown_bands_and_continents(self):
+        with self.assertRaisesMessage(ValueError, 'Unknown bands or continents: 21m, XX'):
+            SpotFilter.build(['20m', '21m'], ['CW'], ['xx'])
+        # Modes are free text
+        self.assertEqual(SpotFilter.build(modes=['OLIVIA']).modes, frozenset({'OLIVIA'}))
+
+    def test_band_group(self):
+        self.assertEqual((band_group('20m'), band_group('')), ('spots_20m', 'spots_other'))
+
+
+class SpotConsumerTests(ReferenceDataMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.feeder = SpotFeeder('localhost', 7300, 'EA3IEG', SpotEnricher(), get_channel_layer())
+
+    async def connect(self, path: str) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        connected, _subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def publish(self, line: str) -> None:
+        await self.feeder.publish(parse_spot(line))
+
+    async def test_filtered_stream(self):
+        communicator = await self.connect('/ws/spots/?band=20m&mode=CW')
+        await self.publish('DX de EA3IEG:  7025.0  K1ABC  CW 599  1234Z')
+        await self.publish('DX de EA3IEG: 14250.0  K1ABC  59  1235Z')
+        await self.publish('DX de EA3IEG: 14025.0  JA1XYZ  CW 599  1236Z')
+        spot = json.loads(await communicator.receive_from())
+        self.assertEqual((spot['call'], spot['band'], spot['mode'], spot['cont']), ('JA1XYZ', '20m', 'CW', 'AS'))
+        self.assertTrue(await communicator.receive_nothing())
+
+        # Filter change
+        await communicator.send_json_to({'bands': ['40m'], 'conts': ['eu']})
+        self.assertEqual(await communicator.receive_json_from(),
+                         {'subscribed': {'bands': ['40m'], 'modes': [], 'conts': ['EU']}})
+        await self.publish('DX de EA3IEG: 14025.0  DL1A  CW  1237Z')
+        await self.publish('DX de EA3IEG:  7025.0  K1ABC  CW  1238Z')
+        await self.publish('DX de EA3IEG:  7074.0  DL1A  FT8 -10  1239Z')
+        spot = json.loads(await communicator.receive_from())
+        self.assertEqual((spot['call'], spot['band'], spot['mode']), ('DL1A', '40m', 'FT8'))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_bad_filter_change(self):
+        communicator = await self.connect('/ws/spots/')
+        await communicator.send_json_to({'bands': ['21m']})
+        self.assertEqual(await communicator.receive_json_from(), {'error': 'Unknown bands or continents: 21m'})
+        await communicator.send_to(text_data='[]')
+        self.assertIn('error', await communicator.receive_json_from())
+        # The old filter stays
+        await self.publish('DX de EA3IEG: 21025.0  K1ABC  CW  1234Z')
+        self.assertEqual(json.loads(await communicator.receive_from())['band'], '15m')
+        await communicator.disconnect()
+
+    async def test_bad_query_string(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/spots/?cont=XX')
+        connected, code = await communicator.connect()
+        self.assertEqual((connected, code), (False, 4400))
@@ -0,0 +1,194 @@
+# clublog/batch
+#
+# Chunked writer shared by the ClubLog update_table() methods
+#
+from django.db import models
+
+from tools.tableswap import ShadowTable, can_swap, load_transaction
+
+BATCH_SIZE = 2000
+
+# Load modes
+# replace: delete every row, then insert the whole feed
+# diff: insert new rows, update changed ones, delete the ones gone from the feed
+# swap: load a shadow copy of the table and rename it in place; replace where that is not possible (not Postgres)
+REPLACE = 'replace'
+DIFF = 'diff'
+SWAP = 'swap'
+MODES = (REPLACE, DIFF, SWAP)
+
+
+class BatchWriter:
+    """
+    Collects model instances and writes them in fixed-size bulk chunks,
+    so callers can feed records one at a time without holding the whole table.
+
+    Meant to be used as a context manager inside load_transaction(): a transaction in replace and diff modes,
+    none in swap mode, where the swap commits on its own:
+        with load_transaction(ClubLogPrefix, mode == SWAP), BatchWriter(ClubLogPrefix, mode=mode) as writer:
+            for record in records:
+                writer.add(ClubLogPrefix.from_clublog(record))
+    """
+
+    def __init__(self, model: type[models.Model], batch_size: int = BATCH_SIZE, mode: str = REPLACE) -> None:
+        """
+        :param model: model class to write to
+        :param batch_size: rows per bulk operation
+        :param mode: REPLACE, DIFF (matching on the primary key: record / adif) or SWAP
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if mode == SWAP and not can_swap(model):
+            mode = REPLACE
+        self.model = model
+        self.batch_size = batch_size
+        self.mode = mode
+        self.batch = []
+        self.count = 0
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.seen = set()
+        self.fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        self.shadow = None
+
+    def __enter__(self) -> 'BatchWriter':
+        """
+        In replace mode, clears the table before the first row is written.
+        In swap mode, creates the shadow table the rows go to
+
+        :return: self
+        """
+        if self.mode == REPLACE:
+            self.deleted = self.model.objects.all().delete()[0]
+        elif self.mode == SWAP:
+            self.shadow = ShadowTable(self.model).__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """
+        Writes whatever is left, unless we are leaving because of an error.
+        In diff mode, deletes the rows which were not in the feed.
+        In swap mode, puts the shadow table in place of the live one (or drops it on error)
+
+        :return:
+        """
+        if exc_type is not None:
+            if self.shadow is not None:
+                self.shadow.drop()
+            return
+        self.flush()
+        if self.mode == DIFF:
+            self._delete_missing()
+        elif self.mode == SWAP:
+            self.deleted = self.model.objects.count()
+            self.shadow.swap()
+
+    def add(self, obj: models.Model) -> None:
+        """
+        Queues one instance, writing the batch when it is full
+
+        :param obj: model instance
+        :return:
+        """
+        self.batch.append(obj)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the pending batch
+
+        :return:
+        """
+        if not self.batch:
+            return
+        if self.mode == DIFF:
+            self._flush_diff()
+        elif self.mode == SWAP:
+            fields = self.model._meta.concrete_fields
+            self.shadow.copy([field.name for field in fields],
+                             ([getattr(obj, field.attname) for field in fields] for obj in self.batch))
+            self.created += len(self.batch)
+        else:
+            self.model.objects.bulk_create(self.batch)
+            self.created += len(self.batch)
+        self.count += len(self.batch)
+        self.batch = []
+
+    def counts(self) -> dict:
+        """
+        What the writer did so far
+
+        :return: dict with created, updated, deleted and unchanged rows
+        """
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'deleted': self.deleted,
+            'unchanged': self.unchanged,
+        }
+
+    def _flush_diff(self) -> None:
+        """
+        Compares the batch with the stored rows, field by field,
+        and only inserts or updates what is different
+
+        :return:
+        """
+        existing = self.model.objects.in_bulk([obj.pk for obj in self.batch])
+        to_create = []
+        to_update = []
+        for obj in self.batch:
+            self.seen.add(obj.pk)
+            # Normalise the strings from_clublog() leaves as they came (whitelisted) so they compare equal to stored values
+            for field in self.fields:
+                setattr(obj, field.attname, field.to_python(getattr(obj, field.attname)))
+            current = existing.get(obj.pk)
+            if current is None:
+                to_create.append(obj)
+            elif any(getattr(obj, field.attname) != getattr(current, field.attname) for field in self.fields):
+                to_update.append(obj)
+            else:
+                self.unchanged += 1
+        if to_create:
+            self.model.objects.bulk_create(to_create)
+            self.created += len(to_create)
+        if to_update:
+            self.model.objects.bulk_update(to_update, [field.name for field in self.fields])
+            self.updated += len(to_update)
+
+    def _delete_missing(self) -> None:
+        """
+        Deletes the stored rows whose key was not seen in the feed, batch_size keys at a time.
+        Keys are read a page at a time, after the last one read, rather than through a cursor left open
+        on the table the rows are deleted from
+
+        :return:
+        """
+        stored = self.model.objects.order_by('pk').values_list('pk', flat=True)
+        last = None
+        while keys := list((stored if last is None else stored.filter(pk__gt=last))[:self.batch_size]):
+            last = keys[-1]
+            missing = [pk for pk in keys if pk not in self.seen]
+            if missing:
+                self.deleted += self.model.objects.filter(pk__in=missing).delete()[0]
+
+
+def write_records(model: type[models.Model], records, mode: str = REPLACE,
+                  batch_size: int = BATCH_SIZE) -> BatchWriter:
+    """
+    Writes an iterable of cty.xml records through the model's from_clublog() builder.
+    Replace and diff run in a transaction; a swap must not be called inside one
+
+    :param model: ClubLog model class
+    :param records: iterable of record dicts
+    :param mode: REPLACE, DIFF or SWAP
+    :param batch_size: rows per bulk operation
+    :return: the writer, to read its count and counts()
+    """
+    with load_transaction(model, mode == SWAP), BatchWriter(model, batch_size, mode) as writer:
+        for record in records:
+            writer.add(model.from_clublog(record))
+    return writer
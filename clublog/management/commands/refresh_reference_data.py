@@ -0,0 +1,42 @@
+# clublog/management/commands/refresh_reference_data
+#
+# Refreshes ClubLog, LoTW and eQSL reference data and reports what each phase cost
+#
+from django.core.management.base import BaseCommand, CommandError
+
+from tools.refresh import REFRESHES, RefreshLocked, run_refreshes
+
+from ...batch import DIFF, MODES, REPLACE, SWAP
+
+
+class Command(BaseCommand):
+    help = 'Downloads and loads the ClubLog, LoTW and eQSL reference data, concurrently, printing phase timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('feeds', nargs='*', metavar='feed',
+                            help=f'which feeds to refresh: {", ".join(REFRESHES)} (default: all)')
+        parser.add_argument('--force', action='store_true', help='load even if upstream did not change')
+        parser.add_argument('--serial', action='store_true', help='one feed after another instead of concurrently')
+        parser.add_argument('--batch-size', type=int, default=None, help='rows per bulk operation')
+        parser.add_argument('--streaming', action='store_true', help='ClubLog: parse cty.xml incrementally')
+        parser.add_argument('--mode', choices=MODES, default=REPLACE, help=f'{REPLACE} the tables, write the {DIFF} (ClubLog only) or {SWAP} in shadow tables (Postgres only)')
+        parser.add_argument('--copy', action='store_true', help='LoTW / eQSL: load with COPY (Postgres only)')
+
+    def handle(self, *args, **options):
+        unknown = set(options['feeds']) - set(REFRESHES)
+        if unknown:
+            raise CommandError(f'Unknown feeds: {", ".join(sorted(unknown))}')
+        try:
+            results = run_refreshes(options['feeds'], force=options['force'], concurrent=not options['serial'],
+                                    batch_size=options['batch_size'], streaming=options['streaming'],
+                                    mode=options['mode'], use_copy=options['copy'])
+        except RefreshLocked as error:
+            raise CommandError(str(error))
+        for stats in results:
+            if stats.error:
+                self.stderr.write(self.style.ERROR(str(stats)))
+            else:
+                self.stdout.write(str(stats))
+        failed = [stats.name for stats in results if stats.error]
+        if failed:
+            raise CommandError(f'Refresh failed: {", ".join(failed)}')
@@ -0,0 +1,30 @@
+# clublog/management/commands/run_refresher
+#
+# Standalone worker refreshing the reference data periodically
+#
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from lflog.refresher import PeriodicRefresher
+
+
+class Command(BaseCommand):
+    help = 'Refreshes ClubLog, LoTW and eQSL reference data periodically (settings REFERENCE_REFRESH_*), until stopped'
+
+    def handle(self, *args, **options):
+        asyncio.run(self.serve(PeriodicRefresher.from_settings()))
+
+    async def serve(self, refresher: PeriodicRefresher) -> None:
+        """
+        Runs the refresher until SIGINT / SIGTERM
+
+        :param refresher: what to run
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: loop.create_task(refresher.stop()))
+        self.stdout.write(f'Refreshing {", ".join(refresher.feeds)}, status in {refresher.path}')
+        await refresher.start()
@@ -1,45 +1,153 @@
+import contextlib
 import datetime
 import gzip
-import io
+import logging
 import os
+import xml.etree.ElementTree as ElementTree
+from typing import Iterator
 from zoneinfo import ZoneInfo
 
-import requests
 import xmltodict
 from django.db import models, transaction
 
+from tools.feeds import get_fetcher
+from tools.stats import RefreshStats
+from tools.tableswap import load_transaction
+from tools.versions import bump_version
 
-def update_tables() -> None:
+from .batch import BATCH_SIZE, REPLACE, SWAP, BatchWriter, write_records
+
+logger = logging.getLogger(__name__)
+
+
+def update_tables(streaming: bool = False, batch_size: int = BATCH_SIZE, mode: str = REPLACE,
+                  force: bool = False, stats: RefreshStats = None) -> dict:
     """
-    Clear the tables
-    Get the records from Internet
+    Clear the tables (or diff them, see mode)
+    Get the records from Internet, unless they did not change since last time
     Populate table
+    Rebuild the in-memory resolver
     Profit!
 
-    :return: nada
+    :param streaming: gunzip and parse the file incrementally, writing in chunks
+    :param batch_size: rows per bulk operation
+    :param mode: REPLACE to rewrite the tables, DIFF to only insert/update/delete the delta,
+        SWAP to load shadow tables and rename them in place
+    :param force: download and load even if upstream did not change
+    :param stats: collects timings, rows and process peak memory, for the caller to report
+    :return: dict with created/updated/deleted/unchanged counts per model name, empty if nothing changed
     """
+    stats = stats or RefreshStats('clublog')
     clublog_api_key = os.environ['CLUBLOG_API_KEY']
     clublog_xml = f"https://cdn.clublog.org/cty.php?api={clublog_api_key}"
-    answer = requests.get(clublog_xml)
-    answer.raise_for_status()
-    ungzipped = gzip.GzipFile(fileobj=io.BytesIO(answer.content))
-    clublog_data = xmltodict.parse(ungzipped.read().decode('utf8'))
-
-    # Each models knows how to deal with its records
-    entities = clublog_data['clublog']['entities']['entity']
-    ClubLogEntity.update_table(entities)
-
-    prefixes = clublog_data['clublog']['prefixes']['prefix']
-    ClubLogPrefix.update_table(prefixes)
+    with contextlib.ExitStack() as stack:
+        with stats.phase('download'):
+            feed = stack.enter_context(get_fetcher().fetch(clublog_xml, 'clublog-cty.xml.gz', force=force))
+        if not feed.changed:
+            stats.skipped = True
+            logger.debug(stats.finish())
+            return {}
+        ungzipped = stats.reader(stack.enter_context(gzip.open(feed.path)), 'decompress')
+        if streaming:
+            with stats.phase('db', excluding=('parse', 'decompress')):
+                counts = stream_update_tables(ungzipped, batch_size, mode, stats)
+        else:
+            xml = ungzipped.read()
+            with stats.phase('parse'):
+                clublog_data = xmltodict.parse(xml)
+
+            # Each models knows how to deal with its records
+            sections = (
+                (ClubLogEntity, clublog_data['clublog']['entities']['entity']),
+                (ClubLogPrefix, clublog_data['clublog']['prefixes']['prefix']),
+                (ClubLogZoneException, clublog_data['clublog']['zone_exceptions']['zone_exception']),
+                (ClubLogException, clublog_data['clublog']['exceptions']['exception']),
+                (ClubLogInvalidOperation, clublog_data['clublog']['invalid_operations']['invalid']),
+            )
+            counts = {}
+            with stats.phase('db'):
+                for model, records in sections:
+                    counts[model.__name__] = write_records(model, records, mode, batch_size).counts()
+
+    # Imported here: the resolver module imports these models
+    from .resolver import rebuild_resolver
+    # Other processes rebuild their resolver on their next lookup
+    transaction.on_commit(lambda: bump_version('clublog'))
+    with stats.phase('index'):
+        rebuild_resolver()
+    stats.rows = sum(count['created'] + count['updated'] + count['unchanged'] for count in counts.values())
+    logger.debug(stats.finish())
+    return counts
+
+
+def iter_clublog_records(source) -> Iterator[tuple[str, dict]]:
+    """
+    Parses cty.xml incrementally, yielding one record at a time:
+        <clublog><prefixes><prefix record="1">...</prefix>...</prefixes>...</clublog>
+    Records are the third level elements; they are turned into the same dicts
+    xmltodict builds (children as keys, attributes prefixed with @) and dropped
+    from the tree as soon as they are yielded, so memory does not grow with the file.
+
+    :param source: binary file-like object with the XML
+    :return: iterator of (record tag, dict) tuples
+    """
+    depth = 0
+    section = None
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                section = element
+            continue
+        if depth == 3:
+            record = {f'@{key}': value for key, value in element.attrib.items()}
+            for child in element:
+                record[_local_name(child.tag)] = child.text
+            yield _local_name(element.tag), record
+            section.clear()
+        depth -= 1
+
+
+def _local_name(tag: str) -> str:
+    """
+    Strips the namespace ElementTree puts in front of the tags: {https://clublog.org/cty/v1.2}prefix
 
-    zone_exceptions = clublog_data['clublog']['zone_exceptions']['zone_exception']
-    ClubLogZoneException.update_table(zone_exceptions)
+    :param tag: element tag
+    :return: tag without namespace
+    """
+    return tag.rsplit('}', 1)[-1]
 
-    exceptions = clublog_data['clublog']['exceptions']['exception']
-    ClubLogException.update_table(exceptions)
 
-    invalid_operations = clublog_data['clublog']['invalid_operations']['invalid']
-    ClubLogInvalidOperation.update_table(invalid_operations)
+def stream_update_tables(source, batch_size: int = BATCH_SIZE, mode: str = REPLACE,
+                         stats: RefreshStats = None) -> dict:
+    """
+    Feeds every record of a cty.xml stream to its table's BatchWriter.
+    Replace and diff write the five tables in one transaction; a swap must not be called inside one
+
+    :param source: binary file-like object with the (uncompressed) XML
+    :param batch_size: rows per bulk operation
+    :param mode: REPLACE, DIFF or SWAP
+    :param stats: if given, parsing time goes to its parse phase
+    :return: dict with created/updated/deleted/unchanged counts per model name
+    """
+    record_models = {
+        'entity': ClubLogEntity,
+        'prefix': ClubLogPrefix,
+        'zone_exception': ClubLogZoneException,
+        'exception': ClubLogException,
+        'invalid': ClubLogInvalidOperation,
+    }
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(load_transaction(ClubLogEntity, mode == SWAP))
+        writers = {tag: stack.enter_context(BatchWriter(model, batch_size, mode)) for tag, model in record_models.items()}
+        records = iter_clublog_records(source)
+        if stats is not None:
+            records = stats.timed(records, 'parse', excluding=('decompress',))
+        for tag, record in records:
+            model = record_models.get(tag)
+            if model is not None:
+                writers[tag].add(model.from_clublog(record))
+    return {writer.model.__name__: writer.counts() for writer in writers.values()}
 
 
 class ClubLogEntity(models.Model):
@@ -71,45 +179,50 @@ class ClubLogEntity(models.Model):
         return f'{self.name} ({self.adif})'
 
     @staticmethod
-    @transaction.atomic
-    def update_table(entities: list) -> int:
+    def from_clublog(entity: dict) -> 'ClubLogEntity':
+        """
+        Builds an instance from one entity record, as parsed from cty.xml
+
+        :param entity: dict with the XML children, attributes prefixed with @
+        :return: unsaved instance
+        """
+        ent = ClubLogEntity()
+        ent.adif = int(entity['adif'])
+        ent.name = entity['name']
+        ent.prefix = entity['prefix']
+        ent.deleted = entity['deleted'] == 'true'
+        ent.cqz = int(entity['cqz'])
+        ent.cont = entity['cont']
+        ent.long = float(entity['long'])
+        ent.lat = float(entity['lat'])
+        start = entity.get('start')
+        ent.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
+                                                                                           tzinfo=ZoneInfo('UTC'))
+        end = entity.get('end')
+        ent.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
+                                                                                     tzinfo=ZoneInfo('UTC'))
+        ent.whitelisted = entity.get('whitelisted', True)
+        whitelist_start = entity.get('whitelist_start')
+        ent.whitelist_start = datetime.datetime.fromisoformat(
+            whitelist_start) if whitelist_start else datetime.datetime(1900, 1, 1, tzinfo=ZoneInfo('UTC'))
+        whitelist_end = entity.get('whitelist_end')
+        ent.whitelist_end = datetime.datetime.fromisoformat(whitelist_end) if whitelist_end else datetime.datetime(
+            2100,
+            1, 1,
+            tzinfo=ZoneInfo(
+                'UTC'))
+        return ent
+
+    @staticmethod
+    def update_table(entities: list, mode: str = REPLACE) -> int:
         """
         Gets the list of entities and adds them to the database
 
         :param entities:
-        :return:
+        :param mode: REPLACE to rewrite the table, DIFF to only touch the delta, SWAP to load a shadow table
+        :return: number of records in the feed
         """
-        ClubLogEntity.objects.all().delete()
-        batch_list = []
-        for entity in entities:
-            ent = ClubLogEntity()
-            ent.adif = int(entity['adif'])
-            ent.name = entity['name']
-            ent.prefix = entity['prefix']
-            ent.deleted = entity['deleted'] == 'true'
-            ent.cqz = int(entity['cqz'])
-            ent.cont = entity['cont']
-            ent.long = float(entity['long'])
-            ent.lat = float(entity['lat'])
-            start = entity.get('start')
-            ent.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
-                                                                                               tzinfo=ZoneInfo('UTC'))
-            end = entity.get('end')
-            ent.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
-                                                                                         tzinfo=ZoneInfo('UTC'))
-            ent.whitelisted = entity.get('whitelisted', True)
-            whitelist_start = entity.get('whitelist_start')
-            ent.whitelist_start = datetime.datetime.fromisoformat(
-                whitelist_start) if whitelist_start else datetime.datetime(1900, 1, 1, tzinfo=ZoneInfo('UTC'))
-            whitelist_end = entity.get('whitelist_end')
-            ent.whitelist_end = datetime.datetime.fromisoformat(whitelist_end) if whitelist_end else datetime.datetime(
-                2100,
-                1, 1,
-                tzinfo=ZoneInfo(
-                    'UTC'))
-            batch_list.append(ent)
-        ClubLogEntity.objects.bulk_create(batch_list)
-        return len(batch_list)
+        return write_records(ClubLogEntity, entities, mode).count
 
     class Meta:
         verbose_name_plural = 'ClubLog Entities'
@@ -142,35 +255,40 @@ class ClubLogPrefix(models.Model):
         return f'{self.call} ({self.record})'
 
     @staticmethod
-    @transaction.atomic
-    def update_table(prefixes: list) -> int:
+    def from_clublog(prefix: dict) -> 'ClubLogPrefix':
+        """
+        Builds an instance from one prefix record, as parsed from cty.xml
+
+        :param prefix: dict with the XML children, attributes prefixed with @
+        :return: unsaved instance
+        """
+        pfx = ClubLogPrefix()
+        pfx.record = int(prefix['@record'])
+        pfx.call = prefix['call']
+        pfx.entity = prefix['entity']
+        pfx.adif = int(prefix['adif'])
+        pfx.cqz = int(prefix['cqz'])
+        pfx.cont = prefix['cont']
+        pfx.long = float(prefix.get('long', 0))
+        pfx.lat = float(prefix.get('lat', 0))
+        start = prefix.get('start')
+        pfx.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
+                                                                                           tzinfo=ZoneInfo('UTC'))
+        end = prefix.get('end')
+        pfx.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
+                                                                                     tzinfo=ZoneInfo('UTC'))
+        return pfx
+
+    @staticmethod
+    def update_table(prefixes: list, mode: str = REPLACE) -> int:
         """
         Gets the list of prefixes and adds them to the database
 
         :param prefixes: list
-        :return:
+        :param mode: REPLACE to rewrite the table, DIFF to only touch the delta, SWAP to load a shadow table
+        :return: number of records in the feed
         """
-        ClubLogPrefix.objects.all().delete()
-        batch_list = []
-        for prefix in prefixes:
-            pfx = ClubLogPrefix()
-            pfx.record = int(prefix['@record'])
-            pfx.call = prefix['call']
-            pfx.entity = prefix['entity']
-            pfx.adif = int(prefix['adif'])
-            pfx.cqz = int(prefix['cqz'])
-            pfx.cont = prefix['cont']
-            pfx.long = float(prefix.get('long', 0))
-            pfx.lat = float(prefix.get('lat', 0))
-            start = prefix.get('start')
-            pfx.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
-                                                                                               tzinfo=ZoneInfo('UTC'))
-            end = prefix.get('end')
-            pfx.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
-                                                                                         tzinfo=ZoneInfo('UTC'))
-            batch_list.append(pfx)
-        ClubLogPrefix.objects.bulk_create(batch_list)
-        return len(batch_list)
+        return write_records(ClubLogPrefix, prefixes, mode).count
 
     class Meta:
         verbose_name_plural = 'ClubLog Prefixes'
@@ -198,30 +316,35 @@ class ClubLogZoneException(models.Model):
         return f'{self.call} ({self.record})'
 
     @staticmethod
-    @transaction.atomic
-    def update_table(zone_exceptions: list) -> int:
+    def from_clublog(prefix: dict) -> 'ClubLogZoneException':
+        """
+        Builds an instance from one zone exception record, as parsed from cty.xml
+
+        :param prefix: dict with the XML children, attributes prefixed with @
+        :return: unsaved instance
+        """
+        exc = ClubLogZoneException()
+        exc.record = int(prefix['@record'])
+        exc.call = prefix['call']
+        exc.zone = int(prefix['zone'])
+        start = prefix.get('start')
+        exc.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
+                                                                                           tzinfo=ZoneInfo('UTC'))
+        end = prefix.get('end')
+        exc.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
+                                                                                     tzinfo=ZoneInfo('UTC'))
+        return exc
+
+    @staticmethod
+    def update_table(zone_exceptions: list, mode: str = REPLACE) -> int:
         """
         Gets the list of zone exceptions and adds them to the database
 
         :param zone_exceptions: list
-        :return:
+        :param mode: REPLACE to rewrite the table, DIFF to only touch the delta, SWAP to load a shadow table
+        :return: number of records in the feed
         """
-        ClubLogZoneException.objects.all().delete()
-        batch_list = []
-        for prefix in zone_exceptions:
-            exc = ClubLogZoneException()
-            exc.record = int(prefix['@record'])
-            exc.call = prefix['call']
-            exc.zone = int(prefix['zone'])
-            start = prefix.get('start')
-            exc.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
-                                                                                               tzinfo=ZoneInfo('UTC'))
-            end = prefix.get('end')
-            exc.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
-                                                                                         tzinfo=ZoneInfo('UTC'))
-            batch_list.append(exc)
-        ClubLogZoneException.objects.bulk_create(batch_list)
-        return len(batch_list)
+        return write_records(ClubLogZoneException, zone_exceptions, mode).count
 
     class Meta:
         verbose_name_plural = 'ClubLog Zone Exceptions'
@@ -254,35 +377,40 @@ class ClubLogException(models.Model):
         return f'{self.call} ({self.record})'
 
     @staticmethod
-    @transaction.atomic
-    def update_table(exceptions: list) -> int:
+    def from_clublog(exc: dict) -> 'ClubLogException':
+        """
+        Builds an instance from one exception record, as parsed from cty.xml
+
+        :param exc: dict with the XML children, attributes prefixed with @
+        :return: unsaved instance
+        """
+        clexc = ClubLogException()
+        clexc.record = int(exc['@record'])
+        clexc.call = exc['call']
+        clexc.entity = exc['entity']
+        clexc.adif = int(exc['adif'])
+        clexc.cqz = int(exc.get('cqz', 0))
+        clexc.cont = exc.get('cont', '')
+        clexc.long = float(exc.get('long', 0))
+        clexc.lat = float(exc.get('lat', 0))
+        start = exc.get('start')
+        clexc.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
+                                                                                             tzinfo=ZoneInfo('UTC'))
+        end = exc.get('end')
+        clexc.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
+                                                                                       tzinfo=ZoneInfo('UTC'))
+        return clexc
+
+    @staticmethod
+    def update_table(exceptions: list, mode: str = REPLACE) -> int:
         """
         Gets the list of prefixes and adds them to the database
 
         :param exceptions: list
-        :return:
+        :param mode: REPLACE to rewrite the table, DIFF to only touch the delta, SWAP to load a shadow table
+        :return: number of records in the feed
         """
-        ClubLogException.objects.all().delete()
-        batch_list = []
-        for exc in exceptions:
-            clexc = ClubLogException()
-            clexc.record = int(exc['@record'])
-            clexc.call = exc['call']
-            clexc.entity = exc['entity']
-            clexc.adif = int(exc['adif'])
-            clexc.cqz = int(exc.get('cqz', 0))
-            clexc.cont = exc.get('cont', '')
-            clexc.long = float(exc.get('long', 0))
-            clexc.lat = float(exc.get('lat', 0))
-            start = exc.get('start')
-            clexc.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
-                                                                                                 tzinfo=ZoneInfo('UTC'))
-            end = exc.get('end')
-            clexc.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
-                                                                                           tzinfo=ZoneInfo('UTC'))
-            batch_list.append(clexc)
-        ClubLogException.objects.bulk_create(batch_list)
-        return len(batch_list)
+        return write_records(ClubLogException, exceptions, mode).count
 
     class Meta:
         verbose_name_plural = 'ClubLog Exceptions'
@@ -309,29 +437,34 @@ class ClubLogInvalidOperation(models.Model):
         return f'{self.call} ({self.record})'
 
     @staticmethod
-    @transaction.atomic
-    def update_table(invalid_records: list) -> int:
+    def from_clublog(invalid: dict) -> 'ClubLogInvalidOperation':
+        """
+        Builds an instance from one invalid operation record, as parsed from cty.xml
+
+        :param invalid: dict with the XML children, attributes prefixed with @
+        :return: unsaved instance
+        """
+        inv = ClubLogInvalidOperation()
+        inv.record = int(invalid['@record'])
+        inv.call = invalid['call']
+        start = invalid.get('start')
+        inv.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
+                                                                                           tzinfo=ZoneInfo('UTC'))
+        end = invalid.get('end')
+        inv.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
+                                                                                     tzinfo=ZoneInfo('UTC'))
+        return inv
+
+    @staticmethod
+    def update_table(invalid_records: list, mode: str = REPLACE) -> int:
         """
         Gets the list of invalid records and adds them to the database
 
         :param invalid_records: list
-        :return:
+        :param mode: REPLACE to rewrite the table, DIFF to only touch the delta, SWAP to load a shadow table
+        :return: number of records in the feed
         """
-        ClubLogInvalidOperation.objects.all().delete()
-        batch_list = []
-        for invalid in invalid_records:
-            inv = ClubLogInvalidOperation()
-            inv.record = int(invalid['@record'])
-            inv.call = invalid['call']
-            start = invalid.get('start')
-            inv.start = datetime.datetime.fromisoformat(start) if start else datetime.datetime(1900, 1, 1,
-                                                                                               tzinfo=ZoneInfo('UTC'))
-            end = invalid.get('end')
-            inv.end = datetime.datetime.fromisoformat(end) if end else datetime.datetime(2100, 1, 1,
-                                                                                         tzinfo=ZoneInfo('UTC'))
-            batch_list.append(inv)
-        ClubLogInvalidOperation.objects.bulk_create(batch_list)
-        return len(batch_list)
+        return write_records(ClubLogInvalidOperation, invalid_records, mode).count
 
     class Meta:
         verbose_name_plural = 'ClubLog Zone Invalid Operations'
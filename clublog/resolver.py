@@ -0,0 +1,238 @@
+# clublog/resolver
+#
+# In-memory DXCC resolver built from the ClubLog tables
+#
+import datetime
+import re
+import threading
+from typing import NamedTuple
+
+from tools.versions import VersionWatch
+
+from .models import (ClubLogException, ClubLogInvalidOperation, ClubLogPrefix,
+                     ClubLogZoneException)
+
+# Suffixes which do not change the DXCC entity of the operator
+IGNORED_SUFFIXES = frozenset(('P', 'M', 'QRP', 'QRPP', 'A', 'B', 'LH', 'J'))
+# Suffixes which mean "no DXCC entity at all"
+NO_ENTITY_SUFFIXES = frozenset(('MM', 'AM'))
+# Call area digit of a callsign: the last digit, followed by letters only (W1AW, 3D2AB)
+CALL_AREA = re.compile(r'\d(?=[A-Z]*$)')
+
+
+class DXCCInfo(NamedTuple):
+    """
+    Result of resolving a callsign
+    """
+    call: str
+    adif: int
+    entity: str
+    cqz: int
+    cont: str
+    lat: float
+    long: float
+
+
+def _timestamp(value: datetime.datetime) -> float:
+    """
+    Aware or naive (taken as UTC) datetime to POSIX timestamp
+
+    :param value: datetime
+    :return: seconds since epoch
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def _pick(candidates: list, when: float):
+    """
+    First candidate whose [start, end] window contains when
+
+    :param candidates: list of (start, end, payload) tuples
+    :param when: timestamp
+    :return: payload or None
+    """
+    for start, end, payload in candidates:
+        if start <= when <= end:
+            return payload
+    return None
+
+
+class CallsignResolver:
+    """
+    Answers callsign -> DXCC questions without touching the database.
+
+    Exact-call tables (exceptions, zone exceptions, invalid operations) are dicts
+    keyed by callsign; prefixes are a dict keyed by prefix, probed from the longest
+    possible prefix down, so a lookup costs at most len(call) dict hits.
+    Every key maps to a list of (start, end, payload) tuples to honour validity windows.
+    """
+
+    def __init__(self, prefixes: dict, exceptions: dict, zone_exceptions: dict, invalid: dict) -> None:
+        """
+        Use from_database() unless you are building the tables yourself
+
+        :param prefixes: prefix -> [(start, end, (adif, entity, cqz, cont, lat, long)), ...]
+        :param exceptions: call -> [(start, end, (adif, entity, cqz, cont, lat, long)), ...]
+        :param zone_exceptions: call -> [(start, end, zone), ...]
+        :param invalid: call -> [(start, end, True), ...]
+        """
+        self.prefixes = prefixes
+        self.exceptions = exceptions
+        self.zone_exceptions = zone_exceptions
+        self.invalid = invalid
+        self.max_prefix_length = max((len(pfx) for pfx in prefixes), default=0)
+
+    @classmethod
+    def from_database(cls) -> 'CallsignResolver':
+        """
+        Reads the ClubLog tables once and builds the lookup dicts
+
+        :return: a new resolver
+        """
+        prefixes = {}
+        for row in ClubLogPrefix.objects.values_list(
+                'call', 'start', 'end', 'adif', 'entity', 'cqz', 'cont', 'lat', 'long').iterator(chunk_size=5000):
+            prefixes.setdefault(row[0], []).append((_timestamp(row[1]), _timestamp(row[2]), row[3:]))
+
+        exceptions = {}
+        for row in ClubLogException.objects.values_list(
+                'call', 'start', 'end', 'adif', 'entity', 'cqz', 'cont', 'lat', 'long').iterator(chunk_size=5000):
+            exceptions.setdefault(row[0], []).append((_timestamp(row[1]), _timestamp(row[2]), row[3:]))
+
+        zone_exceptions = {}
+        for call, start, end, zone in ClubLogZoneException.objects.values_list(
+                'call', 'start', 'end', 'zone').iterator(chunk_size=5000):
+            zone_exceptions.setdefault(call, []).append((_timestamp(start), _timestamp(end), zone))
+
+        invalid = {}
+        for call, start, end in ClubLogInvalidOperation.objects.values_list(
+                'call', 'start', 'end').iterator(chunk_size=5000):
+            invalid.setdefault(call, []).append((_timestamp(start), _timestamp(end), True))
+
+        return cls(prefixes, exceptions, zone_exceptions, invalid)
+
+    def resolve(self, call: str, when: datetime.datetime = None) -> DXCCInfo | None:
+        """
+        Resolves a callsign to its DXCC entity, CQ zone, continent and coordinates
+
+        :param call: callsign, portable prefixes and suffixes allowed (EA8/EA3IEG/P)
+        :param when: date of the QSO, now if None
+        :return: DXCCInfo, or None for invalid operations and unknown calls
+        """
+        call = call.strip().upper()
+        when = _timestamp(when) if when is not None else datetime.datetime.now(datetime.timezone.utc).timestamp()
+
+        if _pick(self.invalid.get(call, ()), when):
+            return None
+
+        details = _pick(self.exceptions.get(call, ()), when)
+        if details is None:
+            lookup = self._lookup_string(call)
+            if lookup is None:
+                return None
+            details = _pick(self.exceptions.get(lookup, ()), when) if lookup != call else None
+            if details is None:
+                details = self._longest_prefix(lookup, when)
+                if details is None:
+                    return None
+
+        adif, entity, cqz, cont, lat, long = details
+        zone = _pick(self.zone_exceptions.get(call, ()), when)
+        return DXCCInfo(call, adif, entity, zone if zone is not None else cqz, cont, lat, long)
+
+    def _longest_prefix(self, lookup: str, when: float):
+        """
+        Walks the prefix dict from the longest candidate down
+
+        :param lookup: string to match against prefixes
+        :param when: timestamp
+        :return: details tuple or None
+        """
+        prefixes = self.prefixes
+        for length in range(min(len(lookup), self.max_prefix_length), 0, -1):
+            candidates = prefixes.get(lookup[:length])
+            if candidates:
+                details = _pick(candidates, when)
+                if details is not None:
+                    return details
+        return None
+
+    @staticmethod
+    def _lookup_string(call: str) -> str | None:
+        """
+        Which part of a compound callsign decides the entity
+            EA3IEG/P -> EA3IEG
+            EA8/EA3IEG -> EA8
+            EA3IEG/MM -> None (no entity)
+            W1AW/4 -> W4AW (call area moved)
+
+        :param call: uppercased callsign
+        :return: string to match against prefixes
+        """
+        if '/' not in call:
+            return call
+        parts = [part for part in call.split('/') if part]
+        while len(parts) > 1 and parts[-1] in IGNORED_SUFFIXES:
+            parts.pop()
+        if len(parts) > 1 and parts[-1] in NO_ENTITY_SUFFIXES:
+            return None
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        if len(parts[1]) == 1 and parts[1].isdigit():
+            return CALL_AREA.sub(parts[1], parts[0], count=1)
+        # Portable prefix is the shorter part: EA8/EA3IEG or EA3IEG/EA8
+        return min(parts[:2], key=len)
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+# ClubLog refreshes made by other processes (cron, run_refresher)
+_versions = VersionWatch('clublog')
+
+
+def get_resolver(reload: bool = True) -> CallsignResolver:
+    """
+    Process-wide resolver, built on first use and rebuilt once the ClubLog tables were refreshed, by any process
+
+    :param reload: False in an event loop, where the database cannot be read: reloads are left to the caller
+    :return: CallsignResolver
+    """
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _versions.mark()
+                _resolver = CallsignResolver.from_database()
+    elif reload and _versions.changed():
+        return rebuild_resolver()
+    return _resolver
+
+
+def rebuild_resolver() -> CallsignResolver:
+    """
+    Builds a fresh resolver and swaps it in with a single assignment,
+    so concurrent lookups see either the old tables or the new ones, never a mix
+
+    :return: the new resolver
+    """
+    global _resolver
+    _versions.mark()
+    resolver = CallsignResolver.from_database()
+    with _resolver_lock:
+        _resolver = resolver
+    return resolver
+
+
+def resolve(call: str, when: datetime.datetime = None) -> DXCCInfo | None:
+    """
+    Shortcut to get_resolver().resolve()
+
+    :param call: callsign
+    :param when: date of the QSO, now if None
+    :return: DXCCInfo or None
+    """
+    return get_resolver().resolve(call, when)
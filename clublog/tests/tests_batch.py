@@ -0,0 +1,80 @@
+# clublog/tests/tests_batch
+#
+# BatchWriter / write_records: replace and diff modes, and what each one counts
+#
+from django.test import TestCase
+
+from clublog.batch import DIFF, REPLACE, SWAP, BatchWriter, write_records
+from clublog.models import ClubLogEntity, ClubLogPrefix
+
+
+def prefix(record: int, call: str, cqz: int = 14) -> dict:
+    """
+    :return: cty.xml prefix record
+    """
+    return {'@record': str(record), 'call': call, 'entity': 'SPAIN', 'adif': '281', 'cqz': str(cqz), 'cont': 'EU',
+            'lat': '40.0', 'long': '-4.0'}
+
+
+FEED = [prefix(1, 'EA'), prefix(2, 'EB'), prefix(3, 'EC'), prefix(4, 'ED')]
+
+
+class DiffModeTests(TestCase):
+
+    def setUp(self):
+        write_records(ClubLogPrefix, FEED, REPLACE)
+
+    def test_unchanged_feed_writes_nothing(self):
+        writer = write_records(ClubLogPrefix, FEED, DIFF)
+        self.assertEqual(writer.counts(), {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 4})
+        self.assertEqual(writer.count, 4)
+
+    def test_delta(self):
+        feed = [prefix(1, 'EA'), prefix(2, 'EB', cqz=33), prefix(4, 'ED'), prefix(5, 'EE')]
+        writer = write_records(ClubLogPrefix, feed, DIFF)
+        self.assertEqual(writer.counts(), {'created': 1, 'updated': 1, 'deleted': 1, 'unchanged': 2})
+        self.assertEqual(list(ClubLogPrefix.objects.order_by('record').values_list('record', 'call', 'cqz')),
+                         [(1, 'EA', 14), (2, 'EB', 33), (4, 'ED', 14), (5, 'EE', 14)])
+
+    def test_delta_across_batches(self):
+        feed = [prefix(3, 'EC', cqz=33)] + [prefix(record, f'E{record}') for record in range(10, 15)]
+        writer = write_records(ClubLogPrefix, feed, DIFF, batch_size=2)
+        self.assertEqual(writer.counts(), {'created': 5, 'updated': 1, 'deleted': 3, 'unchanged': 0})
+        self.assertEqual(sorted(ClubLogPrefix.objects.values_list('record', flat=True)), [3, 10, 11, 12, 13, 14])
+
+    def test_deletes_page_by_page(self):
+        write_records(ClubLogPrefix, [prefix(record, f'E{record}') for record in range(10, 20)], DIFF)
+        writer = write_records(ClubLogPrefix, [prefix(2, 'EB'), prefix(15, 'E15')], DIFF, batch_size=3)
+        self.assertEqual(writer.counts(), {'created': 1, 'updated': 0, 'deleted': 9, 'unchanged': 1})
+        self.assertEqual(sorted(ClubLogPrefix.objects.values_list('record', flat=True)), [2, 15])
+
+    def test_feed_strings_compare_equal_to_stored_values(self):
+        entity = {'adif': '281', 'name': 'SPAIN', 'prefix': 'EA', 'deleted': 'false', 'cqz': '14', 'cont': 'EU',
+                  'long': '-4.0', 'lat': '40.0', 'whitelisted': 'False'}
+        self.assertEqual(write_records(ClubLogEntity, [entity], DIFF).counts()['created'], 1)
+        self.assertFalse(ClubLogEntity.objects.get().whitelisted)
+        self.assertEqual(write_records(ClubLogEntity, [entity], DIFF).counts()['unchanged'], 1)
+
+    def test_error_leaves_table_untouched(self):
+        feed = [prefix(1, 'EA', cqz=33), prefix(9, 'EZ'), {'@record': '10'}]
+        with self.assertRaises(KeyError):
+            write_records(ClubLogPrefix, feed, DIFF, batch_size=1)
+        self.assertEqual(list(ClubLogPrefix.objects.order_by('record').values_list('record', 'cqz')),
+                         [(1, 14), (2, 14), (3, 14), (4, 14)])
+
+
+class ReplaceModeTests(TestCase):
+
+    def test_replace(self):
+        write_records(ClubLogPrefix, FEED, REPLACE)
+        writer = write_records(ClubLogPrefix, FEED[:2], REPLACE, batch_size=1)
+        self.assertEqual(writer.counts(), {'created': 2, 'updated': 0, 'deleted': 4, 'unchanged': 0})
+        self.assertEqual(ClubLogPrefix.objects.count(), 2)
+
+    def test_swap_falls_back_to_replace(self):
+        # Only Postgres tables can be swapped
+        self.assertEqual(BatchWriter(ClubLogPrefix, mode=SWAP).mode, REPLACE)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            BatchWriter(ClubLogPrefix, mode='merge')
@@ -0,0 +1,89 @@
+# clublog/tests/tests_cty
+#
+# Streaming cty.xml parser: same records as xmltodict, sections emptied as they are read
+#
+import io
+import xml.etree.ElementTree as ElementTree
+from unittest import mock
+
+import xmltodict
+from django.test import SimpleTestCase, TestCase
+
+from clublog.batch import DIFF
+from clublog.models import (ClubLogEntity, ClubLogException, ClubLogInvalidOperation, ClubLogPrefix,
+                            ClubLogZoneException, iter_clublog_records, stream_update_tables)
+
+CTY = b'''<?xml version="1.0" encoding="UTF-8"?>
+<clublog date="2024-05-01T12:00:00+00:00" xmlns="https://clublog.org/cty/v1.2">
+<entities>
+<entity><adif>281</adif><name>SPAIN</name><prefix>EA</prefix><deleted>false</deleted><cqz>14</cqz><cont>EU</cont><long>-3.70</long><lat>40.40</lat></entity>
+<entity><adif>29</adif><name>CANARY ISLANDS</name><prefix>EA8</prefix><deleted>false</deleted><cqz>33</cqz><cont>AF</cont><long>-15.40</long><lat>28.20</lat><start>1945-01-01T00:00:00+00:00</start></entity>
+</entities>
+<exceptions>
+<exception record="1"><call>KC4USV</call><entity>ANTARCTICA</entity><adif>13</adif><cqz>39</cqz><cont>AN</cont><long>166.70</long><lat>-77.80</lat><start>2020-01-01T00:00:00+00:00</start><end>2020-12-31T23:59:59+00:00</end></exception>
+<exception record="2"><call>EA8/DL1A</call><entity>CANARY ISLANDS</entity><adif>29</adif><cqz>33</cqz><cont>AF</cont><long>-15.40</long><lat>28.20</lat></exception>
+</exceptions>
+<prefixes>
+<prefix record="1"><call>EA</call><entity>SPAIN</entity><adif>281</adif><cqz>14</cqz><cont>EU</cont><long>-3.70</long><lat>40.40</lat></prefix>
+<prefix record="2"><call>EA8</call><entity>CANARY ISLANDS</entity><adif>29</adif><cqz>33</cqz><cont>AF</cont><long>-15.40</long><lat>28.20</lat></prefix>
+</prefixes>
+<invalid_operations>
+<invalid record="1"><call>EA9XX</call><start>2024-01-01T00:00:00+00:00</start><end>2024-06-30T23:59:59+00:00</end></invalid>
+<invalid record="2"><call>T88A</call></invalid>
+</invalid_operations>
+<zone_exceptions>
+<zone_exception record="1"><call>EA3IEG</call><zone>33</zone><start>2023-01-01T00:00:00+00:00</start><end>2023-12-31T23:59:59+00:00</end></zone_exception>
+<zone_exception record="2"><call>KC4AAA</call><zone>12</zone></zone_exception>
+</zone_exceptions>
+</clublog>
+'''
+SECTIONS = (('entities', 'entity'), ('exceptions', 'exception'), ('prefixes', 'prefix'),
+            ('invalid_operations', 'invalid'), ('zone_exceptions', 'zone_exception'))
+
+
+class IterClubLogRecordsTests(SimpleTestCase):
+
+    def test_same_records_as_xmltodict(self):
+        parsed = xmltodict.parse(CTY)['clublog']
+        streamed = list(iter_clublog_records(io.BytesIO(CTY)))
+        for section, tag in SECTIONS:
+            with self.subTest(section=section):
+                self.assertEqual([record for record_tag, record in streamed if record_tag == tag],
+                                 [dict(record) for record in parsed[section][tag]])
+        self.assertEqual(len(streamed), 10)
+
+    def test_sections_are_emptied(self):
+        elements = []
+        original = ElementTree.iterparse
+
+        def iterparse(source, events):
+            for event, element in original(source, events):
+                elements.append(element)
+                yield event, element
+
+        with mock.patch('clublog.models.ElementTree.iterparse', iterparse):
+            for _record in iter_clublog_records(io.BytesIO(CTY)):
+                pass
+        names = tuple(f'}}{section}' for section, _tag in SECTIONS)
+        sections = {id(element): element for element in elements if element.tag.endswith(names)}
+        self.assertEqual(len(sections), 5)
+        for section in sections.values():
+            self.assertEqual(len(section), 0)
+
+
+class StreamUpdateTablesTests(TestCase):
+
+    def test_loads_every_table(self):
+        counts = stream_update_tables(io.BytesIO(CTY), batch_size=1)
+        for model in (ClubLogEntity, ClubLogException, ClubLogPrefix, ClubLogInvalidOperation,
+                      ClubLogZoneException):
+            with self.subTest(model=model.__name__):
+                self.assertEqual(model.objects.count(), 2)
+                self.assertEqual(counts[model.__name__]['created'], 2)
+        self.assertEqual(ClubLogException.objects.get(record=1).end.year, 2020)
+
+    def test_diff_of_the_same_feed(self):
+        stream_update_tables(io.BytesIO(CTY))
+        counts = stream_update_tables(io.BytesIO(CTY), mode=DIFF)
+        self.assertEqual({name: count['unchanged'] for name, count in counts.items()},
+                         dict.fromkeys(counts, 2))
@@ -0,0 +1,117 @@
+# clublog/tests/tests_resolver
+#
+# CallsignResolver: validity windows of prefixes, exceptions, zone exceptions and invalid operations
+#
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.test import TestCase
+
+from clublog.models import (ClubLogException, ClubLogInvalidOperation, ClubLogPrefix,
+                            ClubLogZoneException)
+from clublog.resolver import CallsignResolver
+
+UTC = datetime.timezone.utc
+
+PREFIXES = [
+    {'@record': '1', 'call': 'EA', 'entity': 'SPAIN', 'adif': '281', 'cqz': '14', 'cont': 'EU',
+     'lat': '40.0', 'long': '-4.0'},
+    {'@record': '2', 'call': 'EA8', 'entity': 'CANARY ISLANDS', 'adif': '29', 'cqz': '33', 'cont': 'AF',
+     'lat': '28.3', 'long': '-15.8'},
+    {'@record': '3', 'call': 'K', 'entity': 'UNITED STATES OF AMERICA', 'adif': '291', 'cqz': '5', 'cont': 'NA',
+     'lat': '37.5', 'long': '-91.8'},
+    {'@record': '6', 'call': 'W', 'entity': 'UNITED STATES OF AMERICA', 'adif': '291', 'cqz': '5', 'cont': 'NA',
+     'lat': '37.5', 'long': '-91.8'},
+    {'@record': '4', 'call': 'Y2', 'entity': 'GERMAN DEMOCRATIC REPUBLIC', 'adif': '229', 'cqz': '14', 'cont': 'EU',
+     'lat': '52.5', 'long': '13.4', 'end': '1990-10-02T23:59:59+00:00'},
+    {'@record': '5', 'call': 'Y2', 'entity': 'FEDERAL REPUBLIC OF GERMANY', 'adif': '230', 'cqz': '14', 'cont': 'EU',
+     'lat': '51.0', 'long': '10.0', 'start': '1990-10-03T00:00:00+00:00'},
+]
+EXCEPTIONS = [
+    {'@record': '10', 'call': 'KC4USV', 'entity': 'ANTARCTICA', 'adif': '13', 'cqz': '39', 'cont': 'AN',
+     'lat': '-77.8', 'long': '166.7', 'start': '2020-01-01T00:00:00+00:00', 'end': '2020-12-31T23:59:59+00:00'},
+]
+ZONE_EXCEPTIONS = [
+    {'@record': '20', 'call': 'EA3IEG', 'zone': '33',
+     'start': '2023-01-01T00:00:00+00:00', 'end': '2023-12-31T23:59:59+00:00'},
+]
+INVALID_OPERATIONS = [
+    {'@record': '30', 'call': 'EA9XX', 'start': '2024-01-01T00:00:00+00:00', 'end': '2024-06-30T23:59:59+00:00'},
+]
+
+
+def day(year: int, month: int = 6, date: int = 15) -> datetime.datetime:
+    """
+    :return: noon UTC of that day
+    """
+    return datetime.datetime(year, month, date, 12, tzinfo=UTC)
+
+
+class CallsignResolverTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for model, records in ((ClubLogPrefix, PREFIXES), (ClubLogException, EXCEPTIONS),
+                               (ClubLogZoneException, ZONE_EXCEPTIONS),
+                               (ClubLogInvalidOperation, INVALID_OPERATIONS)):
+            model.update_table(records)
+
+    def setUp(self):
+        self.resolver = CallsignResolver.from_database()
+
+    def test_longest_prefix(self):
+        self.assertEqual(self.resolver.resolve('EA3IEG', day(2024)).adif, 281)
+        self.assertEqual(self.resolver.resolve('EA8AA', day(2024)).adif, 29)
+        self.assertEqual(self.resolver.resolve('ea8aa ', day(2024)).call, 'EA8AA')
+        self.assertIsNone(self.resolver.resolve('0ZZ', day(2024)))
+
+    def test_details(self):
+        info = self.resolver.resolve('EA3IEG', day(2024))
+        self.assertEqual((info.call, info.entity, info.cqz, info.cont, info.lat, info.long),
+                         ('EA3IEG', 'SPAIN', 14, 'EU', 40.0, -4.0))
+
+    def test_prefix_windows(self):
+        self.assertEqual(self.resolver.resolve('Y21AB', day(1985)).adif, 229)
+        self.assertEqual(self.resolver.resolve('Y21AB', day(2000)).adif, 230)
+
+    def test_window_bounds_are_inclusive(self):
+        self.assertEqual(self.resolver.resolve('Y21AB', datetime.datetime(1990, 10, 2, 23, 59, 59, tzinfo=UTC)).adif,
+                         229)
+        self.assertEqual(self.resolver.resolve('Y21AB', datetime.datetime(1990, 10, 3, tzinfo=UTC)).adif, 230)
+
+    def test_naive_dates_are_utc(self):
+        self.assertEqual(self.resolver.resolve('Y21AB', datetime.datetime(1990, 10, 2, 23, 59, 59)).adif, 229)
+        # 1990-10-03 01:00 CET is midnight UTC
+        cet = datetime.datetime(1990, 10, 3, 1, tzinfo=ZoneInfo('CET'))
+        self.assertEqual(self.resolver.resolve('Y21AB', cet).adif, 230)
+
+    def test_exception_window(self):
+        self.assertEqual(self.resolver.resolve('KC4USV', day(2020)).adif, 13)
+        self.assertEqual(self.resolver.resolve('KC4USV', day(2021)).adif, 291)
+
+    def test_zone_exception_window(self):
+        self.assertEqual(self.resolver.resolve('EA3IEG', day(2023)).cqz, 33)
+        self.assertEqual(self.resolver.resolve('EA3IEG', day(2024)).cqz, 14)
+
+    def test_invalid_operation_window(self):
+        self.assertIsNone(self.resolver.resolve('EA9XX', day(2024, 3)))
+        self.assertEqual(self.resolver.resolve('EA9XX', day(2024, 8)).adif, 281)
+
+    def test_compound_calls(self):
+        self.assertEqual(self.resolver.resolve('EA8/EA3IEG', day(2024)).adif, 29)
+        self.assertEqual(self.resolver.resolve('EA3IEG/EA8', day(2024)).adif, 29)
+        self.assertEqual(self.resolver.resolve('EA3IEG/P', day(2024)).adif, 281)
+        self.assertEqual(self.resolver.resolve('EA8/EA3IEG/QRP', day(2024)).adif, 29)
+        self.assertEqual(self.resolver.resolve('KC4USV/P', day(2020)).adif, 13)
+        self.assertIsNone(self.resolver.resolve('EA3IEG/MM', day(2024)))
+
+    def test_call_area_suffix(self):
+        self.assertEqual(self.resolver.resolve('W1AW/4', day(2024)).adif, 291)
+        self.assertEqual(self.resolver.resolve('EA3IEG/1', day(2024)).adif, 281)
+        self.assertEqual(self.resolver.resolve('EA3IEG/8', day(2024)).adif, 29)
+        self.assertEqual(self.resolver.resolve('EA3IEG/8/P', day(2024)).adif, 29)
+        self.assertEqual(CallsignResolver._lookup_string('W1AW/4'), 'W4AW')
+        self.assertEqual(CallsignResolver._lookup_string('3D2AB/5'), '3D5AB')
+
+    def test_defaults_to_now(self):
+        self.assertEqual(self.resolver.resolve('Y21AB').adif, 230)
@@ -0,0 +1,125 @@
+# clublog/tests/tests_views
+#
+# DXCCResolveView: request parsing, GET / POST parity, the MAX_CALLS limit and the LoTW / eQSL fields
+#
+import datetime
+import math
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.exceptions import ValidationError
+
+from clublog import views
+from clublog.resolver import CallsignResolver
+from clublog.views import MAX_CALLS, parse_calls
+from cust_user.models import CustomUser
+from qsling.membership import QSLMembershipIndex
+
+UTC = datetime.timezone.utc
+ALWAYS = (-math.inf, math.inf)
+RESOLVER = CallsignResolver(
+    prefixes={'EA': [(*ALWAYS, (281, 'SPAIN', 14, 'EU', 40.0, -4.0))],
+              'EA8': [(*ALWAYS, (29, 'CANARY ISLANDS', 33, 'AF', 28.3, -15.8))],
+              'K': [(*ALWAYS, (291, 'UNITED STATES OF AMERICA', 5, 'NA', 37.5, -91.8))]},
+    exceptions={}, zone_exceptions={},
+    invalid={'EA9XX': [(datetime.datetime(2024, 1, 1, tzinfo=UTC).timestamp(),
+                        datetime.datetime(2024, 6, 30, tzinfo=UTC).timestamp(), True)]})
+MEMBERSHIP = QSLMembershipIndex({'EA3IEG': datetime.datetime(2024, 5, 1, 10, 30, tzinfo=UTC)}, frozenset({'EA3IEG', 'K1ABC'}))
+
+
+class ParseCallsTests(SimpleTestCase):
+
+    def assertInvalid(self, data, message: str) -> None:
+        with self.assertRaises(ValidationError) as raised:
+            parse_calls(data)
+        self.assertIn(message, str(raised.exception.detail))
+
+    def test_comma_separated(self):
+        self.assertEqual(parse_calls({'calls': 'EA3IEG, k1abc ,,ea8/ea3ieg/p,'}),
+                         [('EA3IEG', None), ('K1ABC', None), ('EA8/EA3IEG/P', None)])
+
+    def test_list_with_times(self):
+        when = datetime.datetime(2024, 5, 1, 12, tzinfo=UTC)
+        self.assertEqual(parse_calls({'calls': [' ea3ieg ', {'call': 'K1ABC', 'when': '2023-01-02T00:00:00+00:00'},
+                                                {'call': 'EA8AA', 'when': ''}],
+                                      'when': '2024-05-01T12:00:00Z'}),
+                         [('EA3IEG', when), ('K1ABC', datetime.datetime(2023, 1, 2, tzinfo=UTC)), ('EA8AA', when)])
+
+    def test_empty(self):
+        for data in ({}, {'calls': ''}, {'calls': ' , ,'}, {'calls': []}, {'calls': None}):
+            with self.subTest(data=data):
+                self.assertInvalid(data, 'A non empty list of callsigns is required.')
+        self.assertInvalid(['EA3IEG'], 'A JSON object is required.')
+
+    def test_invalid_items(self):
+        self.assertInvalid({'calls': ['EA3IEG', ' ']}, "calls[1]")
+        self.assertInvalid({'calls': ['EA3IEG', 42]}, 'Invalid callsign: 42')
+        self.assertInvalid({'calls': ['X' * 51]}, 'Invalid callsign')
+        self.assertInvalid({'calls': [{'when': '2024-01-01'}]}, 'Invalid callsign: None')
+        self.assertInvalid({'calls': [{'call': 'EA3IEG', 'when': 'yesterday'}]}, "calls[0].when")
+        self.assertInvalid({'calls': ['EA3IEG'], 'when': 20240101}, 'Invalid timestamp: 20240101')
+
+    def test_max_calls(self):
+        self.assertEqual(len(parse_calls({'calls': ['EA3IEG'] * MAX_CALLS})), MAX_CALLS)
+        self.assertInvalid({'calls': ['EA3IEG'] * (MAX_CALLS + 1)}, f'At most {MAX_CALLS} callsigns per request.')
+        self.assertInvalid({'calls': ','.join(['EA3IEG'] * (MAX_CALLS + 1))}, f'At most {MAX_CALLS}')
+
+
+class DXCCResolveViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('op@example.com', 'secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('dxcc-resolve')
+        for patcher in (mock.patch.object(views, 'get_resolver', return_value=RESOLVER),
+                        mock.patch.object(views, 'get_membership_index', return_value=MEMBERSHIP)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_results(self):
+        response = self.client.post(self.url, {'calls': ['ea3ieg', 'EA8/EA3IEG/P', 'K1ABC', 'ZZ9ZZ', 'EA9XX'],
+                                               'when': '2024-03-01T00:00:00Z'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[0], {'call': 'EA3IEG', 'adif': 281, 'entity': 'SPAIN', 'cqz': 14, 'cont': 'EU',
+                                      'lat': 40.0, 'long': -4.0, 'lotw': '2024-05-01T10:30:00+00:00', 'eqsl': True})
+        self.assertEqual([(result['call'], result['adif'], result['lotw'], result['eqsl']) for result in results[1:]],
+                         [('EA8/EA3IEG/P', 29, None, False), ('K1ABC', 291, None, True),
+                          ('ZZ9ZZ', None, None, False), ('EA9XX', None, None, False)])
+        # Unknown calls and invalid operations have every entity field null
+        self.assertEqual(set(results[3]), set(results[0]))
+        self.assertEqual({key for key, value in results[4].items() if value is not None}, {'call', 'eqsl'})
+
+    def test_when(self):
+        # The invalid operation window only covers the first half of 2024
+        response = self.client.post(self.url, {'calls': ['EA9XX', {'call': 'EA9XX', 'when': '2024-08-01T00:00:00Z'}],
+                                               'when': '2024-03-01T00:00:00Z'}, content_type='application/json')
+        self.assertEqual([result['adif'] for result in response.json()['results']], [None, 281])
+
+    def test_get_and_post_agree(self):
+        calls = ['EA3IEG', 'K1ABC', 'ZZ9ZZ']
+        get = self.client.get(self.url, {'calls': ', '.join(calls), 'when': '2024-03-01T00:00:00Z'})
+        post = self.client.post(self.url, {'calls': calls, 'when': '2024-03-01T00:00:00Z'},
+                                content_type='application/json')
+        self.assertEqual((get.status_code, post.status_code), (200, 200))
+        self.assertEqual(get.content, post.content)
+        self.assertEqual(get['Content-Type'], 'application/json')
+
+    def test_too_many_calls(self):
+        response = self.client.post(self.url, {'calls': ['EA3IEG'] * (MAX_CALLS + 1)}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'calls': f'At most {MAX_CALLS} callsigns per request.'})
+        response = self.client.post(self.url, {'calls': ['EA3IEG'] * MAX_CALLS}, content_type='application/json')
+        self.assertEqual(len(response.json()['results']), MAX_CALLS)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.post(self.url, ['EA3IEG'], content_type='application/json').status_code, 400)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url, {'calls': 'EA3IEG'}).status_code, 403)
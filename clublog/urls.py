@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import views as clublog_views
+
+urlpatterns = [
+    path('resolve/', clublog_views.DXCCResolveView.as_view(), name='dxcc-resolve'),
+]
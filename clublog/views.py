@@ -1,3 +1,103 @@
-# from django.shortcuts import render
+# clublog/views
+#
+# Bulk callsign -> DXCC resolution, answered from the in-memory resolver and membership index
+#
+import datetime
+from collections.abc import Mapping
 
-# Create your views here.
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from qsling.membership import get_membership_index
+from tools.renderers import ORJSONRenderer
+
+from .resolver import DXCCInfo, get_resolver
+
+# Callsigns accepted per request
+MAX_CALLS = 1000
+# Result of a callsign the resolver does not know
+UNRESOLVED = dict.fromkeys(DXCCInfo._fields)
+
+
+def _parse_when(value, position: str) -> datetime.datetime | None:
+    """
+    :param value: ISO 8601 string, or None
+    :param position: where it came from, for the error message
+    :return: datetime (naive ones are UTC for the resolver), or None
+    """
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError({position: f'Invalid timestamp: {value!r}'}) from None
+
+
+def parse_calls(data) -> list:
+    """
+    Validates the request by hand: DRF serializers cost more than the lookups for hundreds of items.
+    Accepts
+        {"calls": ["EA3IEG", {"call": "K1ABC", "when": "2024-05-01T12:00:00Z"}], "when": "..."}
+    where "when" (optional) is the QSO time; the top level one applies to calls without their own
+
+    :param data: request data (dict) or query params
+    :return: list of (callsign, datetime or None)
+    """
+    if not isinstance(data, Mapping):
+        raise ValidationError('A JSON object is required.')
+    calls = data.get('calls')
+    if isinstance(calls, str):
+        calls = [call for call in calls.split(',') if call.strip()]
+    if not isinstance(calls, list) or not calls:
+        raise ValidationError({'calls': 'A non empty list of callsigns is required.'})
+    if len(calls) > MAX_CALLS:
+        raise ValidationError({'calls': f'At most {MAX_CALLS} callsigns per request.'})
+    default_when = _parse_when(data.get('when'), 'when')
+    parsed = []
+    for position, item in enumerate(calls):
+        if isinstance(item, dict):
+            call = item.get('call')
+            when = _parse_when(item.get('when'), f'calls[{position}].when') or default_when
+        else:
+            call, when = item, default_when
+        if not isinstance(call, str) or not call.strip() or len(call) > 50:
+            raise ValidationError({f'calls[{position}]': f'Invalid callsign: {call!r}'})
+        parsed.append((call.strip().upper(), when))
+    return parsed
+
+
+class DXCCResolveView(APIView):
+    """
+    API endpoint resolving a batch of callsigns to DXCC entity, ADIF code, CQ zone, continent,
+    coordinates and LoTW / eQSL membership. POST {"calls": [...]} or GET ?calls=EA3IEG,K1ABC
+    Results come in request order; unknown or invalid operations have null entity fields.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [ORJSONRenderer]
+
+    def get(self, request):
+        return self.resolve(request.query_params)
+
+    def post(self, request):
+        return self.resolve(request.data)
+
+    @staticmethod
+    def resolve(data) -> Response:
+        """
+        :param data: request data or query params
+        :return: Response with a results list
+        """
+        calls = parse_calls(data)
+        resolve = get_resolver().resolve
+        membership = get_membership_index().lookup_many(call for call, _when in calls)
+        results = []
+        for call, when in calls:
+            dxcc = resolve(call, when)
+            member = membership[call]
+            result = dxcc._asdict() if dxcc is not None else dict(UNRESOLVED, call=call)
+            result['lotw'] = member.lotw
+            result['eqsl'] = member.eqsl
+            results.append(result)
+        return Response({'results': results})
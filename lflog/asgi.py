@@ -4,19 +4,32 @@ import os
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
+from django.conf import settings
 from django.core.asgi import get_asgi_application
-from chat.routing import websocket_urlpatterns
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 # Initialize Django ASGI application early to ensure the AppRegistry
 # is populated before importing code that may import ORM models.
 django_asgi_app = get_asgi_application()
 
+# Consumers import models: only once the app registry is ready
+from chat.routing import websocket_urlpatterns  # noqa: E402
+
+if settings.WEBSOCKET_METRICS:
+    from .middleware import WebsocketMetricsMiddleware
+
+    websocket_app = WebsocketMetricsMiddleware(URLRouter(websocket_urlpatterns), auth=AuthMiddlewareStack)
+else:
+    websocket_app = AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
-        "websocket": AllowedHostsOriginValidator(
-            AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
-        ),
+        "websocket": AllowedHostsOriginValidator(websocket_app),
     }
 )
+
+if settings.REFERENCE_REFRESH_IN_PROCESS:
+    from .refresher import PeriodicRefresher, RefresherLifespan
+
+    application = RefresherLifespan(application, PeriodicRefresher.from_settings())
@@ -0,0 +1,245 @@
+# lflog/metrics
+#
+# Minimal in-process metrics registry (counters, gauges, histograms) rendered in the
+# Prometheus text format on /metrics/. Values are per process: scrape each worker.
+#
+import abc
+import bisect
+import math
+import threading
+from typing import Iterable
+
+# Seconds, from 1 ms to 10 s
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    """
+    :param value: label value
+    :return: value escaped for the text format
+    """
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    """
+    :param names: label names
+    :param values: label values
+    :param extra: already formatted label to append (le="...")
+    :return: {a="1",b="2"} or empty string
+    """
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    """
+    :param value: sample value
+    :return: text format number
+    """
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    """
+    Base class: a name, help text, label names and one value (or set of values) per label combination
+    """
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        """
+        :param name: metric name, e.g. lflog_requests_total
+        :param documentation: HELP text
+        :param labelnames: label names, values are given in the same order
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        """
+        :param labels: label name: value
+        :return: values in labelnames order
+        """
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def remove(self, **labels) -> None:
+        """
+        Forgets a label combination, so short lived ones (a chat room) do not pile up
+
+        :param labels: label values
+        :return:
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values.pop(key, None)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterable[str]:
+        """
+        :return: text format lines of the values
+        """
+
+    def render(self) -> str:
+        """
+        :return: HELP, TYPE and sample lines
+        """
+        with self.lock:
+            samples = list(self.samples())
+        return '\n'.join([f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}', *samples])
+
+
+class Counter(Metric):
+    """
+    Value that only goes up
+    """
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        :param amount: increment
+        :param labels: label values
+        :return:
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """
+        :param labels: label values
+        :return: current value, 0 if never set
+        """
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self.values.items():
+            yield f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down
+    """
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        """
+        :param value: new value
+        :param labels: label values
+        :return:
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        """
+        :param amount: decrement
+        :param labels: label values
+        :return:
+        """
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observations in cumulative buckets, plus their sum and count
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = TIME_BUCKETS) -> None:
+        """
+        :param buckets: upper bounds, ascending; +Inf is added
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        :param value: observation
+        :param labels: label values
+        :return:
+        """
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # One slot per bucket, one for +Inf, then sum and count
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[position] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        for key, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {_number(counts[-2])}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}'
+
+
+class Registry:
+    """
+    Holds the metrics of the process; registering a name twice returns the first metric
+    """
+
+    def __init__(self) -> None:
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        :param metric: new metric
+        :return: the registered metric with that name
+        """
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = TIME_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector) -> None:
+        """
+        Registers a function called before each render, to set gauges that are cheaper to read than to track
+
+        :param collector: callable without arguments
+        :return:
+        """
+        with self.lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        :return: every metric in the Prometheus text format
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        for collector in collectors:
+            collector()
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
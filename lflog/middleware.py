@@ -0,0 +1,341 @@
+# lflog/middleware
+#
+# Opt-in per request instrumentation (settings.REQUEST_TIMING): query count, DB time,
+# render time and total time, sent back as a Server-Timing header and aggregated per view on /metrics/.
+# Opt-in websocket instrumentation (settings.WEBSOCKET_METRICS): connections per room, messages,
+# auth cost, channel layer latency and queue depth, on /metrics/ too
+#
+import contextvars
+import functools
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from channels.exceptions import InvalidChannelLayerError
+from channels.layers import channel_layers
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from chat.layers import Channel
+
+from .metrics import COUNT_BUCKETS, REGISTRY
+
+REQUESTS = REGISTRY.counter('lflog_requests_total', 'HTTP requests', ('view', 'method', 'status'))
+REQUEST_SECONDS = REGISTRY.histogram('lflog_request_seconds', 'Time to build the response', ('view', 'method'))
+DB_SECONDS = REGISTRY.histogram('lflog_request_db_seconds', 'Time spent in database queries per request', ('view', 'method'))
+QUERIES = REGISTRY.histogram('lflog_request_queries', 'Database queries per request', ('view', 'method'), COUNT_BUCKETS)
+RENDER_SECONDS = REGISTRY.histogram('lflog_request_render_seconds', 'Time rendering (serializing) template and DRF responses',
+                                    ('view', 'method'))
+
+# Timing of the request being handled; asgiref carries it into the threads sync views run in
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """
+    Figures of one request
+    """
+    __slots__ = ('start', 'queries', 'db', 'render', 'render_start')
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.render_start = None
+
+
+def _record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection: times queries run while a request is measured
+
+    :return: whatever execute returns
+    """
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.db += time.perf_counter() - start
+        timing.queries += 1
+
+
+def _install_wrapper(sender, connection, **kwargs) -> None:
+    """
+    connection_created receiver; connections may reconnect, so the wrapper is only added once
+
+    :param connection: new database connection
+    :return:
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class RequestTimingMiddleware:
+    """
+    Measures every request and answers with
+        Server-Timing: db;dur=12.3;desc="42 queries", render;dur=1.2, total;dur=30.1
+    Goes first in MIDDLEWARE, so total covers the rest of the stack.
+    Works in both sync (WSGI) and async (ASGI) stacks without forcing a mode switch.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        """
+        :param get_response: next middleware or view
+        """
+        self.get_response = get_response
+        connection_created.connect(_install_wrapper, dispatch_uid='lflog.request_timing')
+        # Connections opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            _install_wrapper(None, connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing)
+
+    def process_template_response(self, request, response):
+        """
+        Called just before rendering: times the render through a post-render callback
+
+        :return: response
+        """
+        timing = _current.get()
+        if timing is not None:
+            timing.render_start = time.perf_counter()
+
+            def rendered(response):
+                timing.render += time.perf_counter() - timing.render_start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def finish(request, response, timing: RequestTiming):
+        """
+        Adds the Server-Timing header and feeds the metrics
+
+        :param request: request
+        :param response: response
+        :param timing: figures of the request
+        :return: response
+        """
+        total = time.perf_counter() - timing.start
+        match = getattr(request, 'resolver_match', None)
+        labels = {'view': (match.view_name or match._func_path) if match else 'unresolved', 'method': request.method}
+        REQUESTS.inc(status=response.status_code, **labels)
+        REQUEST_SECONDS.observe(total, **labels)
+        DB_SECONDS.observe(timing.db, **labels)
+        QUERIES.observe(timing.queries, **labels)
+        if timing.render_start is not None:
+            RENDER_SECONDS.observe(timing.render, **labels)
+        server_timing = [f'db;dur={timing.db * 1000:.1f};desc="{timing.queries} queries"']
+        if timing.render_start is not None:
+            server_timing.append(f'render;dur={timing.render * 1000:.1f}')
+        server_timing.append(f'total;dur={total * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(server_timing)
+        return response
+
+
+WS_CONNECTIONS = REGISTRY.gauge('lflog_ws_connections', 'Open websocket connections', ('route', 'room'))
+WS_CONNECTS = REGISTRY.counter('lflog_ws_connects_total', 'Websocket handshakes', ('route', 'outcome'))
+WS_MESSAGES = REGISTRY.counter('lflog_ws_messages_total', 'Websocket frames', ('route', 'direction'))
+WS_BYTES = REGISTRY.counter('lflog_ws_bytes_total', 'Websocket payload size: characters of text frames, bytes of binary ones', ('route', 'direction'))
+WS_AUTH_SECONDS = REGISTRY.histogram('lflog_ws_auth_seconds', 'Time in the auth middleware stack (session and user lookup)',
+                                     ('route',))
+LAYER_SECONDS = REGISTRY.histogram('lflog_channel_layer_seconds', 'Channel layer call latency', ('operation',))
+LAYER_QUEUED = REGISTRY.gauge('lflog_channel_layer_queued', 'Messages waiting in this process for its consumers')
+LAYER_QUEUE_MAX = REGISTRY.gauge('lflog_channel_layer_queue_max', 'Messages waiting on the most loaded channel')
+LAYER_DROPPED = REGISTRY.gauge('lflog_channel_layer_dropped', 'group_send messages that found a full channel (in-memory layer)')
+
+# /ws/<route>/<room>/
+WS_PATH = re.compile(r'^/?ws/(?P<route>[^/]+)/(?:(?P<room>[^/]+)/)?')
+# Distinct rooms labelled; the rest are counted together as "other"
+MAX_ROOMS = 1000
+# Channel layer calls that are timed
+LAYER_OPERATIONS = ('send', 'group_send', 'group_add', 'group_discard')
+SCOPE_START = 'lflog.ws_start'
+
+
+def _timed(operation: str, call):
+    """
+    :param operation: label
+    :param call: channel layer coroutine method
+    :return: the method, observing its duration
+    """
+    @functools.wraps(call)
+    async def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            LAYER_SECONDS.observe(time.perf_counter() - start, operation=operation)
+
+    timed.lflog_timed = True
+    return timed
+
+
+def instrument_channel_layer(layer) -> None:
+    """
+    Times the calls consumers make through a channel layer instance, and reports its queues at scrape time;
+    calling it again is harmless
+
+    :param layer: channel layer instance
+    :return:
+    """
+    if layer is None or getattr(layer.group_send, 'lflog_timed', False):
+        return
+    for operation in LAYER_OPERATIONS:
+        if hasattr(layer, operation):
+            setattr(layer, operation, _timed(operation, getattr(layer, operation)))
+
+    def collect() -> None:
+        # The in-memory layers keep every channel's queue (a chat.layers.Channel for LocalChannelLayer);
+        # channels_redis buffers what it read for this process
+        queues = getattr(layer, 'channels', None)
+        if not isinstance(queues, dict):
+            queues = getattr(layer, 'receive_buffer', {})
+        depths = [len(queue.messages) if isinstance(queue, Channel) else queue.qsize() for queue in list(queues.values())]
+        LAYER_QUEUED.set(sum(depths))
+        LAYER_QUEUE_MAX.set(max(depths, default=0))
+        if hasattr(layer, 'dropped'):
+            LAYER_DROPPED.set(layer.dropped)
+
+    REGISTRY.add_collector(collect)
+
+
+class WebsocketMetricsMiddleware:
+    """
+    ASGI middleware for the websocket branch:
+        WebsocketMetricsMiddleware(URLRouter(websocket_urlpatterns), auth=AuthMiddlewareStack)
+    The auth stack is built around an inner hook, so the time it takes (session and user lookups)
+    is measured apart from the consumer's. Also counts frames both ways, tracks open connections
+    per route and room, and times the consumers' channel layer calls
+    """
+
+    def __init__(self, application, auth=None, layer_alias: str = 'default') -> None:
+        """
+        :param application: websocket application, usually a URLRouter
+        :param auth: middleware stack factory, e.g. AuthMiddlewareStack
+        :param layer_alias: channel layer the consumers use
+        """
+        self.application = application
+        self.inner = auth(self.authenticated) if auth is not None else self.authenticated
+        self.layer_alias = layer_alias
+        self.layer_instrumented = False
+        self.rooms = set()
+
+    @staticmethod
+    def labels(path: str) -> tuple:
+        """
+        :param path: websocket path
+        :return: route and room
+        """
+        match = WS_PATH.match(path)
+        if match is None:
+            return 'other', ''
+        return match['route'], match['room'] or ''
+
+    def opened(self, route: str, room: str) -> str:
+        """
+        One connection more
+
+        :param route: route label
+        :param room: room name
+        :return: room label: the room, or "other" once MAX_ROOMS rooms are labelled
+        """
+        if room and (route, room) not in self.rooms:
+            if len(self.rooms) >= MAX_ROOMS:
+                room = 'other'
+            else:
+                self.rooms.add((route, room))
+        WS_CONNECTIONS.inc(route=route, room=room)
+        return room
+
+    def closed(self, route: str, room: str) -> None:
+        """
+        One connection less; rooms left empty drop their series
+
+        :param route: route label
+        :param room: room label
+        :return:
+        """
+        WS_CONNECTIONS.dec(route=route, room=room)
+        if room != 'other' and WS_CONNECTIONS.value(route=route, room=room) <= 0:
+            WS_CONNECTIONS.remove(route=route, room=room)
+            self.rooms.discard((route, room))
+
+    async def authenticated(self, scope, receive, send):
+        """
+        Innermost step of the auth stack: the stack is done
+
+        :return: whatever the application returns
+        """
+        start = scope.get(SCOPE_START)
+        if start is not None:
+            WS_AUTH_SECONDS.observe(time.perf_counter() - start, route=self.labels(scope['path'])[0])
+        return await self.application(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            return await self.inner(scope, receive, send)
+        if not self.layer_instrumented:
+            self.layer_instrumented = True
+            try:
+                instrument_channel_layer(channel_layers[self.layer_alias])
+            except InvalidChannelLayerError:
+                # No (valid) channel layer configured: consumers will complain about it themselves
+                pass
+        route, room = self.labels(scope['path'])
+        accepted = False
+
+        async def counting_receive():
+            message = await receive()
+            if message['type'] == 'websocket.receive':
+                WS_MESSAGES.inc(route=route, direction='in')
+                WS_BYTES.inc(len(message.get('text') or '') or len(message.get('bytes') or b''), route=route,
+                             direction='in')
+            return message
+
+        async def counting_send(message):
+            nonlocal accepted, room
+            if message['type'] == 'websocket.send':
+                WS_MESSAGES.inc(route=route, direction='out')
+                WS_BYTES.inc(len(message.get('text') or '') or len(message.get('bytes') or b''), route=route,
+                             direction='out')
+            elif message['type'] == 'websocket.accept' and not accepted:
+                accepted = True
+                WS_CONNECTS.inc(route=route, outcome='accepted')
+                room = self.opened(route, room)
+            elif message['type'] == 'websocket.close' and not accepted:
+                WS_CONNECTS.inc(route=route, outcome='rejected')
+            return await send(message)
+
+        scope = dict(scope)
+        scope[SCOPE_START] = time.perf_counter()
+        try:
+            return await self.inner(scope, counting_receive, counting_send)
+        finally:
+            if accepted:
+                self.closed(route, room)
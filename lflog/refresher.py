@@ -0,0 +1,362 @@
+# lflog/refresher
+#
+# Periodic reference data refresher (ClubLog, LoTW, eQSL), driven by asyncio.
+# Runs inside the ASGI process (see RefresherLifespan in asgi.py) or as a worker (manage.py run_refresher).
+# The refreshes themselves run in a thread, so the event loop keeps serving requests meanwhile.
+#
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from tools.refresh import REFRESHES, RefreshLocked, run_refreshes
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+# Seconds between refreshes of each feed
+DEFAULT_INTERVALS = {'clublog': DAY, 'lotw': DAY, 'eqsl': DAY}
+# Each wait is randomly stretched or shrunk by up to this fraction, so processes do not fire together
+DEFAULT_JITTER = 0.1
+# After a failure, retry after the first value (seconds), doubling up to the second
+DEFAULT_BACKOFF = (60, 60 * 60)
+# Let the server boot before the first refresh
+STARTUP_DELAY = 30
+STATUS_NAME = 'refresh-status.json'
+
+
+def status_path() -> Path:
+    """
+    Where the refresher status is kept: shared by every process using the same feed cache
+
+    :return: path
+    """
+    return Path(settings.FEED_CACHE_DIR) / STATUS_NAME
+
+
+def read_status(path: str | os.PathLike = None) -> dict:
+    """
+    Last known status of each feed
+
+    :param path: status file, defaults to status_path()
+    :return: dict feed name: dict, empty if there is no status yet
+    """
+    try:
+        with open(path or status_path(), encoding='utf8') as status:
+            return json.load(status)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def next_delay(interval: float, failures: int, backoff: tuple = DEFAULT_BACKOFF, jitter: float = DEFAULT_JITTER,
+               spread: float = 0.0) -> float:
+    """
+    Wait before a feed's next refresh: its interval after a success, after failures the first
+    backoff delay doubled for each one in a row, up to the maximum. Either is varied by jitter
+
+    :param interval: seconds between successful refreshes
+    :param failures: failures in a row, 0 after a success
+    :param backoff: (first, maximum) retry delay, seconds
+    :param jitter: fraction by which the wait may vary
+    :param spread: where in the jitter range the wait falls, from -1 (shortest) to 1 (longest)
+    :return: seconds
+    """
+    if failures:
+        first, maximum = backoff
+        interval = min(maximum, first * 2 ** (failures - 1))
+    return interval * (1 + jitter * spread)
+
+
+def _iso(timestamp: float | None) -> str | None:
+    """
+    :param timestamp: epoch seconds
+    :return: ISO 8601 UTC, None stays None
+    """
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+class FeedState:
+    """
+    Schedule and outcome of one feed
+    """
+
+    def __init__(self, name: str, interval: float) -> None:
+        """
+        :param name: key of tools.refresh.REFRESHES
+        :param interval: seconds between successful refreshes
+        """
+        self.name = name
+        self.interval = interval
+        self.next_run = 0.0
+        self.last_run = None
+        self.last_success = None
+        self.last_error = None
+        self.failures = 0
+        self.stats = None
+
+    def load(self, status: dict) -> None:
+        """
+        Takes what another process (or a previous run of this one) recorded
+
+        :param status: as_dict() output read back from the status file
+        :return:
+        """
+        self.last_run = status.get('last_run_ts', self.last_run)
+        self.last_success = status.get('last_success_ts', self.last_success)
+        self.last_error = status.get('last_error', self.last_error)
+        self.failures = status.get('failures', self.failures)
+        self.stats = status.get('stats', self.stats)
+        self.next_run = max(self.next_run, status.get('next_run_ts') or 0.0)
+
+    def as_dict(self) -> dict:
+        """
+        :return: JSON ready status, with epoch (_ts) and ISO times
+        """
+        return {
+            'interval': self.interval,
+            'last_run': _iso(self.last_run),
+            'last_success': _iso(self.last_success),
+            'next_run': _iso(self.next_run),
+            'last_run_ts': self.last_run,
+            'last_success_ts': self.last_success,
+            'next_run_ts': self.next_run,
+            'last_error': self.last_error,
+            'failures': self.failures,
+            'stats': self.stats,
+        }
+
+
+class PeriodicRefresher:
+    """
+    Refreshes each feed every interval seconds (with jitter), backing off exponentially on failure.
+    Feeds falling due together are refreshed in one run_refreshes() call, under its lock:
+    if a cron job or another process is refreshing, this one retries later.
+    The schedule is kept in a status file, so several processes share it instead of each refreshing
+    """
+
+    def __init__(self, intervals: dict = None, jitter: float = DEFAULT_JITTER, backoff: tuple = DEFAULT_BACKOFF,
+                 path: str | os.PathLike = None, **options) -> None:
+        """
+        :param intervals: feed name: seconds; feeds left out are not refreshed
+        :param jitter: fraction by which every wait may randomly vary
+        :param backoff: (first, maximum) retry delay after a failure, seconds
+        :param path: status file, defaults to status_path()
+        :param options: passed to run_refreshes (batch_size, streaming, mode, use_copy)
+        """
+        intervals = DEFAULT_INTERVALS if intervals is None else intervals
+        unknown = set(intervals) - set(REFRESHES)
+        if unknown:
+            raise ValueError(f'Unknown feeds: {", ".join(sorted(unknown))}')
+        self.feeds = {name: FeedState(name, interval) for name, interval in intervals.items()}
+        self.jitter = jitter
+        self.backoff = backoff
+        self.path = Path(path or status_path())
+        self.options = options
+        self.running = []
+        self.task = None
+        self.stopping = None
+
+    @classmethod
+    def from_settings(cls) -> 'PeriodicRefresher':
+        """
+        Built from REFERENCE_REFRESH_INTERVALS, REFERENCE_REFRESH_JITTER, REFERENCE_REFRESH_BACKOFF
+        and REFERENCE_REFRESH_MODE
+
+        :return: PeriodicRefresher
+        """
+        return cls(getattr(settings, 'REFERENCE_REFRESH_INTERVALS', None),
+                   getattr(settings, 'REFERENCE_REFRESH_JITTER', DEFAULT_JITTER),
+                   getattr(settings, 'REFERENCE_REFRESH_BACKOFF', DEFAULT_BACKOFF),
+                   mode=getattr(settings, 'REFERENCE_REFRESH_MODE', None))
+
+    def _jittered(self, seconds: float) -> float:
+        """
+        :param seconds: nominal wait
+        :return: wait randomly varied by up to jitter
+        """
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _load(self) -> None:
+        """
+        Picks up the schedule other processes recorded
+
+        :return:
+        """
+        status = read_status(self.path).get('feeds', {})
+        for name, feed in self.feeds.items():
+            if name in status:
+                feed.load(status[name])
+
+    def _save(self) -> None:
+        """
+        Writes the status file atomically: readers never see half of it
+
+        :return:
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(f'{self.path.name}.{os.getpid()}.part')
+        with open(partial, 'w', encoding='utf8') as status:
+            json.dump(self.status(), status)
+        os.replace(partial, self.path)
+
+    def status(self) -> dict:
+        """
+        What the refresher knows, as served by the status endpoint
+
+        :return: dict
+        """
+        return {
+            'updated': _iso(time.time()),
+            'pid': os.getpid(),
+            'running': self.running,
+            'feeds': {name: feed.as_dict() for name, feed in self.feeds.items()},
+        }
+
+    def schedule_start(self) -> None:
+        """
+        First run of each feed: when its interval since the last success ends, or soon after boot
+
+        :return:
+        """
+        now = time.time()
+        self._load()
+        for feed in self.feeds.values():
+            if feed.last_success is not None and not feed.failures:
+                due = feed.last_success + feed.interval
+            else:
+                due = now
+            feed.next_run = max(feed.next_run, due, now + self._jittered(STARTUP_DELAY))
+
+    def _record(self, feed: FeedState, stats, now: float) -> None:
+        """
+        Updates a feed after a run and schedules the next one
+
+        :param feed: feed state
+        :param stats: RefreshStats of the run
+        :param now: when the run ended
+        :return:
+        """
+        feed.last_run = now
+        feed.stats = stats.as_dict()
+        if stats.error:
+            feed.failures += 1
+            feed.last_error = stats.error
+        else:
+            feed.failures = 0
+            feed.last_error = None
+            feed.last_success = now
+        feed.next_run = now + next_delay(feed.interval, feed.failures, self.backoff, self.jitter,
+                                         random.uniform(-1, 1))
+        if stats.error:
+            logger.warning('%s refresh failed (%d in a row), next try at %s', feed.name, feed.failures,
+                           _iso(feed.next_run))
+
+    async def run_due(self) -> None:
+        """
+        Refreshes the feeds that are due, in a worker thread
+
+        :return:
+        """
+        self._load()
+        now = time.time()
+        due = [name for name, feed in self.feeds.items() if feed.next_run <= now]
+        if not due:
+            return
+        self.running = due
+        self._save()
+        try:
+            results = await asyncio.to_thread(run_refreshes, due, **self.options)
+        except RefreshLocked:
+            # Somebody else is refreshing: check again later, without counting it as a failure
+            logger.info('Reference data refresh already running elsewhere, retrying later')
+            for name in due:
+                self.feeds[name].next_run = time.time() + self._jittered(self.backoff[0])
+        else:
+            for stats in results:
+                self._record(self.feeds[stats.name], stats, time.time())
+                logger.info(stats)
+        finally:
+            self.running = []
+            self._save()
+
+    async def run(self) -> None:
+        """
+        Main loop, until stop()
+
+        :return:
+        """
+        self.stopping = asyncio.Event()
+        self.schedule_start()
+        self._save()
+        while not self.stopping.is_set():
+            try:
+                await self.run_due()
+            except Exception:
+                logger.exception('Reference data refresher error')
+            wait = max(1.0, min(feed.next_run for feed in self.feeds.values()) - time.time()) if self.feeds else DAY
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> asyncio.Task:
+        """
+        Starts the main loop as a task of the running event loop; calling it again is harmless
+
+        :return: the task
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run(), name='reference-data-refresher')
+        return self.task
+
+    async def stop(self) -> None:
+        """
+        Cancels the loop and waits until it is gone, so a server shutdown is not held up by a refresh.
+        A refresh in progress runs on in its thread; the status file no longer lists it as running
+
+        :return:
+        """
+        if self.stopping is not None:
+            self.stopping.set()
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+
+
+class RefresherLifespan:
+    """
+    ASGI wrapper running a PeriodicRefresher in the server's event loop.
+    Servers speaking the lifespan protocol start and stop it; others (Daphne) start it with the first connection
+    """
+
+    def __init__(self, application, refresher: PeriodicRefresher) -> None:
+        """
+        :param application: ASGI application to wrap
+        :param refresher: refresher to run
+        """
+        self.application = application
+        self.refresher = refresher
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    self.refresher.start()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await self.refresher.stop()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        self.refresher.start()
+        return await self.application(scope, receive, send)
@@ -63,6 +63,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per request query count and timings (Server-Timing header, histograms on /metrics/).
+# Opt-in: LFLOG_REQUEST_TIMING=1. First in the list, so it measures the whole stack
+REQUEST_TIMING = os.environ.get('LFLOG_REQUEST_TIMING', '') == '1'
+if REQUEST_TIMING:
+    MIDDLEWARE.insert(0, 'lflog.middleware.RequestTimingMiddleware')
+# Websocket connections per room, frames, auth and channel layer timings on /metrics/. Opt-in: LFLOG_WEBSOCKET_METRICS=1.
+# Room names become labels, so the scrape access below matters. /metrics/ is not found while both are off
+WEBSOCKET_METRICS = os.environ.get('LFLOG_WEBSOCKET_METRICS', '') == '1'
+# Who may scrape /metrics/: Prometheus with "Authorization: Bearer <LFLOG_METRICS_TOKEN>", staff users, and
+# the addresses in LFLOG_METRICS_ALLOWED_IPS (none by default). Behind a reverse proxy on the same host every
+# request comes from 127.0.0.1, so only list addresses when the workers are scraped directly, not through the proxy
+METRICS_TOKEN = os.environ.get('LFLOG_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [address for address in os.environ.get('LFLOG_METRICS_ALLOWED_IPS', '').split(',') if address]
+
 ROOT_URLCONF = 'lflog.urls'
 
 TEMPLATES = [
@@ -138,12 +152,67 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Daphne
 ASGI_APPLICATION = 'lflog.asgi.application'
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
+# Channel layer: 'redis' when several Daphne processes (or hosts) serve websockets,
+# 'memory' (chat/layers.py) for a single process, saving a Redis round trip per message
+CHANNEL_LAYER = os.environ.get('LFLOG_CHANNEL_LAYER', 'redis')
+if CHANNEL_LAYER == 'memory':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "chat.layers.LocalChannelLayer",
+            "CONFIG": {
+                "capacity": 500,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [os.environ.get('LFLOG_REDIS_URL', 'redis://127.0.0.1:6379')],
+            },
         },
+    }
+# Chat room history sent to joining clients (chat/history.py): 'memory' (this process, the default: with several
+# processes each one only replays what it handled), 'redis' (streams shared by every process) or 'off'.
+# Kept per room up to a number of messages and of bytes; idle rooms are dropped
+CHAT_HISTORY = os.environ.get('LFLOG_CHAT_HISTORY', 'memory')
+CHAT_HISTORY_REDIS_URL = os.environ.get('LFLOG_REDIS_URL', 'redis://127.0.0.1:6379')
+CHAT_HISTORY_MESSAGES = 50
+CHAT_HISTORY_BYTES = 64 * 1024
+CHAT_HISTORY_IDLE_SECONDS = 60 * 60
+CHAT_HISTORY_ROOMS = 10000
+# Websocket batching (chat/batching.py): events within this many ms share one frame and one
+# channel layer call; 0 sends each one as it comes. Opt-in: LFLOG_WEBSOCKET_BATCH_MS=50
+WEBSOCKET_BATCH_WINDOW_MS = int(os.environ.get('LFLOG_WEBSOCKET_BATCH_MS', 0))
+# Frames collected per client within one window before older ones are dropped (or merged, for spots).
+# Bounds bursts only: once sent, frames sit in the server's buffer, ASGI has no backpressure
+WEBSOCKET_BATCH_MAX_EVENTS = 500
+
+# Reference data feeds (ClubLog, LoTW, eQSL) are cached here between refreshes
+FEED_CACHE_DIR = Path(os.environ.get('LFLOG_FEED_CACHE_DIR', BASE_DIR / 'feed_cache'))
+# Periodic refresher (lflog/refresher.py): seconds between refreshes, random variation of each wait,
+# first and maximum retry delay after a failure. Set LFLOG_REFRESH_IN_PROCESS=1 to run it inside
+# the ASGI server instead of as a separate manage.py run_refresher worker
+REFERENCE_REFRESH_INTERVALS = {'clublog': 24 * 60 * 60, 'lotw': 24 * 60 * 60, 'eqsl': 24 * 60 * 60}
+REFERENCE_REFRESH_JITTER = 0.1
+REFERENCE_REFRESH_BACKOFF = (60, 60 * 60)
+# replace: rewrite the tables in one transaction each; diff: only write what changed; swap: load shadow
+# tables and rename them in place, so lookups never wait on a refresh (Postgres only, not tried in production yet)
+REFERENCE_REFRESH_MODE = 'replace'
+REFERENCE_REFRESH_IN_PROCESS = os.environ.get('LFLOG_REFRESH_IN_PROCESS', '') == '1'
+
+# The apps log at INFO what operators want to see (rows and phase timings of each refresh, the process
+# peak memory...), which Python's default configuration drops. LFLOG_LOG_LEVEL=WARNING quiets them
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        app: {'handlers': ['console'], 'level': os.environ.get('LFLOG_LOG_LEVEL', 'INFO'), 'propagate': False}
+        for app in ('adif', 'chat', 'clublog', 'lflog', 'qsling', 'tools')
     },
 }
 
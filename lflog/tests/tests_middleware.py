@@ -0,0 +1,113 @@
+# lflog/tests/tests_middleware
+#
+# RequestTimingMiddleware (Server-Timing header, queries counted through the execute wrapper, render time)
+# and who may scrape /metrics/
+#
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from cust_user.models import CustomUser
+from lflog.middleware import QUERIES, RENDER_SECONDS, REQUESTS, RequestTimingMiddleware, _record_query
+
+TIMING = 'lflog.middleware.RequestTimingMiddleware'
+SERVER_TIMING = re.compile(r'^db;dur=[\d.]+;desc="(\d+) queries"(?:, render;dur=[\d.]+)?, total;dur=[\d.]+$')
+
+
+def observations(histogram, **labels) -> int:
+    """
+    :return: number of values the histogram observed with those labels
+    """
+    counts = histogram.values.get(histogram._key(labels))
+    return counts[-1] if counts else 0
+
+
+class RequestTimingTests(TestCase):
+
+    def tearDown(self):
+        while _record_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_record_query)
+
+    def test_queries_are_counted(self):
+        def view(request):
+            CustomUser.objects.count()
+            CustomUser.objects.filter(is_staff=True).exists()
+            return HttpResponse('ok')
+
+        response = RequestTimingMiddleware(view)(RequestFactory().get('/'))
+        match = SERVER_TIMING.match(response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        self.assertEqual(match[1], '2')
+        self.assertNotIn('render;', response['Server-Timing'])
+        self.assertIn(_record_query, connection.execute_wrappers)
+
+    def test_queries_outside_requests_are_not_counted(self):
+        RequestTimingMiddleware(lambda request: HttpResponse())
+        CustomUser.objects.count()
+        response = RequestTimingMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        self.assertEqual(SERVER_TIMING.match(response['Server-Timing'])[1], '0')
+
+    def test_wrapper_is_installed_once(self):
+        RequestTimingMiddleware(lambda request: HttpResponse())
+        RequestTimingMiddleware(lambda request: HttpResponse())
+        self.assertEqual(connection.execute_wrappers.count(_record_query), 1)
+
+    @override_settings(MIDDLEWARE=[TIMING, *settings.MIDDLEWARE])
+    def test_template_responses_are_rendered_in_time(self):
+        # DRF responses are template responses: their serialization is the render phase
+        labels = {'view': 'refresh-status', 'method': 'GET'}
+        requests, renders = REQUESTS.value(status=200, **labels), observations(RENDER_SECONDS, **labels)
+        self.client.force_login(CustomUser.objects.create_user('op@example.com', 'secret'))
+        response = self.client.get(reverse('refresh-status'))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r', render;dur=[\d.]+, ')
+        # Session and user lookups
+        self.assertGreaterEqual(int(SERVER_TIMING.match(response['Server-Timing'])[1]), 2)
+        self.assertEqual(REQUESTS.value(status=200, **labels), requests + 1)
+        self.assertEqual(observations(RENDER_SECONDS, **labels), renders + 1)
+        self.assertGreaterEqual(observations(QUERIES, **labels), 1)
+
+    @override_settings(MIDDLEWARE=[TIMING, *settings.MIDDLEWARE])
+    async def test_async_stack(self):
+        response = await self.async_client.get(reverse('refresh-status'))
+        self.assertEqual(response.status_code, 403)
+        self.assertRegex(response['Server-Timing'], SERVER_TIMING)
+
+
+@override_settings(REQUEST_TIMING=True, WEBSOCKET_METRICS=False, METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=[])
+class MetricsAccessTests(TestCase):
+
+    def test_off_without_instrumentation(self):
+        headers = {'Authorization': 'Bearer s3cret'}
+        with override_settings(REQUEST_TIMING=False):
+            self.assertEqual(self.client.get(reverse('metrics'), headers=headers).status_code, 404)
+        with override_settings(REQUEST_TIMING=False, WEBSOCKET_METRICS=True):
+            self.assertEqual(self.client.get(reverse('metrics'), headers=headers).status_code, 200)
+
+    def test_token(self):
+        url = reverse('metrics')
+        response = self.client.get(url, headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 's3cret'}).status_code, 403)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer '}).status_code, 403)
+
+    def test_staff_only(self):
+        user = CustomUser.objects.create_user('op@example.com', 'secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_proxied_requests_are_refused(self):
+        # Behind a local reverse proxy everything comes from the loopback address
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
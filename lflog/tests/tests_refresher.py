@@ -0,0 +1,182 @@
+# lflog/tests/tests_refresher
+#
+# PeriodicRefresher: when feeds run next, what the status file says, and the ASGI lifespan wrapper
+#
+import asyncio
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from cust_user.models import CustomUser
+from lflog import refresher
+from lflog.refresher import PeriodicRefresher, RefresherLifespan, next_delay, read_status
+from tools.refresh import RefreshLocked
+from tools.stats import RefreshStats
+
+
+class NextDelayTests(SimpleTestCase):
+
+    def test_interval_after_success(self):
+        self.assertEqual(next_delay(3600, 0, jitter=0.1), 3600)
+        self.assertAlmostEqual(next_delay(3600, 0, jitter=0.1, spread=-1), 3240)
+        self.assertAlmostEqual(next_delay(3600, 0, jitter=0.1, spread=1), 3960)
+
+    def test_backoff_doubles_up_to_the_maximum(self):
+        self.assertEqual([next_delay(86400, failures, (60, 3600), jitter=0) for failures in range(1, 9)],
+                         [60, 120, 240, 480, 960, 1920, 3600, 3600])
+        self.assertEqual(next_delay(86400, 1000, (60, 3600), jitter=0), 3600)
+
+    def test_backoff_is_jittered(self):
+        self.assertAlmostEqual(next_delay(86400, 2, (60, 3600), jitter=0.5, spread=-1), 60)
+        self.assertAlmostEqual(next_delay(86400, 2, (60, 3600), jitter=0.5, spread=1), 180)
+
+
+def refresh_results(*errors: str):
+    """
+    :param errors: one per feed, in order; None for a success
+    :return: fake run_refreshes returning RefreshStats with those errors
+    """
+    def run_refreshes(names: list, **options) -> list:
+        results = []
+        for name, error in zip(names, errors):
+            stats = RefreshStats(name)
+            stats.rows, stats.error = (0, error) if error else (42, None)
+            results.append(stats.finish())
+        return results
+    return run_refreshes
+
+
+class RefresherStatusTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = Path(directory) / 'refresh-status.json'
+        self.refresher = PeriodicRefresher({'clublog': 3600, 'lotw': 7200}, jitter=0, backoff=(60, 3600),
+                                           path=self.path)
+        for feed in self.refresher.feeds.values():
+            feed.next_run = 1.0
+
+    async def run_due(self, run_refreshes, now: float = 1_000_000.0) -> None:
+        with mock.patch.object(refresher, 'run_refreshes', run_refreshes), \
+                mock.patch.object(refresher.time, 'time', return_value=now):
+            await self.refresher.run_due()
+
+    async def test_status_json(self):
+        await self.run_due(refresh_results(None, 'ValueError: feed is empty'))
+        status = read_status(self.path)
+        self.assertEqual(set(status), {'updated', 'pid', 'running', 'feeds'})
+        self.assertEqual(status['running'], [])
+        clublog, lotw = status['feeds']['clublog'], status['feeds']['lotw']
+        self.assertEqual((clublog['last_run'], clublog['last_success'], clublog['next_run']),
+                         ('1970-01-12T13:46:40+00:00', '1970-01-12T13:46:40+00:00', '1970-01-12T14:46:40+00:00'))
+        self.assertEqual((clublog['failures'], clublog['last_error'], clublog['interval']), (0, None, 3600))
+        self.assertEqual(clublog['stats']['rows'], 42)
+        self.assertIn('process_peak_rss_mb', clublog['stats'])
+        self.assertEqual((lotw['failures'], lotw['last_error'], lotw['last_success']),
+                         (1, 'ValueError: feed is empty', None))
+        self.assertEqual(lotw['next_run_ts'], 1_000_000.0 + 60)
+
+    async def test_running_feeds_are_listed(self):
+        seen = []
+
+        def run_refreshes(names, **options):
+            seen.append(read_status(self.path)['running'])
+            return refresh_results(None, None)(names)
+
+        await self.run_due(run_refreshes)
+        self.assertEqual(seen, [['clublog', 'lotw']])
+
+    async def test_failures_back_off_and_recover(self):
+        now = 1_000_000.0
+        for expected in (60, 120, 240):
+            await self.run_due(refresh_results('OSError: down', 'OSError: down'), now)
+            self.assertEqual(read_status(self.path)['feeds']['lotw']['next_run_ts'], now + expected)
+            now += expected
+        await self.run_due(refresh_results(None, None), now)
+        self.assertEqual(read_status(self.path)['feeds']['lotw']['failures'], 0)
+        self.assertEqual(self.refresher.feeds['lotw'].next_run, now + 7200)
+
+    async def test_locked_is_not_a_failure(self):
+        await self.run_due(mock.Mock(side_effect=RefreshLocked('busy')))
+        lotw = read_status(self.path)['feeds']['lotw']
+        self.assertEqual((lotw['failures'], lotw['last_run']), (0, None))
+        self.assertEqual(lotw['next_run_ts'], 1_000_000.0 + 60)
+
+
+class RefreshStatusViewTests(TestCase):
+
+    def test_serves_the_status_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(FEED_CACHE_DIR=directory):
+            PeriodicRefresher({'eqsl': 3600})._save()
+            self.assertEqual(self.client.get(reverse('refresh-status')).status_code, 403)
+            self.client.force_login(CustomUser.objects.create_user('op@example.com', 'secret'))
+            status = self.client.get(reverse('refresh-status')).json()
+        self.assertEqual(list(status['feeds']), ['eqsl'])
+        self.assertEqual(status['feeds']['eqsl']['interval'], 3600)
+
+
+class RefresherLifespanTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.refresher = PeriodicRefresher({'lotw': 3600}, path=Path(directory) / 'refresh-status.json')
+
+    async def test_lifespan(self):
+        received = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        application = mock.AsyncMock()
+        lifespan = asyncio.create_task(RefresherLifespan(application, self.refresher)(
+            {'type': 'lifespan'}, received.get, send))
+        await received.put({'type': 'lifespan.startup'})
+        while not sent:
+            await asyncio.sleep(0)
+        self.assertEqual(sent, [{'type': 'lifespan.startup.complete'}])
+        task = self.refresher.task
+        self.assertFalse(task.done())
+
+        await received.put({'type': 'lifespan.shutdown'})
+        await asyncio.wait_for(lifespan, 5)
+        self.assertEqual(sent[-1], {'type': 'lifespan.shutdown.complete'})
+        self.assertTrue(task.done())
+        application.assert_not_called()
+
+    async def test_shutdown_does_not_wait_for_a_refresh(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def run_refreshes(names, **options):
+            release.wait(5)
+            return []
+
+        self.refresher.feeds['lotw'].next_run = 1.0
+        with mock.patch.object(refresher, 'run_refreshes', run_refreshes), \
+                mock.patch.object(self.refresher, 'schedule_start'):
+            self.refresher.start()
+            while not self.refresher.running:
+                await asyncio.sleep(0.01)
+            await asyncio.wait_for(self.refresher.stop(), 1)
+        release.set()
+        self.assertTrue(self.refresher.task.cancelled())
+        self.assertEqual(read_status(self.refresher.path)['running'], [])
+
+    async def test_other_scopes_start_the_refresher(self):
+        application = mock.AsyncMock()
+        scope = {'type': 'http'}
+        await RefresherLifespan(application, self.refresher)(scope, None, None)
+        application.assert_awaited_once_with(scope, None, None)
+        self.assertFalse(self.refresher.task.done())
+        await self.refresher.stop()
+        self.assertTrue(self.refresher.task.done())
@@ -0,0 +1,152 @@
+# lflog/tests/tests_websocket_metrics
+#
+# WebsocketMetricsMiddleware (frames, handshakes, connections per room and their cap, auth time)
+# and instrument_channel_layer (timed calls that still deliver, queue depths at scrape time)
+#
+from unittest import mock
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase
+from django.urls import re_path
+
+from chat.layers import LocalChannelLayer
+from lflog import middleware
+from lflog.metrics import REGISTRY
+from lflog.middleware import (LAYER_QUEUED, LAYER_QUEUE_MAX, LAYER_SECONDS, WS_AUTH_SECONDS, WS_BYTES, WS_CONNECTIONS,
+                              WS_CONNECTS, WS_MESSAGES, WebsocketMetricsMiddleware, instrument_channel_layer)
+
+
+class EchoConsumer(AsyncWebsocketConsumer):
+    """
+    Sends every text frame back twice; room "closed" refuses the handshake
+    """
+
+    async def connect(self):
+        if self.scope['url_route']['kwargs']['room'] == 'closed':
+            await self.close()
+        else:
+            await self.accept()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.send(text_data=text_data)
+        await self.send(text_data=text_data)
+
+
+def observations(histogram, **labels) -> int:
+    """
+    :return: number of values the histogram observed with those labels
+    """
+    counts = histogram.values.get(histogram._key(labels))
+    return counts[-1] if counts else 0
+
+
+class WebsocketMetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.application = WebsocketMetricsMiddleware(URLRouter([
+            re_path(r'^ws/echo/(?P<room>\w+)/$', EchoConsumer.as_asgi()),
+        ]))
+
+    async def connect(self, room: str) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(self.application, f'/ws/echo/{room}/')
+        connected, _subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_frames_are_counted(self):
+        before = {direction: (WS_MESSAGES.value(route='echo', direction=direction),
+                              WS_BYTES.value(route='echo', direction=direction)) for direction in ('in', 'out')}
+        accepted = WS_CONNECTS.value(route='echo', outcome='accepted')
+        communicator = await self.connect('frames')
+        self.assertEqual(WS_CONNECTIONS.value(route='echo', room='frames'), 1)
+        await communicator.send_to(text_data='73 de EA3IEG')
+        self.assertEqual(await communicator.receive_from(), '73 de EA3IEG')
+        self.assertEqual(await communicator.receive_from(), '73 de EA3IEG')
+        await communicator.disconnect()
+        self.assertEqual(WS_MESSAGES.value(route='echo', direction='in'), before['in'][0] + 1)
+        self.assertEqual(WS_BYTES.value(route='echo', direction='in'), before['in'][1] + 12)
+        self.assertEqual(WS_MESSAGES.value(route='echo', direction='out'), before['out'][0] + 2)
+        self.assertEqual(WS_BYTES.value(route='echo', direction='out'), before['out'][1] + 24)
+        self.assertEqual(WS_CONNECTS.value(route='echo', outcome='accepted'), accepted + 1)
+        # The empty room's series is gone
+        self.assertNotIn(('echo', 'frames'), WS_CONNECTIONS.values)
+
+    async def test_rejected_handshakes(self):
+        rejected = WS_CONNECTS.value(route='echo', outcome='rejected')
+        communicator = WebsocketCommunicator(self.application, '/ws/echo/closed/')
+        connected, _code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(WS_CONNECTS.value(route='echo', outcome='rejected'), rejected + 1)
+        self.assertNotIn(('echo', 'closed'), WS_CONNECTIONS.values)
+
+    async def test_rooms_beyond_the_cap_are_other(self):
+        other = WS_CONNECTIONS.value(route='echo', room='other')
+        with mock.patch.object(middleware, 'MAX_ROOMS', 2):
+            communicators = [await self.connect(room) for room in ('capa', 'capb', 'capb', 'capc', 'capd')]
+            self.assertEqual(WS_CONNECTIONS.value(route='echo', room='capa'), 1)
+            self.assertEqual(WS_CONNECTIONS.value(route='echo', room='capb'), 2)
+            self.assertEqual(WS_CONNECTIONS.value(route='echo', room='other'), other + 2)
+            self.assertNotIn(('echo', 'capc'), WS_CONNECTIONS.values)
+            self.assertEqual(len(self.application.rooms), 2)
+            # A labelled room left empty makes room for a new one
+            await communicators[0].disconnect()
+            self.assertEqual(len(self.application.rooms), 1)
+            communicators.append(await self.connect('cape'))
+            self.assertEqual(WS_CONNECTIONS.value(route='echo', room='cape'), 1)
+            for communicator in communicators[1:]:
+                await communicator.disconnect()
+        self.assertEqual(WS_CONNECTIONS.value(route='echo', room='other'), other)
+        self.assertEqual(self.application.rooms, set())
+
+    async def test_auth_stack_is_timed(self):
+        def auth(inner):
+            async def stack(scope, receive, send):
+                return await inner(dict(scope, user='EA3IEG'), receive, send)
+            return stack
+
+        self.application = WebsocketMetricsMiddleware(self.application.application, auth=auth)
+        timed = observations(WS_AUTH_SECONDS, route='echo')
+        communicator = await self.connect('auth')
+        await communicator.disconnect()
+        self.assertEqual(observations(WS_AUTH_SECONDS, route='echo'), timed + 1)
+
+
+class InstrumentChannelLayerTests(SimpleTestCase):
+
+    def setUp(self):
+        collectors = list(REGISTRY.collectors)
+        self.addCleanup(setattr, REGISTRY, 'collectors', collectors)
+
+    async def test_calls_still_deliver(self):
+        layer = LocalChannelLayer()
+        instrument_channel_layer(layer)
+        instrument_channel_layer(layer)
+        counts = {operation: observations(LAYER_SECONDS, operation=operation) for operation in middleware.LAYER_OPERATIONS}
+        channel = await layer.new_channel()
+        await layer.group_add('spots', channel)
+        await layer.group_send('spots', {'type': 'spot', 'call': 'K1ABC'})
+        await layer.send(channel, {'type': 'chat', 'message': 'hi'})
+        self.assertEqual(await layer.receive(channel), {'type': 'spot', 'call': 'K1ABC'})
+        self.assertEqual(await layer.receive(channel), {'type': 'chat', 'message': 'hi'})
+        await layer.group_discard('spots', channel)
+        await layer.group_send('spots', {'type': 'spot', 'call': 'DL1A'})
+        self.assertFalse(layer.channels[channel].messages)
+        # Timed once each, even though instrumented twice
+        self.assertEqual({operation: observations(LAYER_SECONDS, operation=operation) - count
+                          for operation, count in counts.items()},
+                         {'send': 1, 'group_send': 2, 'group_add': 1, 'group_discard': 1})
+
+    async def test_queue_depths(self):
+        for layer in (LocalChannelLayer(), InMemoryChannelLayer()):
+            with self.subTest(layer=type(layer).__name__):
+                REGISTRY.collectors = []
+                instrument_channel_layer(layer)
+                await layer.send('busy', {'n': 0})
+                await layer.send('busy', {'n': 1})
+                await layer.send('idle', {'n': 2})
+                text = REGISTRY.render()
+                self.assertIn('lflog_channel_layer_queued 3', text)
+                self.assertEqual((LAYER_QUEUED.value(), LAYER_QUEUE_MAX.value()), (3, 2))
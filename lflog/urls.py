@@ -2,11 +2,19 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from adif import urls as adif_urls
+from clublog import urls as clublog_urls
 from my_station import urls as my_stations_urls
 
+from .views import RefreshStatusView, metrics
+
 
 urlpatterns = [
     path("chat/", include("chat.urls")),
     path("admin/", admin.site.urls),
     path("stations/", include(my_stations_urls)),
+    path("adif/", include(adif_urls)),
+    path("dxcc/", include(clublog_urls)),
+    path("status/refresh/", RefreshStatusView.as_view(), name="refresh-status"),
+    path("metrics/", metrics, name="metrics"),
 ]
@@ -0,0 +1,58 @@
+# lflog/views
+#
+# Project wide endpoints
+#
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .metrics import REGISTRY
+from .refresher import read_status
+
+
+class RefreshStatusView(APIView):
+    """
+    API endpoint showing the reference data refresher schedule: last run, last success,
+    next run, consecutive failures and the timings of the last refresh of each feed.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(read_status())
+
+
+def metrics_allowed(request) -> bool:
+    """
+    Who may scrape /metrics/: a bearer token matching METRICS_TOKEN, a logged in staff user,
+    or one of the addresses in METRICS_ALLOWED_IPS
+
+    :param request: request
+    :return: True if allowed
+    """
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    """
+    Prometheus text exposition of this process' metrics, for the scrapers metrics_allowed() lets in.
+    Not found unless REQUEST_TIMING or WEBSOCKET_METRICS is on: there is nothing worth scraping otherwise
+
+    :param request: request
+    :return: text/plain response
+    """
+    if not (settings.REQUEST_TIMING or settings.WEBSOCKET_METRICS):
+        raise Http404
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("my_station", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StationDeletion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("deleted_on", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -2,7 +2,14 @@
 #
 # Holds user station records
 #
+import datetime
+
 from django.contrib.gis.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from tools.locators import coordinates_to_maidenhead
 
 
 class MyStation(models.Model):
@@ -43,13 +50,43 @@ class MyStation(models.Model):
     def save(self, *args, **kwargs):
         """
         To be overriden and be able to do checks
+        Fills the locator from latitude / longitude when it was left empty
 
         :param args:
         :param kwargs:
         :return:
         """
+        if not self.locator and (self.latitude or self.longitude):
+            self.locator = coordinates_to_maidenhead(self.latitude, self.longitude, 6)
         super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = 'My Station'
         verbose_name_plural = 'My Stations'
+
+
+class StationDeletion(models.Model):
+    """
+    When a station was last deleted, in a single row. Station lists include it in their validators
+    (see tools.api.ConditionalGetMixin), so deletions are noticed without counting the stations
+    """
+    deleted_on = models.DateTimeField()
+
+    @staticmethod
+    def last() -> datetime.datetime | None:
+        """
+        :return: when a station was last deleted, None if never
+        """
+        return StationDeletion.objects.filter(pk=1).values_list('deleted_on', flat=True).first()
+
+
+@receiver(post_delete, sender=MyStation)
+def mark_station_deletion(sender, **kwargs) -> None:
+    """
+    Records the deletion time, whichever way the station was deleted (API, admin, queryset)
+
+    :param sender: MyStation
+    :param kwargs: signal arguments
+    :return:
+    """
+    StationDeletion.objects.update_or_create(pk=1, defaults={'deleted_on': timezone.now()})
@@ -1,12 +1,15 @@
 # my_station/serializers
 from rest_framework import serializers
 
+from tools.api import SparseFieldsMixin
+
 from .models import MyStation
 
 
-class MyStationSerializer(serializers.ModelSerializer):
+class MyStationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the MyStation model.
+    GET requests may ask for a subset of the fields with ?fields=id,callsign,locator
     """
     class Meta:
         """
@@ -0,0 +1,112 @@
+# my_station/tests/tests_views
+#
+# MyStationViewSet: conditional GETs (ETag, 304), sparse fieldsets (?fields=) and cursor pagination
+#
+from urllib.parse import parse_qs, urlparse
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cust_user.models import CustomUser
+from my_station.models import MyStation, StationDeletion
+
+
+def station(callsign: str) -> MyStation:
+    """
+    :return: new station with that callsign
+    """
+    return MyStation.objects.create(description='Home', callsign=callsign, name='Station', locator='JN11ck',
+                                    street='Carrer Major 1', country='Spain')
+
+
+class MyStationViewSetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('op@example.com', 'secret')
+        cls.stations = [station(callsign) for callsign in ('EA3IEG', 'EA3IEG/P', 'EA3IEG/M')]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # An explicit page size, lists are paginated whatever REST_FRAMEWORK['PAGE_SIZE'] says.
+        # Query parameters given to client.get() replace it
+        self.list_url = reverse('mystation-list') + '?page_size=10'
+
+    def detail_url(self, pk: int) -> str:
+        return reverse('mystation-detail', args=(pk,))
+
+    def test_not_modified(self):
+        for url in (self.list_url, self.detail_url(self.stations[0].pk)):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                etag = response['ETag']
+                response = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(self.client.get(url, headers={'If-None-Match': '"stale"'}).status_code, 200)
+
+    def test_etag_covers_the_query_string(self):
+        etag = self.client.get(self.list_url)['ETag']
+        self.assertNotEqual(self.client.get(self.list_url, {'fields': 'callsign'})['ETag'], etag)
+
+    def test_update_changes_the_etag(self):
+        list_etag = self.client.get(self.list_url)['ETag']
+        url = self.detail_url(self.stations[1].pk)
+        etag = self.client.get(url)['ETag']
+        response = self.client.patch(url, {'locator': 'JN01'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        for url, old in ((url, etag), (self.list_url, list_etag)):
+            with self.subTest(url=url):
+                response = self.client.get(url, headers={'If-None-Match': old})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], old)
+
+    def test_delete_changes_the_etag(self):
+        # The oldest station: the latest updated_on stays the same, only the deletion tells
+        etag = self.client.get(self.list_url)['ETag']
+        self.assertIsNone(StationDeletion.last())
+        self.assertEqual(self.client.delete(self.detail_url(self.stations[0].pk)).status_code, 204)
+        self.assertIsNotNone(StationDeletion.last())
+        response = self.client.get(self.list_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['callsign'], 'EA3IEG/P')
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url, {'fields': 'callsign,locator', 'page_size': 10})
+        self.assertEqual(response.json()['results'][0], {'callsign': 'EA3IEG', 'locator': 'JN11ck'})
+        select = [query['sql'] for query in queries if '"callsign"' in query['sql']][-1]
+        self.assertIn('"locator"', select)
+        self.assertNotIn('"street"', select)
+        self.assertNotIn('"description"', select)
+        response = self.client.get(self.detail_url(self.stations[0].pk), {'fields': 'id,street'})
+        self.assertEqual(response.json(), {'id': self.stations[0].pk, 'street': 'Carrer Major 1'})
+
+    def test_unknown_fields(self):
+        response = self.client.get(self.list_url, {'fields': 'callsign,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': 'Unknown fields: password'})
+
+    def test_cursor_pagination(self):
+        response = self.client.get(self.list_url, {'page_size': 2, 'fields': 'callsign'}).json()
+        self.assertEqual(set(response), {'next', 'previous', 'results'})
+        self.assertIsNone(response['previous'])
+        self.assertEqual(response['results'], [{'callsign': 'EA3IEG'}, {'callsign': 'EA3IEG/P'}])
+        query = parse_qs(urlparse(response['next']).query)
+        self.assertEqual((query['page_size'], query['fields']), (['2'], ['callsign']))
+        self.assertIn('cursor', query)
+        # Stations added meanwhile do not shift the next page
+        station('EA3IEG/AM')
+        response = self.client.get(response['next']).json()
+        self.assertEqual(response['results'], [{'callsign': 'EA3IEG/M'}, {'callsign': 'EA3IEG/AM'}])
+        self.assertIsNotNone(response['previous'])
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.list_url).status_code, 403)
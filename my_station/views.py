@@ -1,13 +1,41 @@
 from rest_framework import permissions, viewsets
+from rest_framework.pagination import CursorPagination
 
-from .models import MyStation
+from tools.api import ConditionalGetMixin, requested_fields
+
+from .models import MyStation, StationDeletion
 from .serializers import MyStationSerializer
 
 
-class MyStationViewSet(viewsets.ModelViewSet):
+class MyStationPagination(CursorPagination):
+    """
+    Cursor pagination: no COUNT(*) per page, and stable pages while stations are added.
+    The primary key never changes, so it is a safe cursor
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class MyStationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows stations to be viewed or edited.
+    Lists are cursor paginated, ?fields= selects the fields returned,
+    and GETs honour If-None-Match / If-Modified-Since with 304 responses.
     """
     queryset = MyStation.objects.all()
     serializer_class = MyStationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MyStationPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET':
+            fields = requested_fields(self.request, {field.name for field in MyStation._meta.concrete_fields})
+            if fields is not None:
+                # Only read the columns that are rendered; id is needed by the cursor
+                queryset = queryset.only('id', *fields)
+        return queryset
+
+    def last_deletion(self):
+        return StationDeletion.last()
@@ -0,0 +1,155 @@
+# qsling/membership
+#
+# In-process LoTW / eQSL membership index
+#
+import datetime
+import threading
+from typing import Iterable, NamedTuple
+
+from tools.versions import VersionWatch
+
+from .models import LoTWUser, eQSLUser
+
+
+class Membership(NamedTuple):
+    """
+    Whether a callsign uses LoTW and/or eQSL
+    """
+    call: str
+    lotw: datetime.datetime | None
+    eqsl: bool
+
+
+class QSLMembershipIndex:
+    """
+    Callsign -> date_from dict for LoTW and a frozenset for eQSL,
+    loaded once from the tables so lookups never hit the database
+    """
+
+    def __init__(self, lotw: dict, eqsl: frozenset) -> None:
+        """
+        Use from_database() unless you are building the tables yourself
+
+        :param lotw: callsign -> date_from
+        :param eqsl: callsigns
+        """
+        self.lotw = lotw
+        self.eqsl = eqsl
+
+    @staticmethod
+    def load_lotw() -> dict:
+        """
+        Reads the LoTW table, keeping the most recent date for repeated callsigns
+
+        :return: callsign -> date_from
+        """
+        lotw = {}
+        for callsign, date_from in LoTWUser.objects.values_list('callsign', 'date_from').iterator(chunk_size=10000):
+            callsign = callsign.upper()
+            if callsign not in lotw or lotw[callsign] < date_from:
+                lotw[callsign] = date_from
+        return lotw
+
+    @staticmethod
+    def load_eqsl() -> frozenset:
+        """
+        Reads the eQSL table
+
+        :return: frozenset of callsigns
+        """
+        return frozenset(
+            callsign.upper() for callsign in eQSLUser.objects.values_list('callsign', flat=True).iterator(chunk_size=10000)
+        )
+
+    @classmethod
+    def from_database(cls) -> 'QSLMembershipIndex':
+        """
+        Reads both tables
+
+        :return: a new index
+        """
+        return cls(cls.load_lotw(), cls.load_eqsl())
+
+    def lookup(self, call: str) -> Membership:
+        """
+        Membership of a single callsign
+
+        :param call: callsign
+        :return: Membership
+        """
+        call = call.strip().upper()
+        return Membership(call, self.lotw.get(call), call in self.eqsl)
+
+    def lookup_many(self, calls: Iterable[str]) -> dict:
+        """
+        Membership of many callsigns at once, e.g. every QSO of a log
+
+        :param calls: callsigns, repeated ones are looked up once
+        :return: dict uppercased callsign -> Membership
+        """
+        lotw = self.lotw
+        eqsl = self.eqsl
+        result = {}
+        for call in calls:
+            call = call.strip().upper()
+            if call not in result:
+                result[call] = Membership(call, lotw.get(call), call in eqsl)
+        return result
+
+
+_index = None
+_index_lock = threading.Lock()
+# LoTW / eQSL refreshes made by other processes (cron, run_refresher)
+_versions = VersionWatch('lotw', 'eqsl')
+
+
+def get_membership_index(reload: bool = True) -> QSLMembershipIndex:
+    """
+    Process-wide index, built on first use; a side is reloaded once its table was refreshed, by any process
+
+    :param reload: False in an event loop, where the database cannot be read: reloads are left to the caller
+    :return: QSLMembershipIndex
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _versions.mark()
+                _index = QSLMembershipIndex.from_database()
+    elif reload and (changed := _versions.changed()):
+        return refresh_membership_index(lotw='lotw' in changed, eqsl='eqsl' in changed)
+    return _index
+
+
+def refresh_membership_index(lotw: bool = True, eqsl: bool = True) -> QSLMembershipIndex:
+    """
+    Reloads one or both sides of the index and swaps the new one in with a single assignment.
+    Lookups running meanwhile keep using the previous index
+
+    :param lotw: reload the LoTW users
+    :param eqsl: reload the eQSL users
+    :return: the new index
+    """
+    global _index
+    with _index_lock:
+        current = _index
+        if current is None:
+            _versions.mark()
+            _index = QSLMembershipIndex.from_database()
+        else:
+            _versions.mark(*[name for name, reloaded in (('lotw', lotw), ('eqsl', eqsl)) if reloaded])
+            _index = QSLMembershipIndex(
+                QSLMembershipIndex.load_lotw() if lotw else current.lotw,
+                QSLMembershipIndex.load_eqsl() if eqsl else current.eqsl,
+            )
+        return _index
+
+
+def lookup_many(calls: Iterable[str]) -> dict:
+    """
+    Shortcut to get_membership_index().lookup_many()
+
+    :param calls: callsigns
+    :return: dict uppercased callsign -> Membership
+    """
+    return get_membership_index().lookup_many(calls)
@@ -1,11 +1,23 @@
+import contextlib
 import csv
 import datetime
-import io
+import logging
+from typing import Iterator, TextIO
 
-import requests
 from django.db import models, transaction
 from django.utils import timezone
 
+from tools.bulk import BATCH_SIZE
+from tools.feeds import get_fetcher
+from tools.stats import RefreshStats
+from tools.tableswap import replace_table
+from tools.versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+LOTW_USERS_URL = 'https://lotw.arrl.org/lotw-user-activity.csv'
+EQSL_USERS_URL = 'https://www.eqsl.cc/qslcard/DownloadedFiles/AGMemberList.txt'
+
 
 class LoTWUser(models.Model):
     """
@@ -15,31 +27,60 @@ class LoTWUser(models.Model):
     date_from = models.DateTimeField(blank=False, null=False)
 
     @staticmethod
-    @transaction.atomic
-    def update_tables() -> int:
+    def parse_rows(csvio: TextIO) -> Iterator[tuple]:
         """
-        Clear the table
-        Get the records from Internet
-        Populate table
-        Profit!
+        Lazily turns lotw-user-activity.csv lines into (callsign, date_from) tuples:
+            EA3IEG,2025-08-01,12:34:56
+        Lines without a callsign or a valid date are skipped
 
-        :return: number of created records
+        :param csvio: open text file
+        :return: iterator of tuples
         """
-        LoTWUser.objects.all().delete()
-        lotw_users = 'https://lotw.arrl.org/lotw-user-activity.csv'
-        lotw_csv = requests.get(lotw_users)
-        lotw_csv.raise_for_status()
-        csvio = io.StringIO(lotw_csv.text)
-        batch_list = []
         for row in csv.reader(csvio):
-            batch_list.append(
-                LoTWUser(
-                    callsign=row[0],
-                    date_from=datetime.datetime.fromisoformat((row[1] + ' ' + row[2] + 'Z'))
-                )
-            )
-        LoTWUser.objects.bulk_create(batch_list)
-        return len(batch_list)
+            try:
+                callsign, date, time_of_day = row[:3]
+                date_from = datetime.datetime.fromisoformat(date + ' ' + time_of_day + 'Z')
+            except ValueError:
+                # Blank, truncated or garbled lines: one of them must not cost the whole feed
+                continue
+            if callsign:
+                yield callsign, date_from
+
+    @staticmethod
+    def update_tables(force: bool = False, batch_size: int = BATCH_SIZE, use_copy: bool = False,
+                      stats: RefreshStats = None, swap: bool = False) -> int:
+        """
+        Get the records from Internet, unless they did not change since last time (outside any transaction)
+        Clear the table (or load a shadow copy of it, see swap)
+        Populate table, streaming the file in batch_size chunks, in one transaction (see replace_table)
+        Refresh the in-memory membership index
+        Profit!
+
+        :param force: download and load even if upstream did not change
+        :param batch_size: rows per bulk_create
+        :param use_copy: load with COPY when running on Postgres
+        :param stats: collects timings, rows and process peak memory, for the caller to report
+        :param swap: load a shadow table and rename it in place, so lookups never wait (Postgres only)
+        :return: number of created records, 0 if nothing changed
+        """
+        stats = stats or RefreshStats('lotw')
+        with contextlib.ExitStack() as stack:
+            with stats.phase('download'):
+                feed = stack.enter_context(get_fetcher().fetch(LOTW_USERS_URL, 'lotw-user-activity.csv', force=force))
+            if not feed.changed:
+                stats.skipped = True
+                logger.debug(stats.finish())
+                return 0
+            csvio = stack.enter_context(open(feed.path, newline='', encoding='utf8', errors='replace'))
+            with stats.phase('db', excluding=('parse',)):
+                stats.rows = replace_table(LoTWUser, ['callsign', 'date_from'],
+                                           stats.timed(LoTWUser.parse_rows(csvio), 'parse'), batch_size, use_copy, swap)
+        # Imported here: the membership module imports these models
+        from .membership import refresh_membership_index
+        transaction.on_commit(lambda: bump_version('lotw'))
+        transaction.on_commit(lambda: refresh_membership_index(eqsl=False))
+        logger.debug(stats.finish())
+        return stats.rows
 
     def __str__(self) -> str:
         """
@@ -61,30 +102,57 @@ class eQSLUser(models.Model):
     date_from = models.DateTimeField(blank=False, null=False, default=timezone.now)
 
     @staticmethod
-    @transaction.atomic
-    def update_tables() -> int:
+    def parse_rows(csvio: TextIO) -> Iterator[tuple]:
         """
-        Clear the table
-        Get the records from Internet
-        Populate table
-        Profit!
+        Lazily turns AGMemberList.txt lines into (callsign,) tuples, skipping the header
 
-        :return: number of created records
+        :param csvio: open text file
+        :return: iterator of tuples
         """
-        eQSLUser.objects.all().delete()
-        eqsl_users = 'https://www.eqsl.cc/qslcard/DownloadedFiles/AGMemberList.txt'
-        eqsl_csv = requests.get(eqsl_users)
-        eqsl_csv.raise_for_status()
-        csvio = io.StringIO(eqsl_csv.text)
-        batch_list = []
         for row in csv.reader(csvio):
-            batch_list.append(
-                eQSLUser(
-                    callsign=row[0],
-                )
-            )
-        eQSLUser.objects.bulk_create(batch_list)
-        return len(batch_list)
+            callsign = row[0].strip() if row else ''
+            # Skips blank lines and the header sentence on top of the list
+            if callsign and ' ' not in callsign:
+                yield (callsign,)
+
+    @staticmethod
+    def update_tables(force: bool = False, batch_size: int = BATCH_SIZE, use_copy: bool = False,
+                      stats: RefreshStats = None, swap: bool = False) -> int:
+        """
+        Get the records from Internet, unless they did not change since last time (outside any transaction)
+        Clear the table (or load a shadow copy of it, see swap)
+        Populate table, streaming the file in batch_size chunks, in one transaction (see replace_table)
+        Refresh the in-memory membership index
+        Profit!
+
+        :param force: download and load even if upstream did not change
+        :param batch_size: rows per bulk_create
+        :param use_copy: load with COPY when running on Postgres
+        :param stats: collects timings, rows and process peak memory, for the caller to report
+        :param swap: load a shadow table and rename it in place, so lookups never wait (Postgres only)
+        :return: number of created records, 0 if nothing changed
+        """
+        stats = stats or RefreshStats('eqsl')
+        with contextlib.ExitStack() as stack:
+            with stats.phase('download'):
+                feed = stack.enter_context(get_fetcher().fetch(EQSL_USERS_URL, 'eqsl-ag-members.txt', force=force))
+            if not feed.changed:
+                stats.skipped = True
+                logger.debug(stats.finish())
+                return 0
+            csvio = stack.enter_context(open(feed.path, newline='', encoding='utf8', errors='replace'))
+            with stats.phase('db', excluding=('parse',)):
+                # COPY does not run Python defaults, so date_from is sent explicitly
+                now = timezone.now()
+                rows = ((callsign, now) for callsign, in eQSLUser.parse_rows(csvio))
+                stats.rows = replace_table(eQSLUser, ['callsign', 'date_from'],
+                                           stats.timed(rows, 'parse'), batch_size, use_copy, swap)
+        # Imported here: the membership module imports these models
+        from .membership import refresh_membership_index
+        transaction.on_commit(lambda: bump_version('eqsl'))
+        transaction.on_commit(lambda: refresh_membership_index(lotw=False))
+        logger.debug(stats.finish())
+        return stats.rows
 
     def __str__(self) -> str:
         """
@@ -0,0 +1,75 @@
+# qsling/tests/tests_membership
+#
+# QSLMembershipIndex: lookups, and the process-wide index following the tables
+#
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+
+from qsling import membership
+from qsling.membership import Membership, QSLMembershipIndex, get_membership_index, refresh_membership_index
+from qsling.models import LoTWUser, eQSLUser
+from tools.versions import bump_version
+
+UTC = datetime.timezone.utc
+OLD = datetime.datetime(2020, 1, 1, tzinfo=UTC)
+NEW = datetime.datetime(2024, 5, 1, 12, tzinfo=UTC)
+
+
+class QSLMembershipIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        LoTWUser.objects.bulk_create([LoTWUser(callsign='EA3IEG', date_from=OLD),
+                                      LoTWUser(callsign='ea3ieg', date_from=NEW),
+                                      LoTWUser(callsign='K1ABC', date_from=OLD)])
+        eQSLUser.objects.bulk_create([eQSLUser(callsign='EA3IEG'), eQSLUser(callsign='dl1a')])
+
+    def setUp(self):
+        # Every test starts without a process-wide index
+        patcher = mock.patch.object(membership, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lookup(self):
+        index = QSLMembershipIndex.from_database()
+        self.assertEqual(index.lookup(' ea3ieg '), Membership('EA3IEG', NEW, True))
+        self.assertEqual(index.lookup('K1ABC'), Membership('K1ABC', OLD, False))
+        self.assertEqual(index.lookup('DL1A'), Membership('DL1A', None, True))
+        self.assertEqual(index.lookup('N0CALL'), Membership('N0CALL', None, False))
+
+    def test_lookup_many(self):
+        index = QSLMembershipIndex.from_database()
+        result = index.lookup_many(['K1ABC', 'ea3ieg', 'EA3IEG ', 'N0CALL'])
+        self.assertEqual(list(result), ['K1ABC', 'EA3IEG', 'N0CALL'])
+        self.assertEqual(result['EA3IEG'], Membership('EA3IEG', NEW, True))
+        self.assertEqual(membership.lookup_many(['DL1A']), {'DL1A': Membership('DL1A', None, True)})
+
+    def test_process_index_is_built_once(self):
+        index = get_membership_index()
+        LoTWUser.objects.create(callsign='DL1A', date_from=NEW)
+        self.assertIs(get_membership_index(), index)
+        self.assertIsNone(index.lookup('DL1A').lotw)
+
+    def test_refresh_reloads_one_side(self):
+        index = get_membership_index()
+        LoTWUser.objects.create(callsign='DL1A', date_from=NEW)
+        eQSLUser.objects.create(callsign='K1ABC')
+        refreshed = refresh_membership_index(eqsl=False)
+        self.assertIsNot(refreshed, index)
+        self.assertIs(get_membership_index(), refreshed)
+        self.assertEqual(refreshed.lookup('DL1A').lotw, NEW)
+        self.assertIs(refreshed.eqsl, index.eqsl)
+        self.assertFalse(refreshed.lookup('K1ABC').eqsl)
+
+    def test_reload_after_a_refresh_elsewhere(self):
+        index = get_membership_index()
+        eQSLUser.objects.create(callsign='K1ABC')
+        # What another process does once its refresh committed
+        bump_version('eqsl')
+        with mock.patch.object(membership._versions, 'next_check', 0):
+            self.assertIs(get_membership_index(reload=False), index)
+            reloaded = get_membership_index()
+        self.assertTrue(reloaded.lookup('K1ABC').eqsl)
+        self.assertIs(reloaded.lotw, index.lotw)
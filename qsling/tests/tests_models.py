@@ -1,3 +1,124 @@
-# from django.test import TestCase
+# qsling/tests/tests_models
+#
+# LoTW / eQSL member lists: parsing the feeds, and loading them through replace_table
+#
+import contextlib
+import datetime
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from qsling import membership
+from qsling.membership import get_membership_index
+from qsling.models import LoTWUser, eQSLUser
+from tools.feeds import Feed
+from tools.stats import RefreshStats
+
+UTC = datetime.timezone.utc
+
+LOTW_CSV = '''EA3IEG,2025-08-01,12:34:56
+K1ABC,2024-01-02,00:00:00
+
+DL1A,2025-13-01,00:00:00
+F4XYZ,2025-08-01
+,2025-08-01,12:00:00
+W1AW,2023-05-06,07:08:09,extra
+'''
+EQSL_TXT = '''List of Authenticity Guaranteed Members as of 01-Aug-2025
+EA3IEG
+
+ k1abc
+'''
+
+
+class StubFetcher:
+    """
+    Hands over a local file as if it had been downloaded, changed or not
+    """
+
+    def __init__(self, path: Path, changed: bool = True) -> None:
+        self.path = path
+        self.changed = changed
+
+    @contextlib.contextmanager
+    def fetch(self, url: str, name: str = None, force: bool = False):
+        yield Feed(url, self.path, self.changed or force)
+
+
+class ParseRowsTests(SimpleTestCase):
+
+    def test_lotw_skips_bad_rows(self):
+        self.assertEqual(list(LoTWUser.parse_rows(io.StringIO(LOTW_CSV))), [
+            ('EA3IEG', datetime.datetime(2025, 8, 1, 12, 34, 56, tzinfo=UTC)),
+            ('K1ABC', datetime.datetime(2024, 1, 2, tzinfo=UTC)),
+            ('W1AW', datetime.datetime(2023, 5, 6, 7, 8, 9, tzinfo=UTC)),
+        ])
+
+    def test_eqsl_skips_header(self):
+        self.assertEqual(list(eQSLUser.parse_rows(io.StringIO(EQSL_TXT))), [('EA3IEG',), ('k1abc',)])
+
+
+class UpdateTablesTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.lotw = Path(directory) / 'lotw-user-activity.csv'
+        self.lotw.write_text(LOTW_CSV, encoding='utf8')
+        self.eqsl = Path(directory) / 'eqsl-ag-members.txt'
+        self.eqsl.write_text(EQSL_TXT, encoding='utf8')
+        patcher = mock.patch.object(membership, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def update(self, model: type, path: Path, changed: bool = True, **options) -> tuple[int, RefreshStats]:
+        """
+        :return: (update_tables() result, its stats)
+        """
+        stats = RefreshStats(model.__name__)
+        with mock.patch('qsling.models.get_fetcher', return_value=StubFetcher(path, changed)):
+            return model.update_tables(stats=stats, **options), stats
+
+    def test_lotw_replaces_table(self):
+        LoTWUser.objects.create(callsign='N0CALL', date_from=datetime.datetime(2020, 1, 1, tzinfo=UTC))
+        with self.captureOnCommitCallbacks(execute=True):
+            rows, stats = self.update(LoTWUser, self.lotw, batch_size=2)
+        self.assertEqual(rows, 3)
+        self.assertEqual(stats.rows, 3)
+        self.assertEqual(sorted(LoTWUser.objects.values_list('callsign', flat=True)), ['EA3IEG', 'K1ABC', 'W1AW'])
+        self.assertEqual(set(stats.phases), {'download', 'parse', 'db'})
+        self.assertIsNotNone(stats.peak_rss_mb)
+        # Refreshed once committed
+        self.assertEqual(get_membership_index().lookup('EA3IEG').lotw, datetime.datetime(2025, 8, 1, 12, 34, 56, tzinfo=UTC))
+        self.assertIsNone(get_membership_index().lookup('N0CALL').lotw)
+
+    def test_eqsl_replaces_table(self):
+        eQSLUser.objects.create(callsign='N0CALL')
+        with self.captureOnCommitCallbacks(execute=True):
+            rows, _stats = self.update(eQSLUser, self.eqsl)
+        self.assertEqual(rows, 2)
+        self.assertEqual(sorted(eQSLUser.objects.values_list('callsign', flat=True)), ['EA3IEG', 'k1abc'])
+        self.assertTrue(get_membership_index().lookup('K1ABC').eqsl)
+        self.assertFalse(get_membership_index().lookup('N0CALL').eqsl)
+
+    def test_unchanged_feed_is_skipped(self):
+        eQSLUser.objects.create(callsign='N0CALL')
+        with self.captureOnCommitCallbacks() as callbacks:
+            rows, stats = self.update(eQSLUser, self.eqsl, changed=False)
+        self.assertEqual(rows, 0)
+        self.assertTrue(stats.skipped)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(list(eQSLUser.objects.values_list('callsign', flat=True)), ['N0CALL'])
+        # Unless forced
+        self.assertEqual(self.update(eQSLUser, self.eqsl, changed=False, force=True)[0], 2)
+
+    def test_command_prints_the_figures(self):
+        stdout = io.StringIO()
+        with mock.patch('qsling.models.get_fetcher', return_value=StubFetcher(self.lotw)):
+            call_command('refresh_reference_data', 'lotw', stdout=stdout)
+        self.assertRegex(stdout.getvalue(), r'^lotw: 3 rows in [\d.]+s \(download .*, parse .*, db .*\), process peak RSS ')
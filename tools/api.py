@@ -0,0 +1,117 @@
+# tools/api
+#
+# DRF helpers: sparse fieldsets (?fields=) and conditional GET (ETag / Last-Modified)
+#
+import hashlib
+import time
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(request, available) -> list | None:
+    """
+    Fields asked for with ?fields=a,b,c
+
+    :param request: DRF request, may be None
+    :param available: field names the serializer has
+    :return: list of names in request order, None if the parameter is absent
+    :raises ValidationError: for unknown fields
+    """
+    if request is None or not request.query_params.get(FIELDS_PARAM):
+        return None
+    fields = [name.strip() for name in request.query_params[FIELDS_PARAM].split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValidationError({FIELDS_PARAM: f'Unknown fields: {", ".join(unknown)}'})
+    return fields
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin keeping only the fields listed in ?fields=, so the rest is neither read nor rendered
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        # Only on reads: writes need every field to validate
+        if request is not None and request.method == 'GET':
+            fields = requested_fields(request, self.fields)
+            if fields is not None:
+                for name in set(self.fields) - set(fields):
+                    self.fields.pop(name)
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin answering list and retrieve with 304 Not Modified when the client's copy is current.
+    Validators come from an updated_on field: for lists the latest of Max(updated_on) and of the last deletion
+    (see last_deletion()), updated_on for single objects. They are checked before any serialization;
+    the ETag also covers the query string and the negotiated media type.
+    Last-Modified only has whole seconds: it is left out while the current second may still bring changes,
+    so the ETag decides
+    """
+    modified_field = 'updated_on'
+
+    def last_deletion(self):
+        """
+        When a row of the list was last deleted; override for models that can be deleted
+
+        :return: datetime, or None
+        """
+        return None
+
+    def _etag(self, *parts) -> str:
+        """
+        :param parts: values identifying the representation
+        :return: quoted ETag
+        """
+        key = '|'.join(map(str, (*parts, self.request.get_full_path(), self.request.accepted_media_type)))
+        return quote_etag(hashlib.blake2b(key.encode('utf8'), digest_size=16).hexdigest())
+
+    def _conditional(self, etag: str, last_modified, respond):
+        """
+        304 when the request validators match, otherwise the full response carrying the validators
+
+        :param etag: current ETag
+        :param last_modified: current modification datetime, may be None
+        :param respond: builds the full response
+        :return: response
+        """
+        timestamp = None
+        # A change later in the same second would not move Last-Modified
+        if last_modified is not None and last_modified.timestamp() < int(time.time()):
+            timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(self.request._request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = respond()
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        # Let clients keep the payload but check back every time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        modified = queryset.aggregate(modified=Max(self.modified_field))['modified']
+        deleted = self.last_deletion()
+        if deleted is not None and (modified is None or deleted > modified):
+            modified = deleted
+        return self._conditional(self._etag(modified), modified, lambda: super(ConditionalGetMixin, self).list(
+            request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        modified = self.filter_queryset(self.get_queryset()).filter(**lookup).values_list(
+            self.modified_field, flat=True).first()
+        if modified is None:
+            # Not found: let the normal path answer 404
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional(self._etag(modified), modified, lambda: super(ConditionalGetMixin, self).retrieve(
+            request, *args, **kwargs))
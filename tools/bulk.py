@@ -0,0 +1,120 @@
+# tools/bulk
+#
+# Chunked bulk loading helpers: bulk_create in fixed-size batches or Postgres COPY
+#
+import itertools
+from typing import Iterable, Iterator
+
+from django.db import connections, models, transaction
+from django.db.models.constants import OnConflict
+from django.db.models.sql import InsertQuery
+
+BATCH_SIZE = 5000
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Splits an iterable in lists of at most size items, lazily
+
+    :param iterable: anything iterable
+    :param size: items per chunk
+    :return: iterator of lists
+    """
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def can_copy(using: str = 'default') -> bool:
+    """
+    COPY is only available on Postgres through psycopg 3
+
+    :param using: database alias
+    :return: True if copy_rows() can be used
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def copy_rows(model: type[models.Model], fields: list, rows: Iterable[tuple], table: str = None,
+              using: str = 'default') -> int:
+    """
+    Streams rows into the model's table with COPY ... FROM STDIN
+
+    :param model: model class, used for the table and column names
+    :param fields: field names, in the order of the values in each row
+    :param rows: iterable of tuples
+    :param table: table to copy into, defaults to the model's own
+    :param using: database alias
+    :return: number of rows copied
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    model_fields = [model._meta.get_field(name) for name in fields]
+    columns = ', '.join(quote(field.column) for field in model_fields)
+    table = quote(table or model._meta.db_table)
+    count = 0
+    with connection.cursor() as cursor:
+        with cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+            for row in rows:
+                # Same adaptation the ORM would do (JSON, enums...)
+                copy.write_row([field.get_db_prep_save(value, connection) for field, value in zip(model_fields, row)])
+                count += 1
+    return count
+
+
+def bulk_load(model: type[models.Model], fields: list, rows: Iterable[tuple], batch_size: int = BATCH_SIZE,
+              use_copy: bool = False, using: str = 'default') -> int:
+    """
+    Inserts rows without ever holding more than batch_size instances.
+    Falls back to bulk_create when COPY was asked for but is not available
+
+    :param model: model class
+    :param fields: field names, in the order of the values in each row
+    :param rows: iterable of tuples
+    :param batch_size: rows per bulk_create
+    :param use_copy: use Postgres COPY
+    :param using: database alias
+    :return: number of rows inserted
+    """
+    if use_copy and can_copy(using):
+        return copy_rows(model, fields, rows, using=using)
+    count = 0
+    manager = model.objects.db_manager(using)
+    for chunk in chunked(rows, batch_size):
+        manager.bulk_create([model(**dict(zip(fields, row))) for row in chunk], batch_size=batch_size)
+        count += len(chunk)
+    return count
+
+
+def insert_ignoring_conflicts(objs: list, batch_size: int = BATCH_SIZE, using: str = 'default') -> int:
+    """
+    bulk_create(ignore_conflicts=True) telling how many rows went in: rows clashing with a unique
+    constraint are skipped (ON CONFLICT DO NOTHING, INSERT OR IGNORE on SQLite) and the row counts
+    of the INSERTs are added up. Unlike counting the table afterwards, rows other transactions
+    insert meanwhile are not counted
+
+    :param objs: unsaved instances of one model
+    :param batch_size: rows per INSERT, lowered to what the database accepts
+    :param using: database alias
+    :return: number of rows inserted
+    """
+    if not objs:
+        return 0
+    model = type(objs[0])
+    opts = model._meta
+    fields = [field for field in opts.concrete_fields if field is not opts.auto_field and not field.generated]
+    connection = connections[using]
+    batch_size = max(min(batch_size, connection.ops.bulk_batch_size(fields, objs)), 1)
+    inserted = 0
+    with transaction.atomic(using=using, savepoint=False), connection.cursor() as cursor:
+        for chunk in chunked(objs, batch_size):
+            query = InsertQuery(model, on_conflict=OnConflict.IGNORE)
+            query.insert_values(fields, chunk)
+            for sql, params in query.get_compiler(using=using).as_sql():
+                cursor.execute(sql, params)
+                inserted += cursor.rowcount
+    return inserted
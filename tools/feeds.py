@@ -0,0 +1,153 @@
+# tools/feeds
+#
+# Conditional, cached download of the reference data feeds (ClubLog, LoTW, eQSL)
+#
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 120
+
+
+class Feed(NamedTuple):
+    """
+    What fetch() hands over to the caller
+    """
+    url: str
+    path: Path
+    changed: bool
+
+
+class FeedFetcher:
+    """
+    Downloads feeds into a local cache directory and remembers their ETag / Last-Modified,
+    so the next download is a conditional GET which costs a 304 when nothing changed.
+
+    Validators are only stored once the caller has processed the file without errors:
+        with fetcher.fetch(url) as feed:
+            if feed.changed:
+                load(feed.path)
+    otherwise a failed load would be skipped on the next run because upstream answers 304.
+    """
+
+    def __init__(self, cache_dir: str | Path, session: requests.Session = None, timeout: float = TIMEOUT) -> None:
+        """
+        :param cache_dir: where the files and their validators live
+        :param session: requests session to use, a pooled one is created if None
+        :param timeout: seconds to wait for the server
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=2)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self.timeout = timeout
+
+    def paths(self, url: str, name: str = None) -> tuple[Path, Path]:
+        """
+        Cache file and validators file for a URL.
+        Unnamed feeds use a hash of the URL, so API keys never end up in file names
+
+        :param url: feed URL
+        :param name: file name to use in the cache
+        :return: (data path, metadata path)
+        """
+        if name is None:
+            name = hashlib.sha256(url.encode('utf8')).hexdigest()
+        path = self.cache_dir / name
+        return path, path.with_name(path.name + '.meta.json')
+
+    def validators(self, url: str, name: str = None) -> dict:
+        """
+        Stored validators for a feed, empty if never fetched or the file is gone
+
+        :param url: feed URL
+        :param name: file name in the cache
+        :return: dict with etag and/or last_modified
+        """
+        path, meta_path = self.paths(url, name)
+        if not path.exists() or not meta_path.exists():
+            return {}
+        try:
+            with open(meta_path, encoding='utf8') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return {}
+
+    @contextlib.contextmanager
+    def fetch(self, url: str, name: str = None, force: bool = False) -> Iterator[Feed]:
+        """
+        Conditional GET of the feed, streamed to disk in chunks
+
+        :param url: feed URL
+        :param name: file name in the cache, defaults to a hash of the URL
+        :param force: ignore the stored validators and download anyway
+        :return: context manager yielding a Feed
+        """
+        path, meta_path = self.paths(url, name)
+        validators = {} if force else self.validators(url, name)
+        headers = {}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as answer:
+            if answer.status_code == 304:
+                yield Feed(url, path, False)
+                return
+            answer.raise_for_status()
+            partial = path.with_name(path.name + '.part')
+            try:
+                with open(partial, 'wb') as partial_file:
+                    for chunk in answer.iter_content(CHUNK_SIZE):
+                        partial_file.write(chunk)
+            except BaseException:
+                # Cut short: the cached file and its validators stay as they were
+                partial.unlink(missing_ok=True)
+                raise
+            validators = {}
+            if answer.headers.get('ETag'):
+                validators['etag'] = answer.headers['ETag']
+            if answer.headers.get('Last-Modified'):
+                validators['last_modified'] = answer.headers['Last-Modified']
+
+        try:
+            yield Feed(url, partial, True)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        os.replace(partial, path)
+        with open(meta_path, 'w', encoding='utf8') as meta_file:
+            json.dump(validators, meta_file)
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> FeedFetcher:
+    """
+    Process-wide fetcher, sharing one pooled session.
+    The cache lives in settings.FEED_CACHE_DIR
+
+    :return: FeedFetcher
+    """
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                from django.conf import settings
+                _fetcher = FeedFetcher(settings.FEED_CACHE_DIR)
+    return _fetcher
@@ -1,5 +1,8 @@
+import functools
 import re
 
+import numpy as np
+
 
 # from geographiclib.geodesic import Geodesic
 # Geodesic.WGS84.Inverse(p1.latitude, p1.longitude, p2.latitude, p2.longitude)
@@ -14,6 +17,23 @@ import re
 # s12 = s12, distance from 1 to 2 (meters)
 # a12 = σ12, arc length on auxiliary sphere from 1 to 2 (degrees)
 
+# maiden = re.compile
+# (r'^([A-Ra-r]{2})(\d{2})($|[A-Xa-x][A-Xa-x]?$|([A-Xa-x][A-Xa-x])(?:$|\d{2}$|\d{2}([A-Xa-x][A-Xa-x])$))')
+MAIDENHEAD = re.compile(r'^([A-R]{2})(\d{2})($|[A-X][A-X]?$|([A-X][A-X])(?:$|\d{2}$|\d{2}([A-X][A-X])$))')
+
+# Batch decoding: what to subtract from each character code ('A' letters, '0' digits)
+# and the highest value each position accepts
+BATCH_OFFSETS = np.array([ord('A'), ord('A'), ord('0'), ord('0'), ord('A'), ord('A'),
+                          ord('0'), ord('0'), ord('A'), ord('A')], dtype=np.int32)
+BATCH_LIMITS = np.array([17, 17, 9, 9, 23, 23, 9, 9, 23, 23], dtype=np.int32)
+
+# Encoding works on the finest grid (10 characters): 18 fields * 10 squares * 24 subsquares
+# * 10 extended squares * 24 extended subsquares = 1036800 cells on each axis
+ENCODE_CELLS = 18 * 10 * 24 * 10 * 24
+# Cells per character pair, coarsest first, and the code of its first symbol
+ENCODE_STEPS = ((ENCODE_CELLS // 18, ord('A')), (ENCODE_CELLS // 180, ord('0')), (ENCODE_CELLS // 4320, ord('a')),
+                (ENCODE_CELLS // 43200, ord('0')), (1, ord('a')))
+
 
 def maidenhead_to_coordinates(locator: str, grid_center: bool = True) -> (float, float):
     """
@@ -80,14 +100,35 @@ def maidenhead_to_coordinates(locator: str, grid_center: bool = True) -> (float,
             delta_latitude = 1 / 480
 
     if len(locator) > 8:
-        # TODO: To be implemented
+        # Ninth char: letter from A to X, 24 positions, 2 / 5760 degrees of longitude each
+        position = (ord(locator[8]) - ord('A')) * 2 / 5760
+        longitude += position
+
+        # Tenth char: letter from A to X, 24 positions, 1 / 5760 degrees of latitude each
+        position = (ord(locator[9]) - ord('A')) * 1 / 5760
+        latitude += position
+
         if grid_center:
-            delta_longitude = 1 / 240
-            delta_latitude = 1 / 480
+            delta_longitude = 1 / 5760
+            delta_latitude = 1 / 11520
 
     return round(latitude + delta_latitude, 6), round(longitude + delta_longitude, 6)
 
 
+@functools.lru_cache(maxsize=8192)
+def cached_maidenhead_to_coordinates(locator: str, grid_center: bool = True) -> (float, float):
+    """
+    maidenhead_to_coordinates() behind an LRU cache: logs reuse a handful of grids
+    over and over, so most calls become a dict lookup.
+    Invalid locators still raise and are not cached
+
+    :param locator: then Maidenhead locator
+    :param grid_center: if True, return the center of the grid
+    :return: tuple with latitude and longitude
+    """
+    return maidenhead_to_coordinates(locator, grid_center)
+
+
 def validate_locator(locator: str) -> bool:
     """
     Checks whether the given str is a well-formed locator:
@@ -106,8 +147,124 @@ def validate_locator(locator: str) -> bool:
         raise ValueError("locator must have between 4 and 10 characters")
 
     locator = locator.upper()
+    return MAIDENHEAD.match(locator) is not None
+
+
+def maidenhead_to_coordinates_batch(locators, grid_center: bool = True,
+                                    precision: int = None) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Vectorized maidenhead_to_coordinates() for many locators at once.
+    Invalid locators do not raise: their row is False in the mask and NaN in the coordinates
+
+    :param locators: sequence or array of str
+    :param grid_center: if True, return the center of each grid
+    :param precision: only decode the first 4, 6, 8 or 10 characters; None uses the whole locator
+    :return: tuple with latitude array, longitude array and validity mask
+    """
+    if precision is not None and precision not in (4, 6, 8, 10):
+        raise ValueError("precision must be 4, 6, 8 or 10")
+    strings = np.asarray(locators, dtype=str).reshape(-1)
+    lengths = np.char.str_len(strings)
+
+    # One row of ten unicode code points per locator, padded with zeros, uppercased
+    codes = strings.astype('U10').view(np.uint32).reshape(-1, 10).astype(np.int32)
+    codes = np.where((codes >= ord('a')) & (codes <= ord('z')), codes - 32, codes)
+    digits = codes - BATCH_OFFSETS
 
-    # maiden = re.compile
-    # (r'^([A-Ra-r]{2})(\d{2})($|[A-Xa-x][A-Xa-x]?$|([A-Xa-x][A-Xa-x])(?:$|\d{2}$|\d{2}([A-Xa-x][A-Xa-x])$))')
-    maiden = re.compile(r'^([A-R]{2})(\d{2})($|[A-X][A-X]?$|([A-X][A-X])(?:$|\d{2}$|\d{2}([A-X][A-X])$))')
-    return maiden.match(locator) is not None
+    in_range = (digits >= 0) & (digits <= BATCH_LIMITS)
+    used = np.arange(10) < lengths[:, None]
+    valid = np.isin(lengths, (4, 6, 8, 10)) & np.all(in_range | ~used, axis=1)
+
+    decoded = lengths if precision is None else np.minimum(lengths, precision)
+    pairs6 = decoded >= 6
+    pairs8 = decoded >= 8
+    pairs10 = decoded >= 10
+
+    longitude = -180.0 + digits[:, 0] * 20 + digits[:, 2] * 2.0
+    latitude = -90.0 + digits[:, 1] * 10 + digits[:, 3] * 1.0
+    longitude += np.where(pairs6, digits[:, 4] * 2 / 24, 0)
+    latitude += np.where(pairs6, digits[:, 5] * 1 / 24, 0)
+    longitude += np.where(pairs8, digits[:, 6] * 2 / 240, 0)
+    latitude += np.where(pairs8, digits[:, 7] * 1 / 240, 0)
+    longitude += np.where(pairs10, digits[:, 8] * 2 / 5760, 0)
+    latitude += np.where(pairs10, digits[:, 9] * 1 / 5760, 0)
+
+    if grid_center:
+        longitude += np.select([pairs10, pairs8, pairs6], [1 / 5760, 1 / 240, 1 / 24], 1)
+        latitude += np.select([pairs10, pairs8, pairs6], [1 / 11520, 1 / 480, 1 / 48], 0.5)
+
+    latitude = np.where(valid, np.round(latitude, 6), np.nan)
+    longitude = np.where(valid, np.round(longitude, 6), np.nan)
+    return latitude, longitude, valid
+
+
+def coordinates_to_maidenhead(latitude: float, longitude: float, length: int = 6) -> str:
+    """
+    Returns the Maidenhead locator containing the given point:
+    fields uppercase, subsquares lowercase (JN11ck, JN11ck45, JN11ck45ab)
+
+    :param latitude: -90 to 90 degrees
+    :param longitude: -180 to 180 degrees
+    :param length: 4, 6, 8 or 10 characters
+    :return: locator
+    """
+    if length not in (4, 6, 8, 10):
+        raise ValueError("length must be 4, 6, 8 or 10")
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError("coordinates out of range")
+
+    # Index of the finest cell on each axis; the north pole and antimeridian belong to the last one
+    lon_cell = min(int((longitude + 180) * ENCODE_CELLS / 360), ENCODE_CELLS - 1)
+    lat_cell = min(int((latitude + 90) * ENCODE_CELLS / 180), ENCODE_CELLS - 1)
+
+    locator = []
+    for step, first in ENCODE_STEPS[:length // 2]:
+        locator.append(chr(first + lon_cell // step))
+        locator.append(chr(first + lat_cell // step))
+        lon_cell %= step
+        lat_cell %= step
+    return ''.join(locator)
+
+
+def coordinates_to_maidenhead_batch(latitudes, longitudes, length: int = 6) -> np.ndarray:
+    """
+    Vectorized coordinates_to_maidenhead().
+    Out of range or NaN coordinates give an empty string
+
+    :param latitudes: sequence or array, -90 to 90 degrees
+    :param longitudes: sequence or array, -180 to 180 degrees
+    :param length: 4, 6, 8 or 10 characters
+    :return: array of str
+    """
+    if length not in (4, 6, 8, 10):
+        raise ValueError("length must be 4, 6, 8 or 10")
+    latitudes = np.asarray(latitudes, dtype=np.float64).reshape(-1)
+    longitudes = np.asarray(longitudes, dtype=np.float64).reshape(-1)
+    with np.errstate(invalid='ignore'):
+        valid = (latitudes >= -90) & (latitudes <= 90) & (longitudes >= -180) & (longitudes <= 180)
+    lon_cell = np.where(valid, (longitudes + 180) * ENCODE_CELLS / 360, 0).astype(np.int64)
+    lat_cell = np.where(valid, (latitudes + 90) * ENCODE_CELLS / 180, 0).astype(np.int64)
+    lon_cell = np.minimum(lon_cell, ENCODE_CELLS - 1)
+    lat_cell = np.minimum(lat_cell, ENCODE_CELLS - 1)
+
+    codes = np.empty((latitudes.size, length), dtype=np.uint32)
+    for pair, (step, first) in enumerate(ENCODE_STEPS[:length // 2]):
+        codes[:, 2 * pair] = first + lon_cell // step
+        codes[:, 2 * pair + 1] = first + lat_cell // step
+        lon_cell %= step
+        lat_cell %= step
+    locators = codes.view(f'U{length}').reshape(-1)
+    return np.where(valid, locators, '')
+
+
+def group_by_locator(latitudes, longitudes, length: int = 4) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Buckets points by grid square without a Python loop per row
+
+    :param latitudes: sequence or array
+    :param longitudes: sequence or array
+    :param length: 4 for squares, 6 for subsquares...
+    :return: tuple with the distinct locators, the bucket index of every point and the points per bucket
+    """
+    locators = coordinates_to_maidenhead_batch(latitudes, longitudes, length)
+    return np.unique(locators, return_inverse=True, return_counts=True)
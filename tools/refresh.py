@@ -0,0 +1,139 @@
+# tools/refresh
+#
+# Runs the reference data refreshes (ClubLog, LoTW, eQSL), concurrently and under a lock
+#
+import contextlib
+import fcntl
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator
+
+from django.conf import settings
+from django.db import connection, connections
+
+from .stats import RefreshStats
+
+LOCK_NAME = 'refresh.lock'
+
+
+class RefreshLocked(Exception):
+    """
+    Another refresh holds the lock
+    """
+
+
+def _clublog(stats: RefreshStats, force: bool, options: dict) -> None:
+    from clublog.models import update_tables
+    update_tables(force=force, stats=stats, **_pick(options, 'streaming', 'batch_size', 'mode'))
+
+
+def _lotw(stats: RefreshStats, force: bool, options: dict) -> None:
+    from qsling.models import LoTWUser
+    LoTWUser.update_tables(force=force, stats=stats, swap=options.get('mode') == 'swap',
+                           **_pick(options, 'batch_size', 'use_copy'))
+
+
+def _eqsl(stats: RefreshStats, force: bool, options: dict) -> None:
+    from qsling.models import eQSLUser
+    eQSLUser.update_tables(force=force, stats=stats, swap=options.get('mode') == 'swap',
+                           **_pick(options, 'batch_size', 'use_copy'))
+
+
+def _pick(options: dict, *names: str) -> dict:
+    """
+    The options a refresh understands, leaving out the unset ones so its own defaults apply
+
+    :param options: all the options
+    :param names: option names to keep
+    :return: dict
+    """
+    return {name: options[name] for name in names if options.get(name) is not None}
+
+
+# name: function(stats, force, options)
+REFRESHES: dict[str, Callable] = {
+    'clublog': _clublog,
+    'lotw': _lotw,
+    'eqsl': _eqsl,
+}
+
+
+@contextlib.contextmanager
+def refresh_lock(path: str | os.PathLike = None) -> Iterator[None]:
+    """
+    Exclusive, non blocking lock file, so two refreshes (two cron runs, cron and a worker...) never overlap.
+    The lock goes away with the process, even if it crashes
+
+    :param path: lock file, defaults to refresh.lock in FEED_CACHE_DIR
+    :return: context manager
+    """
+    path = Path(path or Path(settings.FEED_CACHE_DIR) / LOCK_NAME)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RefreshLocked(f'Another refresh holds {path}') from None
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _run(name: str, force: bool, options: dict) -> RefreshStats:
+    """
+    One refresh
+
+    :param name: key of REFRESHES
+    :param force: download and load even if upstream did not change
+    :param options: passed to the refresh
+    :return: RefreshStats, with error set if it failed
+    """
+    stats = RefreshStats(name)
+    try:
+        REFRESHES[name](stats, force, options)
+    except Exception as error:  # one failing feed must not hide the others
+        stats.error = f'{type(error).__name__}: {error}'
+    finally:
+        stats.finish()
+    return stats
+
+
+def _run_in_thread(name: str, force: bool, options: dict) -> RefreshStats:
+    """
+    One refresh in a pool thread, and therefore its own database connection.
+    Connections are per thread: this one is closed, or it leaks with the thread
+
+    :param name: key of REFRESHES
+    :param force: download and load even if upstream did not change
+    :param options: passed to the refresh
+    :return: RefreshStats, with error set if it failed
+    """
+    try:
+        return _run(name, force, options)
+    finally:
+        connections.close_all()
+
+
+def run_refreshes(names: list = None, force: bool = False, concurrent: bool = True, **options) -> list:
+    """
+    Runs the refreshes under the refresh lock.
+    They are independent downloads and tables, so they run in threads: the wall time is the one
+    of the slowest instead of the sum. SQLite allows a single writer, there they run one after another
+
+    :param names: keys of REFRESHES, defaults to all of them
+    :param force: download and load even if upstream did not change
+    :param concurrent: run in parallel threads
+    :param options: passed to the refreshes that take them (batch_size, streaming, mode, use_copy);
+        mode='swap' also makes LoTW and eQSL load through shadow tables
+    :return: list of RefreshStats, in names order
+    :raises RefreshLocked: when another refresh is running
+    """
+    names = names or list(REFRESHES)
+    concurrent = concurrent and connection.vendor != 'sqlite'
+    with refresh_lock():
+        if not concurrent:
+            return [_run(name, force, options) for name in names]
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='refresh') as executor:
+            return list(executor.map(lambda name: _run_in_thread(name, force, options), names))
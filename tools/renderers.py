@@ -0,0 +1,26 @@
+# tools/renderers
+#
+# DRF renderer backed by orjson: several times faster than the json module for large responses
+#
+import orjson
+from rest_framework.renderers import BaseRenderer
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Renders JSON with orjson. Datetimes, dates, UUIDs, dataclasses and numpy values are handled natively
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        """
+        :param data: what the view returned
+        :param accepted_media_type: negotiated media type
+        :param renderer_context: view, request and response
+        :return: UTF-8 encoded JSON
+        """
+        if data is None:
+            return b''
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,189 @@
+# tools/stats
+#
+# Timing and memory figures for the reference data refreshes
+#
+import contextlib
+import resource
+import sys
+import time
+from typing import BinaryIO, Iterable, Iterator
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of this process so far. It never goes down: a figure taken after some work
+    is that work's peak only if it raised the process' peak
+
+    :return: megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class RefreshStats:
+    """
+    Collects per-phase timings and row counts of one refresh, and the process' peak memory when it finished:
+        stats = RefreshStats('lotw')
+        with stats.phase('download'):
+            ...
+        stats.rows = 1234
+    Phases can be entered several times, their times add up.
+    The peak memory covers the process' whole life, other refreshes running alongside included,
+    so it is labelled as the process peak
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        :param name: what is being refreshed
+        """
+        self.name = name
+        self.phases = {}
+        self.rows = 0
+        self.skipped = False
+        self.error = None
+        self.started = time.perf_counter()
+        self.finished = None
+        self.peak_rss_mb = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str, excluding: tuple = ()) -> Iterator[None]:
+        """
+        Times a block and adds it to the phase.
+        Time other phases spent inside the block (e.g. a lazily parsed
+        iterator consumed by the DB writer) can be left out with excluding
+
+        :param name: phase name (download, decompress, parse, db)
+        :param excluding: phases nested in this block which must not be counted twice
+        :return: context manager
+        """
+        nested = sum(self.phases.get(other, 0.0) for other in excluding)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            nested = sum(self.phases.get(other, 0.0) for other in excluding) - nested
+            self.add(name, time.perf_counter() - start - nested)
+
+    def timed(self, iterable: Iterable, name: str, excluding: tuple = ()) -> Iterator:
+        """
+        Wraps an iterator, adding the time spent producing each item to a phase
+
+        :param iterable: lazy iterable, e.g. a parser
+        :param name: phase name
+        :param excluding: phases timed while producing the items which must not be counted twice
+        :return: iterator with the same items
+        """
+        iterator = iter(iterable)
+        while True:
+            nested = sum(self.phases.get(other, 0.0) for other in excluding)
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                nested = sum(self.phases.get(other, 0.0) for other in excluding) - nested
+                self.add(name, time.perf_counter() - start - nested)
+            yield item
+
+    def reader(self, stream: BinaryIO, name: str) -> 'TimedReader':
+        """
+        Wraps a file object, adding the time spent in its reads to a phase
+
+        :param stream: e.g. a GzipFile, to time decompression
+        :param name: phase name
+        :return: TimedReader
+        """
+        return TimedReader(stream, self, name)
+
+    def add(self, name: str, seconds: float) -> None:
+        """
+        Adds time to a phase measured elsewhere
+
+        :param name: phase name
+        :param seconds: time to add
+        :return:
+        """
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def finish(self) -> 'RefreshStats':
+        """
+        Stops the clock and samples the process' peak memory
+
+        :return: self
+        """
+        self.finished = time.perf_counter()
+        self.peak_rss_mb = peak_rss_mb()
+        return self
+
+    @property
+    def total(self) -> float:
+        """
+        Wall time from creation to finish() (or now)
+
+        :return: seconds
+        """
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_dict(self) -> dict:
+        """
+        Everything, ready to be logged or serialized
+
+        :return: dict
+        """
+        return {
+            'name': self.name,
+            'skipped': self.skipped,
+            'error': self.error,
+            'rows': self.rows,
+            'total': round(self.total, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'process_peak_rss_mb': round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None,
+        }
+
+    def __str__(self) -> str:
+        """
+        One line summary: lotw: 212345 rows in 8.123s (download 2.1s, db 5.9s), process peak RSS 95.2 MB
+
+        :return:
+        """
+        if self.error:
+            return f'{self.name}: failed after {self.total:.3f}s: {self.error}'
+        if self.skipped:
+            return f'{self.name}: unchanged, skipped in {self.total:.3f}s'
+        phases = ', '.join(f'{name} {seconds:.3f}s' for name, seconds in self.phases.items())
+        summary = f'{self.name}: {self.rows} rows in {self.total:.3f}s'
+        if phases:
+            summary += f' ({phases})'
+        if self.peak_rss_mb is not None:
+            summary += f', process peak RSS {self.peak_rss_mb:.1f} MB'
+        return summary
+
+
+class TimedReader:
+    """
+    File-like wrapper timing read() calls into a RefreshStats phase.
+    Lets lazy consumers (iterparse, xmltodict) report decompression apart from parsing
+    """
+
+    def __init__(self, stream: BinaryIO, stats: RefreshStats, name: str) -> None:
+        """
+        :param stream: file object to read from
+        :param stats: where to add the time
+        :param name: phase name
+        """
+        self.stream = stream
+        self.stats = stats
+        self.name = name
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        :param size: bytes to read, -1 for everything
+        :return: data
+        """
+        start = time.perf_counter()
+        try:
+            return self.stream.read(size)
+        finally:
+            self.stats.add(self.name, time.perf_counter() - start)
@@ -0,0 +1,275 @@
+# tools/tableswap
+#
+# Shadow table loads: fill a copy of a table, index it, then swap it in with a rename.
+# Readers keep using the live table, untouched, while the copy is loaded;
+# the swap only holds an exclusive lock for a few catalog updates. Postgres only.
+# Loads run outside any transaction: the swap commits on its own, so the lock ends with it.
+#
+import contextlib
+import re
+from typing import ContextManager, Iterable
+
+from django.db import OperationalError, connections, models, transaction
+from django.db.transaction import TransactionManagementError
+
+from .bulk import BATCH_SIZE, bulk_load, can_copy, copy_rows
+
+SHADOW_SUFFIX = '__shadow'
+# How long the swap may wait for readers to let go of the live table, and how many times it tries
+LOCK_TIMEOUT = '5s'
+LOCK_ATTEMPTS = 5
+# SQLSTATE of a lock_timeout expiring: the only error worth another attempt
+LOCK_NOT_AVAILABLE = '55P03'
+
+INDEX_DEFINITION = re.compile(r'^(CREATE (?:UNIQUE )?INDEX )(\S+) ON (?:ONLY )?(\S+) (USING .*)$', re.DOTALL)
+
+
+def can_swap(model: type[models.Model], using: str = 'default') -> bool:
+    """
+    Swapping needs Postgres with COPY, and no foreign key pointing at the table:
+    it would keep pointing at the old one
+
+    :param model: model class
+    :param using: database alias
+    :return: True if ShadowTable can be used
+    """
+    if not can_copy(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM pg_constraint WHERE contype = 'f' AND confrelid = %s::regclass",
+                       [model._meta.db_table])
+        return cursor.fetchone()[0] == 0
+
+
+def load_transaction(model: type[models.Model], swap: bool, using: str = 'default') -> ContextManager:
+    """
+    What a table load runs in. Rows replaced in place need a transaction, so readers see the old rows or the new ones.
+    A shadow load needs none: the shadow is invisible until the swap, which commits on its own
+
+    :param model: model class
+    :param swap: the load goes through a shadow table if possible
+    :param using: database alias
+    :return: context manager
+    """
+    if swap and can_swap(model, using):
+        return contextlib.nullcontext()
+    return transaction.atomic(using=using)
+
+
+def _temporary_name(name: str) -> str:
+    """
+    Name for the shadow's copy of an index or constraint, within the 63 characters Postgres keeps
+
+    :param name: live name
+    :return: shadow name
+    """
+    return f'{name[:63 - len(SHADOW_SUFFIX)]}{SHADOW_SUFFIX}'
+
+
+def _sqlstate(error: Exception) -> str | None:
+    """
+    SQLSTATE of the driver error Django wrapped
+
+    :param error: django.db error
+    :return: five character code, None if unknown
+    """
+    cause = error.__cause__
+    # psycopg 3, psycopg2
+    return getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+
+
+class ShadowTable:
+    """
+    Loads a model's table through a shadow copy:
+        with ShadowTable(LoTWUser) as shadow:
+            shadow.copy(['callsign', 'date_from'], rows)
+        # swapped in here, unless the block raised; then the shadow is dropped
+    The shadow starts without indexes, so COPY runs at full speed; they are built once the data is in.
+    It must be used outside any transaction: inside one, the lock taken by the swap and the dropped table
+    would be held until the caller commits.
+    """
+
+    def __init__(self, model: type[models.Model], using: str = 'default') -> None:
+        """
+        :param model: model class whose table is replaced
+        :param using: database alias
+        """
+        self.model = model
+        self.using = using
+        self.connection = connections[using]
+        self.table = model._meta.db_table
+        self.shadow = _temporary_name(self.table)
+        self.rows = 0
+
+    def __enter__(self) -> 'ShadowTable':
+        """
+        Creates the empty shadow: same columns, defaults, identity and check constraints, no indexes
+
+        :return: self
+        :raises TransactionManagementError: inside a transaction
+        """
+        if self.connection.in_atomic_block:
+            raise TransactionManagementError('Shadow tables are loaded and swapped outside any transaction')
+        quote = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            # Leftover of a crashed load
+            cursor.execute(f'DROP TABLE IF EXISTS {quote(self.shadow)}')
+            cursor.execute(f'CREATE TABLE {quote(self.shadow)} (LIKE {quote(self.table)} INCLUDING DEFAULTS '
+                           f'INCLUDING IDENTITY INCLUDING GENERATED INCLUDING CONSTRAINTS INCLUDING STORAGE)')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """
+        Swaps the shadow in, or drops it if we are leaving because of an error
+
+        :return:
+        """
+        if exc_type is None:
+            self.swap()
+        else:
+            self.drop()
+
+    def copy(self, fields: list, rows: Iterable[tuple]) -> int:
+        """
+        COPYs rows into the shadow; may be called several times
+
+        :param fields: field names, in the order of the values in each row
+        :param rows: iterable of tuples
+        :return: number of rows copied
+        """
+        count = copy_rows(self.model, fields, rows, table=self.shadow, using=self.using)
+        self.rows += count
+        return count
+
+    def drop(self) -> None:
+        """
+        Throws the shadow away
+
+        :return:
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.connection.ops.quote_name(self.shadow)}')
+
+    def _live_indexes(self, cursor) -> list:
+        """
+        Indexes of the live table, with the constraint (primary key, unique) they back if any
+
+        :param cursor: database cursor
+        :return: list of (index name, definition, constraint type or None)
+        """
+        cursor.execute(
+            'SELECT idx.relname, pg_get_indexdef(idx.oid), con.contype '
+            'FROM pg_index JOIN pg_class idx ON idx.oid = pg_index.indexrelid '
+            'LEFT JOIN pg_constraint con ON con.conindid = pg_index.indexrelid AND con.conrelid = pg_index.indrelid '
+            'WHERE pg_index.indrelid = %s::regclass', [self.table])
+        return cursor.fetchall()
+
+    def _build_indexes(self, cursor) -> list:
+        """
+        Recreates the live table's indexes, primary key, unique and foreign key constraints on the shadow
+
+        :param cursor: database cursor
+        :return: list of (INDEX or CONSTRAINT, shadow name, live name) to rename after the swap
+        """
+        quote = self.connection.ops.quote_name
+        renames = []
+        for name, definition, constraint_type in self._live_indexes(cursor):
+            match = INDEX_DEFINITION.match(definition)
+            if match is None:
+                raise ValueError(f'Cannot reproduce index {name}: {definition}')
+            temporary = _temporary_name(name)
+            cursor.execute(f'{match[1]}{quote(temporary)} ON {quote(self.shadow)} {match[4]}')
+            if constraint_type == 'p':
+                cursor.execute(f'ALTER TABLE {quote(self.shadow)} ADD CONSTRAINT {quote(temporary)} '
+                               f'PRIMARY KEY USING INDEX {quote(temporary)}')
+            elif constraint_type == 'u':
+                cursor.execute(f'ALTER TABLE {quote(self.shadow)} ADD CONSTRAINT {quote(temporary)} '
+                               f'UNIQUE USING INDEX {quote(temporary)}')
+            renames.append(('INDEX', temporary, name))
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE contype = 'f' AND conrelid = %s::regclass", [self.table])
+        for name, definition in cursor.fetchall():
+            temporary = _temporary_name(name)
+            cursor.execute(f'ALTER TABLE {quote(self.shadow)} ADD CONSTRAINT {quote(temporary)} {definition}')
+            renames.append(('CONSTRAINT', temporary, name))
+        return renames
+
+    def _identity_sequences(self, cursor, table: str) -> dict:
+        """
+        Sequences behind the identity columns of a table
+
+        :param cursor: database cursor
+        :param table: table name
+        :return: dict column: sequence name (schema qualified)
+        """
+        cursor.execute("SELECT attname, pg_get_serial_sequence(%s, attname) FROM pg_attribute "
+                       "WHERE attrelid = %s::regclass AND attidentity != '' AND NOT attisdropped", [table, table])
+        return dict(cursor.fetchall())
+
+    def swap(self) -> None:
+        """
+        Builds the indexes on the shadow, then, in one short transaction, replaces the live table with it:
+        drop the live table, rename the shadow and its indexes / sequences to the live names.
+        Waiting for the exclusive lock is limited to LOCK_TIMEOUT per attempt, so lookups queued behind
+        the swap are never stuck for long. Only that timeout is retried; on any other error,
+        or after LOCK_ATTEMPTS timeouts, the shadow is dropped and the error raised
+
+        :return:
+        """
+        quote = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            renames = self._build_indexes(cursor)
+            cursor.execute(f'ANALYZE {quote(self.shadow)}')
+            live_sequences = self._identity_sequences(cursor, self.table)
+            shadow_sequences = self._identity_sequences(cursor, self.shadow)
+            cursor.execute("SELECT current_setting('lock_timeout')")
+            lock_timeout = cursor.fetchone()[0]
+            for attempt in range(1, LOCK_ATTEMPTS + 1):
+                try:
+                    with transaction.atomic(using=self.using):
+                        cursor.execute("SELECT set_config('lock_timeout', %s, true)", [LOCK_TIMEOUT])
+                        cursor.execute(f'LOCK TABLE {quote(self.table)} IN ACCESS EXCLUSIVE MODE')
+                        cursor.execute(f'DROP TABLE {quote(self.table)}')
+                        cursor.execute(f'ALTER TABLE {quote(self.shadow)} RENAME TO {quote(self.table)}')
+                        for kind, temporary, name in renames:
+                            if kind == 'INDEX':
+                                cursor.execute(f'ALTER INDEX {quote(temporary)} RENAME TO {quote(name)}')
+                            else:
+                                cursor.execute(f'ALTER TABLE {quote(self.table)} RENAME CONSTRAINT '
+                                               f'{quote(temporary)} TO {quote(name)}')
+                        for column, sequence in shadow_sequences.items():
+                            if column in live_sequences:
+                                # Only the name is wanted: the schema prefix stays where it is
+                                live_name = live_sequences[column].rsplit('.', 1)[-1]
+                                cursor.execute(f'ALTER SEQUENCE {sequence} RENAME TO {live_name}')
+                        cursor.execute("SELECT set_config('lock_timeout', %s, true)", [lock_timeout])
+                    return
+                except OperationalError as error:
+                    # Lock timeout: readers held the table, try again
+                    if _sqlstate(error) != LOCK_NOT_AVAILABLE or attempt == LOCK_ATTEMPTS:
+                        self.drop()
+                        raise
+
+
+def replace_table(model: type[models.Model], fields: list, rows: Iterable[tuple], batch_size: int = BATCH_SIZE,
+                  use_copy: bool = False, swap: bool = False, using: str = 'default') -> int:
+    """
+    Replaces every row of a table: through a shadow table when swap is asked for and possible,
+    otherwise deleting the rows and bulk loading the new ones, in a transaction.
+    Swapping must be asked for outside any transaction
+
+    :param model: model class
+    :param fields: field names, in the order of the values in each row
+    :param rows: iterable of tuples
+    :param batch_size: rows per bulk_create
+    :param use_copy: use Postgres COPY when not swapping
+    :param swap: load a shadow table and rename it in place
+    :param using: database alias
+    :return: number of rows loaded
+    """
+    if swap and can_swap(model, using):
+        with ShadowTable(model, using) as shadow:
+            return shadow.copy(fields, rows)
+    with transaction.atomic(using=using):
+        model.objects.db_manager(using).all().delete()
+        return bulk_load(model, fields, rows, batch_size, use_copy, using)
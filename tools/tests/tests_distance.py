@@ -0,0 +1,74 @@
+# tools/tests/tests_distance
+#
+# Distances and bearings: the batch versions against the geographiclib reference
+#
+import numpy as np
+from django.test import SimpleTestCase
+
+from tools.distance import distance_azimuth, haversine_batch, station_distances, vincenty_batch
+from tools.locators import maidenhead_to_coordinates
+
+
+class Station:
+    """
+    Anything with latitude and longitude will do
+    """
+    latitude = 41.5
+    longitude = 2.0
+
+
+class DistanceTests(SimpleTestCase):
+
+    def setUp(self):
+        generator = np.random.default_rng(1)
+        self.latitudes = generator.uniform(-89, 89, 200)
+        self.longitudes = generator.uniform(-180, 180, 200)
+        reference = [distance_azimuth(Station.latitude, Station.longitude, latitude, longitude)
+                     for latitude, longitude in zip(self.latitudes, self.longitudes)]
+        self.distances = np.array([distance for distance, _azimuth in reference])
+        self.azimuths = np.array([azimuth for _distance, azimuth in reference])
+
+    def test_reference(self):
+        distance, azimuth = distance_azimuth(0, 0, 0, 1)
+        self.assertAlmostEqual(distance, 111.3195, places=4)
+        self.assertEqual(azimuth, 90)
+        distance, azimuth = distance_azimuth(0, 0, 1, 0)
+        self.assertAlmostEqual(distance, 110.5744, places=4)
+        self.assertEqual(azimuth, 0)
+
+    def test_vincenty_matches_reference(self):
+        distances, azimuths = vincenty_batch(Station.latitude, Station.longitude, self.latitudes, self.longitudes)
+        np.testing.assert_allclose(distances, self.distances, atol=1e-6)
+        np.testing.assert_allclose(azimuths, self.azimuths, atol=1e-6)
+
+    def test_haversine_within_half_percent(self):
+        distances, azimuths = haversine_batch(Station.latitude, Station.longitude, self.latitudes, self.longitudes)
+        np.testing.assert_allclose(distances, self.distances, rtol=0.005)
+        self.assertTrue(((azimuths >= 0) & (azimuths < 360)).all())
+
+    def test_same_point(self):
+        distances, _azimuths = vincenty_batch(41.5, 2.0, [41.5], [2.0])
+        self.assertEqual(distances[0], 0)
+
+    def test_nearly_antipodal_falls_back(self):
+        distances, azimuths = vincenty_batch(0, 0, [0.5], [179.7])
+        self.assertTrue(np.isfinite(distances).all() and np.isfinite(azimuths).all())
+        self.assertAlmostEqual(distances[0], distance_azimuth(0, 0, 0.5, 179.7)[0], delta=100)
+
+    def test_station_distances(self):
+        latitude, longitude = maidenhead_to_coordinates('JN11')
+        distances, azimuths = station_distances(Station(), locators=['JN11', 'ZZ99'])
+        expected_distance, expected_azimuth = distance_azimuth(Station.latitude, Station.longitude, latitude, longitude)
+        self.assertAlmostEqual(distances[0], expected_distance, places=6)
+        self.assertAlmostEqual(azimuths[0], expected_azimuth, places=6)
+        self.assertTrue(np.isnan(distances[1]))
+
+        distances, _azimuths = station_distances(Station(), latitudes=[latitude], longitudes=[longitude],
+                                                 method='haversine')
+        self.assertAlmostEqual(distances[0], expected_distance, delta=expected_distance * 0.005)
+
+    def test_station_distances_errors(self):
+        with self.assertRaises(ValueError):
+            station_distances(Station())
+        with self.assertRaises(ValueError):
+            station_distances(Station(), locators=['JN11'], method='flat')
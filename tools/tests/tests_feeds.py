@@ -0,0 +1,141 @@
+# tools/tests/tests_feeds
+#
+# FeedFetcher against a local HTTP server: conditional GETs, and the cache left alone when anything fails
+#
+import json
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.test import SimpleTestCase
+
+from tools.feeds import FeedFetcher
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.body with server.etag, answering 304 to a matching If-None-Match.
+    With server.truncate, announces the whole body and sends half of it
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.headers.append(self.headers)
+        if server.status != 200:
+            self.send_error(server.status)
+            return
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', server.etag)
+        self.send_header('Last-Modified', server.last_modified)
+        self.send_header('Content-Length', str(len(server.body)))
+        self.end_headers()
+        if server.truncate:
+            self.wfile.write(server.body[:len(server.body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FeedFetcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        self.serve(b'version 1', '"v1"')
+        self.server.headers = []
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/cty.xml.gz?api=secret'
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.fetcher = FeedFetcher(cache_dir, timeout=5)
+        self.path, self.meta_path = self.fetcher.paths(self.url, 'cty.xml.gz')
+
+    def serve(self, body: bytes, etag: str, truncate: bool = False, status: int = 200) -> None:
+        """
+        What the server answers from now on
+        """
+        self.server.body = body
+        self.server.etag = etag
+        self.server.last_modified = 'Wed, 01 May 2024 12:00:00 GMT'
+        self.server.truncate = truncate
+        self.server.status = status
+
+    def fetch(self, force: bool = False) -> tuple[bool, bytes]:
+        """
+        :return: (changed, content handed to the caller)
+        """
+        with self.fetcher.fetch(self.url, 'cty.xml.gz', force) as feed:
+            return feed.changed, feed.path.read_bytes()
+
+    def assertCached(self, body: bytes, etag: str) -> None:
+        self.assertEqual(self.path.read_bytes(), body)
+        self.assertEqual(json.loads(self.meta_path.read_text())['etag'], etag)
+        self.assertEqual(list(self.path.parent.glob('*.part')), [])
+
+    def test_download_then_not_modified(self):
+        self.assertEqual(self.fetch(), (True, b'version 1'))
+        self.assertCached(b'version 1', '"v1"')
+        self.assertEqual(json.loads(self.meta_path.read_text()),
+                         {'etag': '"v1"', 'last_modified': 'Wed, 01 May 2024 12:00:00 GMT'})
+        self.assertIsNone(self.server.headers[0].get('If-None-Match'))
+
+        self.assertEqual(self.fetch(), (False, b'version 1'))
+        self.assertEqual(self.server.headers[1]['If-None-Match'], '"v1"')
+        self.assertEqual(self.server.headers[1]['If-Modified-Since'], 'Wed, 01 May 2024 12:00:00 GMT')
+
+    def test_new_version(self):
+        self.fetch()
+        self.serve(b'version 2', '"v2"')
+        self.assertEqual(self.fetch(), (True, b'version 2'))
+        self.assertCached(b'version 2', '"v2"')
+
+    def test_failed_caller_keeps_old_validators(self):
+        self.fetch()
+        self.serve(b'version 2', '"v2"')
+        with self.assertRaises(ValueError):
+            with self.fetcher.fetch(self.url, 'cty.xml.gz') as feed:
+                self.assertTrue(feed.changed)
+                raise ValueError('cannot load')
+        self.assertCached(b'version 1', '"v1"')
+        # Still asks with the old validators, so the new version comes again
+        self.assertEqual(self.fetch(), (True, b'version 2'))
+        self.assertEqual(self.server.headers[-1]['If-None-Match'], '"v1"')
+
+    def test_truncated_download_keeps_cached_file(self):
+        self.fetch()
+        self.serve(b'version 2 is a lot longer', '"v2"', truncate=True)
+        with self.assertRaises(requests.RequestException):
+            self.fetch()
+        self.assertCached(b'version 1', '"v1"')
+
+    def test_server_error_keeps_cached_file(self):
+        self.fetch()
+        self.serve(b'', '"v2"', status=503)
+        with self.assertRaises(requests.HTTPError):
+            self.fetch()
+        self.assertCached(b'version 1', '"v1"')
+
+    def test_force_and_missing_file_download_again(self):
+        self.fetch()
+        self.assertEqual(self.fetch(force=True), (True, b'version 1'))
+        self.assertIsNone(self.server.headers[-1].get('If-None-Match'))
+        self.path.unlink()
+        self.assertEqual(self.fetch(), (True, b'version 1'))
+        self.assertIsNone(self.server.headers[-1].get('If-None-Match'))
+
+    def test_unnamed_feeds_keep_keys_out_of_file_names(self):
+        path, meta_path = self.fetcher.paths(self.url)
+        self.assertNotIn('secret', path.name)
+        self.assertEqual(meta_path.name, f'{path.name}.meta.json')
@@ -0,0 +1,107 @@
+# tools/tests/tests_locators
+#
+# Maidenhead locators: decoding, encoding, and the batch versions against the scalar ones
+#
+import numpy as np
+from django.test import SimpleTestCase
+
+from tools.locators import (cached_maidenhead_to_coordinates, coordinates_to_maidenhead,
+                            coordinates_to_maidenhead_batch, group_by_locator, maidenhead_to_coordinates,
+                            maidenhead_to_coordinates_batch, validate_locator)
+
+LOCATORS = ['JN11', 'JN11ck', 'jn11CK', 'JN11ck45', 'JN11ck45ab', 'AA00', 'RR99xx99xx', 'FN31pr', 'QF56od']
+
+
+class DecodeTests(SimpleTestCase):
+
+    def test_grid_centers(self):
+        self.assertEqual(maidenhead_to_coordinates('JN11'), (41.5, 3))
+        self.assertEqual(maidenhead_to_coordinates('JN11ck'), (41.4375, 2.208333))
+        self.assertEqual(maidenhead_to_coordinates('JN11ck45ab'), (41.43776, 2.200174))
+
+    def test_south_west_corner(self):
+        self.assertEqual(maidenhead_to_coordinates('JN11', grid_center=False), (41, 2))
+        self.assertEqual(maidenhead_to_coordinates('AA00AA', grid_center=False), (-90, -180))
+
+    def test_case_does_not_matter(self):
+        self.assertEqual(maidenhead_to_coordinates('jn11CK'), maidenhead_to_coordinates('JN11ck'))
+
+    def test_validation(self):
+        self.assertTrue(validate_locator('JN11ck45ab'))
+        self.assertFalse(validate_locator('JS11'))
+        self.assertFalse(validate_locator('JN11cz'))
+        with self.assertRaises(ValueError):
+            validate_locator('JN1')
+        with self.assertRaises(ValueError):
+            validate_locator('JN11ck45ab12')
+        with self.assertRaises(TypeError):
+            validate_locator(None)
+        with self.assertRaises(TypeError):
+            maidenhead_to_coordinates('ZZ11')
+
+    def test_cached_decoder(self):
+        self.assertEqual(cached_maidenhead_to_coordinates('FN31pr'), maidenhead_to_coordinates('FN31pr'))
+        with self.assertRaises(TypeError):
+            cached_maidenhead_to_coordinates('ZZ11')
+
+    def test_batch_matches_scalar(self):
+        for grid_center in (True, False):
+            latitudes, longitudes, valid = maidenhead_to_coordinates_batch(LOCATORS, grid_center)
+            self.assertTrue(valid.all())
+            for locator, latitude, longitude in zip(LOCATORS, latitudes, longitudes):
+                with self.subTest(locator=locator, grid_center=grid_center):
+                    self.assertEqual((latitude, longitude), maidenhead_to_coordinates(locator, grid_center))
+
+    def test_batch_invalid_rows(self):
+        latitudes, longitudes, valid = maidenhead_to_coordinates_batch(['JN11', 'ZZ11', 'JN1', '', 'JN11c'])
+        self.assertEqual(valid.tolist(), [True, False, False, False, False])
+        self.assertTrue(np.isnan(latitudes[1:]).all())
+        self.assertTrue(np.isnan(longitudes[1:]).all())
+
+    def test_batch_precision(self):
+        latitudes, longitudes, _valid = maidenhead_to_coordinates_batch(['JN11ck45ab'], precision=4)
+        self.assertEqual((latitudes[0], longitudes[0]), maidenhead_to_coordinates('JN11'))
+        with self.assertRaises(ValueError):
+            maidenhead_to_coordinates_batch(['JN11'], precision=5)
+
+
+class EncodeTests(SimpleTestCase):
+
+    def test_encode(self):
+        self.assertEqual(coordinates_to_maidenhead(41.4375, 2.208333), 'JN11ck')
+        self.assertEqual(coordinates_to_maidenhead(41.4375, 2.208333, 4), 'JN11')
+
+    def test_edges_belong_to_the_last_cell(self):
+        self.assertEqual(coordinates_to_maidenhead(90, 180, 10), 'RR99xx99xx')
+        self.assertEqual(coordinates_to_maidenhead(-90, -180, 4), 'AA00')
+
+    def test_round_trip(self):
+        for locator in LOCATORS:
+            with self.subTest(locator=locator):
+                latitude, longitude = maidenhead_to_coordinates(locator)
+                self.assertEqual(coordinates_to_maidenhead(latitude, longitude, len(locator)).upper(), locator.upper())
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            coordinates_to_maidenhead(41, 2, 5)
+        with self.assertRaises(ValueError):
+            coordinates_to_maidenhead(91, 2)
+
+    def test_batch_matches_scalar(self):
+        latitudes = [41.4375, -33.87, 90, -90, 0, 48.2]
+        longitudes = [2.208333, 151.21, 180, -180, 0, 16.37]
+        for length in (4, 6, 8, 10):
+            with self.subTest(length=length):
+                self.assertEqual(coordinates_to_maidenhead_batch(latitudes, longitudes, length).tolist(),
+                                 [coordinates_to_maidenhead(latitude, longitude, length)
+                                  for latitude, longitude in zip(latitudes, longitudes)])
+
+    def test_batch_invalid_rows(self):
+        self.assertEqual(coordinates_to_maidenhead_batch([41.4, np.nan, 95], [2.2, 2.2, 2.2], 4).tolist(),
+                         ['JN11', '', ''])
+
+    def test_group_by_locator(self):
+        locators, buckets, counts = group_by_locator([41.1, 41.2, 48.2], [2.1, 2.2, 16.3])
+        self.assertEqual(locators.tolist(), ['JN11', 'JN88'])
+        self.assertEqual(buckets.tolist(), [0, 0, 1])
+        self.assertEqual(counts.tolist(), [2, 1])
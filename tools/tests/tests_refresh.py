@@ -0,0 +1,87 @@
+# tools/tests/tests_refresh
+#
+# run_refreshes(): the lock keeping two refreshes apart, and one failing refresh leaving the others alone
+#
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from tools import refresh
+from tools.refresh import RefreshLocked, refresh_lock, run_refreshes
+
+
+class RefreshLockTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = Path(directory) / 'refresh.lock'
+
+    def test_second_run_is_refused(self):
+        with refresh_lock(self.path):
+            with self.assertRaisesMessage(RefreshLocked, str(self.path)):
+                with refresh_lock(self.path):
+                    pass
+        # Free again
+        with refresh_lock(self.path):
+            pass
+
+    def test_run_refreshes_is_refused(self):
+        refreshes = {'lotw': mock.Mock()}
+        with override_settings(FEED_CACHE_DIR=self.path.parent), mock.patch.dict(refresh.REFRESHES, refreshes, clear=True):
+            with refresh_lock():
+                with self.assertRaises(RefreshLocked):
+                    run_refreshes()
+            self.assertEqual(refreshes['lotw'].call_count, 0)
+            run_refreshes()
+        self.assertEqual(refreshes['lotw'].call_count, 1)
+
+
+class RunRefreshesTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(FEED_CACHE_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.threads = set()
+
+        def failing(stats, force, options):
+            self.threads.add(threading.current_thread().name)
+            raise ValueError('feed is empty')
+
+        def working(stats, force, options):
+            self.threads.add(threading.current_thread().name)
+            stats.rows = options['batch_size']
+
+        patcher = mock.patch.dict(refresh.REFRESHES, {'clublog': working, 'lotw': failing, 'eqsl': working},
+                                  clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertIsolated(self, results: list) -> None:
+        self.assertEqual([stats.name for stats in results], ['clublog', 'lotw', 'eqsl'])
+        self.assertEqual([stats.error for stats in results], [None, 'ValueError: feed is empty', None])
+        self.assertEqual([stats.rows for stats in results], [10, 0, 10])
+        self.assertTrue(all(stats.finished for stats in results))
+        self.assertIn('failed after', str(results[1]))
+
+    def test_serial(self):
+        self.assertIsolated(run_refreshes(batch_size=10))
+        self.assertEqual(self.threads, {threading.current_thread().name})
+
+    def test_concurrent(self):
+        with mock.patch.object(refresh, 'connection', mock.Mock(vendor='postgresql')), \
+                mock.patch.object(refresh.connections, 'close_all') as close_all:
+            self.assertIsolated(run_refreshes(batch_size=10))
+        self.assertTrue(all(name.startswith('refresh') for name in self.threads))
+        self.assertEqual(close_all.call_count, 3)
+
+    def test_sqlite_runs_one_after_another(self):
+        self.assertIsolated(run_refreshes(concurrent=True, batch_size=10))
+        self.assertEqual(self.threads, {threading.current_thread().name})
@@ -0,0 +1,51 @@
+# tools/tests/tests_stats
+#
+# RefreshStats: phases timed apart, and how the figures are reported
+#
+import io
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tools import stats as stats_module
+from tools.stats import RefreshStats
+
+
+class RefreshStatsTests(SimpleTestCase):
+
+    def test_nested_phases_are_not_counted_twice(self):
+        stats = RefreshStats('clublog')
+
+        def parsed():
+            for item in range(3):
+                time.sleep(0.01)
+                yield item
+
+        with stats.phase('db', excluding=('parse',)):
+            for _item in stats.timed(parsed(), 'parse'):
+                pass
+        self.assertGreaterEqual(stats.phases['parse'], 0.03)
+        self.assertLess(stats.phases['db'], 0.03)
+
+    def test_reader(self):
+        stats = RefreshStats('clublog')
+        self.assertEqual(stats.reader(io.BytesIO(b'cty'), 'decompress').read(), b'cty')
+        self.assertIn('decompress', stats.phases)
+
+    def test_process_peak_is_labelled_as_such(self):
+        stats = RefreshStats('lotw')
+        stats.rows = 3
+        stats.add('download', 1.5)
+        with mock.patch.object(stats_module, 'peak_rss_mb', return_value=95.23):
+            stats.finish()
+        self.assertRegex(str(stats), r'^lotw: 3 rows in [\d.]+s \(download 1\.500s\), process peak RSS 95\.2 MB$')
+        self.assertEqual(stats.as_dict()['process_peak_rss_mb'], 95.2)
+        self.assertNotIn('peak_rss_mb', stats.as_dict())
+
+    def test_skipped_and_failed(self):
+        stats = RefreshStats('eqsl')
+        stats.skipped = True
+        self.assertIn('eqsl: unchanged, skipped in', str(stats.finish()))
+        stats.error = 'ValueError: boom'
+        self.assertIn('failed after', str(stats))
@@ -0,0 +1,175 @@
+# tools/tests/tests_tableswap
+#
+# Shadow table loads: the swap's retries, the fallback to an in-place replace, and (on Postgres) the whole cycle
+#
+import datetime
+import unittest
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+
+from my_station.models import MyStation
+from qsling.models import LoTWUser
+from tools import tableswap
+from tools.tableswap import ShadowTable, can_swap, load_transaction, replace_table
+
+UTC = datetime.timezone.utc
+ROWS = [('EA3IEG', datetime.datetime(2024, 5, 1, tzinfo=UTC)), ('K1ABC', datetime.datetime(2023, 1, 2, tzinfo=UTC))]
+
+
+class DriverError(Exception):
+    """
+    What psycopg raises, with its SQLSTATE
+    """
+
+    def __init__(self, sqlstate: str | None) -> None:
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+
+def database_error(sqlstate: str | None) -> OperationalError:
+    """
+    :return: OperationalError as Django raises it, the driver's error as its cause
+    """
+    error = OperationalError('canceling statement')
+    error.__cause__ = DriverError(sqlstate)
+    return error
+
+
+class FakeCursor:
+    """
+    Records the statements; LOCK TABLE raises the given errors, one per attempt
+    """
+
+    def __init__(self, lock_errors: list) -> None:
+        self.lock_errors = lock_errors
+        self.executed = []
+
+    def __enter__(self) -> 'FakeCursor':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def execute(self, sql: str, params: list = None) -> None:
+        self.executed.append(sql)
+        if sql.startswith('LOCK TABLE') and self.lock_errors:
+            raise self.lock_errors.pop(0)
+
+    def fetchone(self) -> tuple:
+        return ('0',)
+
+    def fetchall(self) -> list:
+        return []
+
+
+class SwapRetryTests(TestCase):
+
+    def swap(self, *lock_errors: Exception) -> FakeCursor:
+        """
+        Runs ShadowTable.swap() against a cursor whose LOCK TABLE fails with lock_errors
+        """
+        cursor = FakeCursor(list(lock_errors))
+        shadow = ShadowTable(LoTWUser)
+        shadow.connection = mock.Mock(cursor=mock.Mock(return_value=cursor), ops=connection.ops)
+        shadow.swap()
+        return cursor
+
+    def statements(self, cursor: FakeCursor, start: str) -> list:
+        """
+        :return: the statements run, starting with start
+        """
+        return [sql for sql in cursor.executed if sql.startswith(start)]
+
+    def test_lock_timeouts_are_retried(self):
+        cursor = self.swap(database_error('55P03'), database_error('55P03'))
+        self.assertEqual(len(self.statements(cursor, 'LOCK TABLE')), 3)
+        self.assertEqual(self.statements(cursor, 'ALTER TABLE "qsling_lotwuser__shadow" RENAME'),
+                         ['ALTER TABLE "qsling_lotwuser__shadow" RENAME TO "qsling_lotwuser"'])
+
+    def test_other_errors_are_not(self):
+        for sqlstate in ('57014', '40P01', None):
+            with self.subTest(sqlstate=sqlstate), self.assertRaises(OperationalError):
+                self.swap(database_error(sqlstate))
+        cursor = FakeCursor([database_error('53300'), database_error('55P03')])
+        shadow = ShadowTable(LoTWUser)
+        shadow.connection = mock.Mock(cursor=mock.Mock(return_value=cursor), ops=connection.ops)
+        with self.assertRaises(OperationalError):
+            shadow.swap()
+        self.assertEqual(len(self.statements(cursor, 'LOCK TABLE')), 1)
+        self.assertEqual(cursor.executed[-1], 'DROP TABLE IF EXISTS "qsling_lotwuser__shadow"')
+
+    def test_gives_up_after_the_attempts(self):
+        with self.assertRaises(OperationalError):
+            self.swap(*(database_error('55P03') for _attempt in range(tableswap.LOCK_ATTEMPTS)))
+
+    def test_shadow_name_fits_postgres(self):
+        with mock.patch.object(LoTWUser._meta, 'db_table', 'x' * 70):
+            self.assertEqual(ShadowTable(LoTWUser).shadow, 'x' * 55 + '__shadow')
+
+
+class FallbackTests(TestCase):
+
+    def test_replace_without_swap_support(self):
+        # Only Postgres tables can be swapped
+        self.assertFalse(can_swap(LoTWUser))
+        self.assertIsInstance(load_transaction(LoTWUser, swap=True), type(load_transaction(LoTWUser, swap=False)))
+        LoTWUser.objects.create(callsign='N0CALL', date_from=datetime.datetime(2020, 1, 1, tzinfo=UTC))
+        with mock.patch.object(tableswap, 'ShadowTable') as shadow_table:
+            self.assertEqual(replace_table(LoTWUser, ['callsign', 'date_from'], iter(ROWS), batch_size=1, swap=True), 2)
+        shadow_table.assert_not_called()
+        self.assertEqual(sorted(LoTWUser.objects.values_list('callsign', flat=True)), ['EA3IEG', 'K1ABC'])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'shadow tables are swapped on Postgres only')
+class PostgresSwapTests(TransactionTestCase):
+
+    def indexes(self, table: str) -> dict:
+        """
+        :return: index name: definition, with the table name taken out
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s', [table])
+            return {name: definition.replace(table, 'TABLE') for name, definition in cursor.fetchall()}
+
+    def test_create_copy_index_swap(self):
+        table = LoTWUser._meta.db_table
+        before = self.indexes(table)
+        LoTWUser.objects.create(callsign='N0CALL', date_from=datetime.datetime(2020, 1, 1, tzinfo=UTC))
+        with ShadowTable(LoTWUser) as shadow:
+            # Same columns, no indexes until the data is in
+            self.assertEqual(self.indexes(shadow.shadow), {})
+            self.assertEqual(shadow.copy(['callsign', 'date_from'], iter(ROWS)), 2)
+            self.assertEqual(LoTWUser.objects.count(), 1)
+        self.assertEqual(self.indexes(table), before)
+        self.assertEqual(self.indexes(shadow.shadow), {})
+        self.assertEqual(sorted(LoTWUser.objects.values_list('callsign', flat=True)), ['EA3IEG', 'K1ABC'])
+        # The identity sequence came along
+        LoTWUser.objects.create(callsign='DL1A', date_from=datetime.datetime(2024, 1, 1, tzinfo=UTC))
+        self.assertEqual(LoTWUser.objects.count(), 3)
+
+    def test_error_drops_the_shadow(self):
+        with self.assertRaises(ValueError):
+            with ShadowTable(LoTWUser) as shadow:
+                shadow.copy(['callsign', 'date_from'], iter(ROWS))
+                raise ValueError('bad feed')
+        self.assertEqual(LoTWUser.objects.count(), 0)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [shadow.shadow])
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_refused_when_referenced(self):
+        # adif.QSO has a foreign key to the stations
+        self.assertFalse(can_swap(MyStation))
+        self.assertTrue(can_swap(LoTWUser))
+        with mock.patch.object(tableswap, 'ShadowTable') as shadow_table:
+            replace_table(LoTWUser, ['callsign', 'date_from'], iter(ROWS), swap=True)
+            shadow_table.assert_called_once()
+        MyStation.objects.create(description='Home', callsign='EA3IEG', name='Station', locator='JN11ck',
+                                 country='Spain')
+        with mock.patch.object(tableswap, 'ShadowTable') as shadow_table:
+            replace_table(MyStation, ['description', 'callsign', 'name', 'locator', 'country'],
+                          [('Portable', 'EA3IEG/P', 'Station', 'JN11ck', 'Spain')], swap=True)
+        shadow_table.assert_not_called()
+        self.assertEqual(list(MyStation.objects.values_list('callsign', flat=True)), ['EA3IEG/P'])
@@ -0,0 +1,98 @@
+# tools/versions
+#
+# Versions of the reference data (ClubLog, LoTW, eQSL), shared by every process using the same feed cache.
+# A refresh bumps its version once committed; processes keeping the tables in memory (the resolver,
+# the membership index) compare versions and reload when another process refreshed them
+#
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# Seconds between two looks at the version files
+CHECK_INTERVAL = 1.0
+
+
+def version_path(name: str) -> Path:
+    """
+    :param name: feed name, key of tools.refresh.REFRESHES
+    :return: version file in FEED_CACHE_DIR
+    """
+    return Path(settings.FEED_CACHE_DIR) / f'{name}.version'
+
+
+def bump_version(name: str) -> None:
+    """
+    Records that the feed's tables changed; written atomically, readers never see half of it
+
+    :param name: feed name
+    :return:
+    """
+    path = version_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.part')
+    partial.write_text(str(time.time_ns()), encoding='ascii')
+    os.replace(partial, path)
+
+
+def read_version(name: str) -> str:
+    """
+    :param name: feed name
+    :return: current version, '' if the feed was never refreshed
+    """
+    try:
+        return version_path(name).read_text(encoding='ascii')
+    except FileNotFoundError:
+        return ''
+
+
+class VersionWatch:
+    """
+    Tells which feeds changed since the data in memory was loaded, looking at the files at most every interval
+    """
+
+    def __init__(self, *names: str, interval: float = CHECK_INTERVAL) -> None:
+        """
+        :param names: feeds the data comes from
+        :param interval: seconds between looks at the files
+        """
+        self.names = names
+        self.interval = interval
+        self.loaded = {}
+        self.next_check = 0.0
+        self.lock = threading.Lock()
+
+    def mark(self, *names: str) -> None:
+        """
+        Call before loading the feeds: what is read afterwards is at least that recent
+
+        :param names: feeds about to be loaded, defaults to all of them
+        :return:
+        """
+        with self.lock:
+            for name in names or self.names:
+                self.loaded[name] = read_version(name)
+
+    def changed(self) -> set:
+        """
+        Feeds refreshed since they were loaded. They count as loaded again once returned,
+        so of several threads asking at once only one reloads
+
+        :return: set of feed names, empty until the next look is due
+        """
+        now = time.monotonic()
+        if now < self.next_check:
+            return set()
+        with self.lock:
+            if now < self.next_check:
+                return set()
+            self.next_check = now + self.interval
+            changed = set()
+            for name in self.names:
+                version = read_version(name)
+                if version != self.loaded.get(name, version):
+                    changed.add(name)
+                self.loaded[name] = version
+            return changed